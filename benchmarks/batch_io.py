@@ -0,0 +1,87 @@
+"""
+Datagram I/O cost: one system call per datagram versus sendmmsg/recvmmsg
+
+Sends bursts of PUBLISH datagrams over loopback UDP, one send per datagram
+or with send_many, and reads them back with one recvfrom per datagram or
+with recv_many.
+
+    PYTHONPATH=src python benchmarks/batch_io.py
+"""
+
+import socket
+import time
+
+from mqttsn.lib.publishes import Publishes
+from mqttsn.transport import SocketTransport, udp
+
+
+def pair(batch):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    receiver.bind(('127.0.0.1', 0))
+    sender = udp(*receiver.getsockname())
+    receiver.connect(sender.local_address)
+    return sender, SocketTransport(receiver, batch)
+
+
+def send_loop(transport, packets):
+    for packet in packets:
+        transport.send(packet)
+
+
+def send_many(transport, packets):
+    transport.send_many(packets)
+
+
+def run_send(send, packets, rounds=200):
+    sender, receiver = pair(0)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        send(sender, packets)
+    elapsed = time.perf_counter() - started
+    sender.close()
+    receiver.close()
+    return rounds * len(packets) / elapsed
+
+
+def recvfrom_loop(transport, count):
+    for _ in range(count):
+        transport.recvfrom(65535)
+
+
+def recv_many(transport, count):
+    while count > 0:
+        count -= len(transport.recv_many())
+
+
+def run_recv(recv, packets, rounds=200):
+    sender, receiver = pair(len(packets))
+    elapsed = 0
+    for _ in range(rounds):
+        sender.send_many(packets)
+        started = time.perf_counter()
+        recv(receiver, len(packets))
+        elapsed += time.perf_counter() - started
+    sender.close()
+    receiver.close()
+    return rounds * len(packets) / elapsed
+
+
+def main(burst=256):
+    publish = Publishes()
+    publish.flags.qos = 0
+    publish.topic_id = 1
+    publish.data = b'x' * 32
+    packets = [publish.pack()] * burst
+
+    # best of a few runs, as other processes of the host add noise
+    for send in [send_loop, send_many]:
+        rate = max(run_send(send, packets) for _ in range(3))
+        print(f'{send.__name__:14} {rate:10.0f} datagrams/s')
+    for recv in [recvfrom_loop, recv_many]:
+        rate = max(run_recv(recv, packets) for _ in range(3))
+        print(f'{recv.__name__:14} {rate:10.0f} datagrams/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Readings published from NumPy columns versus one publish per reading
+
+The readings are a topic id, a float32 value and a uint64 timestamp each.
+QoS 0 readings are sent over UDP to a socket nobody reads, so the numbers
+are the sending rate; QoS 1 readings go to the in-process gateway of
+loopback.py and are counted once acknowledged.
+
+    PYTHONPATH=src python benchmarks/columns.py
+"""
+
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from loopback import Gateway
+from mqttsn.client import Client, Callback
+from mqttsn.transport import LoopbackTransport, udp
+
+LAYOUT = np.dtype([('value', '>f4'), ('timestamp', '>u8')])
+READING = struct.Struct('>fQ')
+
+
+class Acks(Callback):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+        self.lock = threading.Condition()
+
+    def published(self, msg_id):
+        with self.lock:
+            self.count += 1
+            self.lock.notify()
+
+
+def readings(count):
+    return (
+        np.arange(count) % 300 + 1,
+        np.random.default_rng(1).random(count, dtype=np.float32),
+        np.arange(count, dtype=np.uint64) + time.time_ns(),
+    )
+
+
+def one_by_one(client, topic_ids, values, timestamps, qos):
+    for topic_id, value, timestamp in zip(
+            topic_ids.tolist(), values.tolist(), timestamps.tolist()):
+        client.publish(topic_id, READING.pack(value, timestamp), qos=qos)
+
+
+def many(client, topic_ids, values, timestamps, qos):
+    client.publish_many(zip(topic_ids.tolist(), map(
+        READING.pack, values.tolist(), timestamps.tolist()
+    )), qos=qos)
+
+
+def columns(client, topic_ids, values, timestamps, qos):
+    client.publish_columns(
+        topic_ids, LAYOUT, {'value': values, 'timestamp': timestamps},
+        qos=qos
+    )
+
+
+def run(publish, qos, count):
+    topic_ids, values, timestamps = readings(count)
+    if qos == 0:
+        sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sink.bind(('127.0.0.1', 0))
+        transport = udp(*sink.getsockname())
+        client = Client('bench', transport=transport)
+        client.start_receiver()
+    else:
+        client_end, gateway_end = LoopbackTransport.pair(capacity=1 << 16)
+        Gateway(gateway_end)
+        client = Client('bench', transport=client_end, window=256)
+        acks = Acks()
+        client.register_callback(acks)
+        client.connect()
+
+    started = time.perf_counter()
+    publish(client, topic_ids, values, timestamps, qos)
+    if qos:
+        with acks.lock:
+            acks.lock.wait_for(lambda: acks.count == count, 60)
+    elapsed = time.perf_counter() - started
+
+    if qos:
+        client.disconnect()
+    client.stop()
+    if qos == 0:
+        sink.close()
+    else:
+        gateway_end.close()
+    return count / elapsed
+
+
+def main(count=100000):
+    for qos in [0, 1]:
+        for publish in [one_by_one, many, columns]:
+            rate = run(publish, qos, count)
+            print(f'qos {qos} {publish.__name__:10} {rate:10.0f} readings/s')
+
+
+if __name__ == '__main__':
+    main()
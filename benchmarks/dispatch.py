@@ -0,0 +1,81 @@
+"""
+Per packet dispatch cost of the packet registry
+
+Compares mqttsn.lib.objects.decode with the previous dispatch, which
+built the packet class list through get_objects() and read the message
+type three times for every datagram.
+
+    PYTHONPATH=src python benchmarks/dispatch.py
+"""
+
+import timeit
+
+from mqttsn.lib.helpers import message_type
+from mqttsn.lib.objects import decode
+from mqttsn.lib.publishes import Publishes, Pubacks
+
+
+def legacy_get_objects():
+    from mqttsn.lib.advertises import Advertises
+    from mqttsn.lib.connects import Connects, Connacks
+    from mqttsn.lib.gw import SearchGWs, GWInfos
+    from mqttsn.lib.registers import Registers, Regacks
+    from mqttsn.lib.publishes import (
+        Publishes, Pubcomps, Pubacks, Pubrecs, Pubrels
+    )
+    from mqttsn.lib.subscribes import Subacks, Subscribes
+    from mqttsn.lib.unsubscribes import Unsubacks, Unsubscribes
+    from mqttsn.lib.ping import Pingresps, Pingreqs
+    from mqttsn.lib.disconnects import Disconnects
+    from mqttsn.lib.will import (
+        WillMsgs, WillTopics, WillTopicReqs, WillMsgReqs, WillTopicUpds,
+        WillTopicResps, WillMsgUpds, WillMsgResps
+    )
+
+    return [
+        Advertises, SearchGWs, GWInfos, None,
+        Connects, Connacks,
+        WillTopicReqs, WillTopics, WillMsgReqs, WillMsgs,
+        Registers, Regacks,
+        Publishes, Pubacks, Pubcomps, Pubrecs, Pubrels, None,
+        Subscribes, Subacks, Unsubscribes, Unsubacks,
+        Pingreqs, Pingresps, Disconnects, None,
+        WillTopicUpds, WillTopicResps, WillMsgUpds, WillMsgResps
+    ]
+
+
+def legacy_decode(buffer):
+    if message_type(buffer) is not None:
+        packet = legacy_get_objects()[message_type(buffer)]()
+        packet.unpack(memoryview(buffer))
+    return packet
+
+
+def lookup_only(buffer):
+    return legacy_get_objects()[message_type(buffer)]
+
+
+def main(number=200000):
+    publish = Publishes()
+    publish.flags.qos = 1
+    publish.topic_id = 1
+    publish.msg_id = 1
+    publish.data = b'0123456789'
+    puback = Pubacks()
+    puback.msg_id = 1
+    packets = [publish.pack(), puback.pack()]
+
+    for packet in packets:
+        name = type(decode(packet)).__name__
+        legacy = timeit.timeit(lambda: legacy_decode(packet), number=number)
+        current = timeit.timeit(lambda: decode(packet), number=number)
+        print(f'{name:10} legacy {legacy / number * 1e9:8.0f} ns/packet  '
+              f'registry {current / number * 1e9:8.0f} ns/packet')
+
+    legacy = timeit.timeit(lambda: lookup_only(packets[0]), number=number)
+    print(f'{"dispatch":10} legacy {legacy / number * 1e9:8.0f} ns/packet '
+          f'spent in get_objects() and message_type() alone')
+
+
+if __name__ == '__main__':
+    main()
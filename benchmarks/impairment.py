@@ -0,0 +1,128 @@
+"""
+Delivered throughput and latency of publishes over impaired links
+
+The Client talks to the in-process gateway of loopback.py through an
+ImpairedTransport applying the same seeded profile in both directions.
+For each profile and QoS it reports the messages delivered per second and
+the p50/p99 latency: one way to the gateway for QoS 0, and from publish
+to PUBACK or PUBCOMP for QoS 1 and 2.
+
+    PYTHONPATH=src python benchmarks/impairment.py
+"""
+
+import logging
+import threading
+import time
+
+from loopback import Gateway
+from mqttsn.client import Client, Callback
+from mqttsn.lib.names import PUBLISH
+from mqttsn.transport import Impairment, ImpairedTransport, LoopbackTransport
+
+PROFILES = {
+    'clean': {},
+    'lan': dict(latency=0.002, jitter=0.001),
+    'lossy': dict(loss=0.05, latency=0.02, jitter=0.005),
+    'radio': dict(
+        loss=0.02, duplicate=0.01, reorder=0.01, latency=0.1, jitter=0.03,
+        distribution='normal', bandwidth=20000
+    ),
+}
+
+
+class TimedGateway(Gateway):
+    def __init__(self, transport):
+        self.arrivals = {}  # payload -> first arrival
+        super().__init__(transport)
+
+    def respond(self, packet):
+        if packet.mh.msg_type == PUBLISH:
+            self.arrivals.setdefault(packet.data, time.monotonic())
+        return super().respond(packet)
+
+
+class Completions(Callback):
+    def __init__(self):
+        super().__init__()
+        self.completed = {}
+        self.failed = set()
+        self.event = threading.Condition()
+
+    def published(self, msg_id):
+        with self.event:
+            self.completed[msg_id] = time.monotonic()
+            self.event.notify()
+
+    def delivery_failed(self, msg_id):
+        with self.event:
+            self.failed.add(msg_id)
+            self.event.notify()
+
+
+def percentile(samples, p):
+    if not samples:
+        return float('nan')
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def run(profile, qos, count, seed=1):
+    client_end, gateway_end = LoopbackTransport.pair()
+    transport = ImpairedTransport(
+        client_end, Impairment(seed=seed, **profile),
+        Impairment(seed=seed + 1, **profile)
+    )
+    gateway = TimedGateway(gateway_end)
+    callback = Completions()
+    client = Client(
+        'bench', transport=transport, window=32, retry_interval=0.5,
+        max_retries=5, timeout=2.0
+    )
+    client.register_callback(callback)
+    client.connect()
+
+    sent = {}  # msg_id or payload -> publish time
+    started = time.monotonic()
+    for i in range(count):
+        payload = b'%08d' % i
+        now = time.monotonic()
+        msg_id, = client.publish_many([(1, payload)], qos=qos)
+        sent[msg_id if qos else payload] = now
+
+    if qos:
+        with callback.event:
+            callback.event.wait_for(
+                lambda: count <= len(callback.completed) + len(callback.failed),
+                60
+            )
+        done = callback.completed
+    else:
+        # until the datagrams still on the link arrived
+        arrived = -1
+        while arrived != len(gateway.arrivals):
+            arrived = len(gateway.arrivals)
+            time.sleep(0.5)
+        done = gateway.arrivals
+    elapsed = max(done.values(), default=started) - started
+    latencies = [done[key] - sent[key] for key in done if key in sent]
+
+    client.stop()
+    gateway_end.close()
+    return len(done) / elapsed if elapsed else 0.0, latencies
+
+
+def main(count=1000):
+    # duplicate and late acks are logged, and so is closing the transport
+    # under the receiver thread
+    logging.disable(logging.ERROR)
+    print(f'{"profile":8} qos {"msg/s":>9} {"p50 ms":>8} {"p99 ms":>8}')
+    for name, profile in PROFILES.items():
+        for qos in [0, 1, 2]:
+            throughput, latencies = run(profile, qos, count)
+            print(f'{name:8} {qos:3} {throughput:9.0f} '
+                  f'{percentile(latencies, 50) * 1e3:8.1f} '
+                  f'{percentile(latencies, 99) * 1e3:8.1f}')
+
+
+if __name__ == '__main__':
+    main()
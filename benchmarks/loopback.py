@@ -0,0 +1,118 @@
+"""
+Client throughput over an in-memory loopback transport
+
+A minimal gateway runs in a thread on one end of a LoopbackTransport pair
+and the Client on the other, so the numbers measure the protocol stack
+alone, without the kernel network stack.
+
+    PYTHONPATH=src python benchmarks/loopback.py
+"""
+
+import threading
+import time
+
+from mqttsn.client import Client, Callback
+from mqttsn.lib.connects import Connacks
+from mqttsn.lib.disconnects import Disconnects
+from mqttsn.lib.names import (
+    CONNECT, DISCONNECT, PUBLISH, PUBREL, REGISTER, SUBSCRIBE
+)
+from mqttsn.lib.objects import decode
+from mqttsn.lib.publishes import Pubacks, Pubrecs, Pubcomps
+from mqttsn.lib.registers import Regacks
+from mqttsn.lib.subscribes import Subacks
+from mqttsn.transport import LoopbackTransport
+
+
+class Gateway:
+    """
+    Acknowledges what the client sends, enough to benchmark publishing
+    """
+    def __init__(self, transport):
+        self.transport = transport
+        self.topics = {}
+        self.published = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            while True:
+                for datagram, _ in self.transport.recv_many():
+                    for response in self.respond(decode(datagram)):
+                        self.transport.send(response.pack())
+        except OSError:
+            pass  # closed
+
+    def respond(self, packet):
+        msg_type = packet.mh.msg_type
+        if msg_type == CONNECT:
+            return [Connacks()]
+        if msg_type == DISCONNECT:
+            return [Disconnects()]
+        if msg_type in [SUBSCRIBE, REGISTER]:
+            ack = Subacks() if msg_type == SUBSCRIBE else Regacks()
+            ack.msg_id = packet.msg_id
+            ack.topic_id = self.topics.setdefault(
+                bytes(packet.topic_name), len(self.topics) + 1
+            )
+            return [ack]
+        if msg_type == PUBLISH:
+            self.published += 1
+            if packet.flags.qos == 1:
+                ack = Pubacks()
+            elif packet.flags.qos == 2:
+                ack = Pubrecs()
+            else:
+                return []
+            ack.msg_id = packet.msg_id
+            return [ack]
+        if msg_type == PUBREL:
+            ack = Pubcomps()
+            ack.msg_id = packet.msg_id
+            return [ack]
+        return []
+
+
+class Counter(Callback):
+    def __init__(self):
+        super().__init__()
+        self.done = threading.Semaphore(0)
+
+    def published(self, msg_id):
+        self.done.release()
+
+
+def run(qos, count=20000, payload=b'x' * 32):
+    client_end, gateway_end = LoopbackTransport.pair()
+    gateway = Gateway(gateway_end)
+    callback = Counter()
+    client = Client('bench', transport=client_end, window=256)
+    client.register_callback(callback)
+    client.connect()
+
+    started = time.perf_counter()
+    client.publish_many([(1, payload)] * count, qos=qos)
+    if qos > 0:
+        for _ in range(count):
+            callback.done.acquire()
+    else:
+        # qos 0 messages overflowing the gateway queue are dropped
+        while gateway.published + gateway_end.dropped < count:
+            time.sleep(0.001)
+    elapsed = time.perf_counter() - started
+
+    client.disconnect()
+    client.stop()
+    gateway_end.close()
+    return gateway.published / elapsed, gateway_end.dropped
+
+
+def main():
+    for qos in [0, 1, 2]:
+        throughput, dropped = run(qos)
+        print(f'qos {qos}: {throughput:10.0f} msg/s, {dropped} dropped')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Receive path cost: recvfrom versus recvfrom_into a preallocated buffer
+
+Sends bursts of PUBLISH datagrams over a local datagram socket pair and
+reads them back through Receivers.read, with and without recv_into.
+
+    PYTHONPATH=src python benchmarks/receive.py
+"""
+
+import socket
+import time
+
+from mqttsn.internal import Receivers
+from mqttsn.lib.publishes import Publishes
+from mqttsn.transport import SocketTransport
+
+
+def run(recv_into, packet, bursts=2000, burst=100):
+    sender, receiver = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    receivers = Receivers(SocketTransport(receiver), recv_into=recv_into)
+    elapsed = 0
+    for _ in range(bursts):
+        for _ in range(burst):
+            sender.send(packet)
+        started = time.perf_counter()
+        for _ in range(burst):
+            receivers.read()
+        elapsed += time.perf_counter() - started
+    sender.close()
+    receiver.close()
+    return elapsed / (bursts * burst)
+
+
+def main():
+    publish = Publishes()
+    publish.flags.qos = 0
+    publish.topic_id = 1
+    publish.data = b'x' * 64
+    packet = publish.pack()
+
+    for name, recv_into in [('recvfrom', False), ('recv_into', True)]:
+        per_packet = run(recv_into, packet)
+        print(f'{name:10} {per_packet * 1e9:8.0f} ns/packet')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Unix domain datagram sockets versus UDP on loopback
+
+For each transport, an echo thread plays the gateway. Round trips of a
+PUBLISH give the latency, and a one way stream of PUBLISHes gives the
+packets/s received and decoded; UDP may drop some of them, Unix domain
+sockets block the sender instead.
+
+    PYTHONPATH=src python benchmarks/unix.py
+"""
+
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from mqttsn.lib.objects import decode
+from mqttsn.lib.publishes import Publishes
+from mqttsn.transport import udp, unix
+
+
+def echo(sock):
+    """
+    Return every datagram to its sender until the stream starts, then
+    count the datagrams of the stream
+    """
+    while True:
+        data, address = sock.recvfrom(65535)
+        if data == b'stream':
+            break
+        sock.sendto(data, address)
+    received = 0
+    while True:
+        data, address = sock.recvfrom(65535)
+        if data == b'end':
+            sock.sendto(b'%d' % received, address)
+        elif data == b'exit':
+            return
+        else:
+            decode(data)
+            received += 1
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def measure(transport, server, packet, round_trips, count, burst=32):
+    thread = threading.Thread(target=echo, args=(server,), daemon=True)
+    thread.start()
+
+    latencies = []
+    for _ in range(round_trips):
+        started = time.perf_counter()
+        transport.send(packet)
+        decode(transport.recvfrom(65535)[0])
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    transport.send(b'stream')
+    started = time.perf_counter()
+    for sent in range(0, count, burst):
+        transport.send_many([packet] * min(burst, count - sent))
+        time.sleep(0)  # let the receiving thread run
+    transport.settimeout(0.5)
+    while True:
+        transport.send(b'end')  # which UDP could drop too
+        try:
+            received = int(transport.recvfrom(65535)[0])
+            break
+        except socket.timeout:
+            pass
+    rate = received / (time.perf_counter() - started)
+
+    transport.send(b'exit')
+    thread.join(1)
+    return rate, percentile(latencies, 50), percentile(latencies, 99)
+
+
+def main(round_trips=20000, count=200000):
+    publish = Publishes()
+    publish.topic_id = 1
+    publish.data = b'x' * 32
+    packet = publish.pack()
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    transport = udp(*server.getsockname())
+    results = [('udp', measure(transport, server, packet, round_trips,
+                               count))]
+    transport.close()
+    server.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'gateway.sock')
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        server.bind(path)
+        transport = unix(path)
+        results.append(('unix', measure(transport, server, packet,
+                                        round_trips, count)))
+        transport.close()
+        server.close()
+
+    for name, (rate, p50, p99) in results:
+        print(f'{name:5} {rate:10.0f} packets/s  round trip '
+              f'p50 {p50 * 1e6:6.1f} us  p99 {p99 * 1e6:6.1f} us')
+
+
+if __name__ == '__main__':
+    main()
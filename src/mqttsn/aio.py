@@ -0,0 +1,336 @@
+"""
+asyncio client for MQTT-SN gateways
+
+AsyncClient drives the protocol from an asyncio.DatagramProtocol, so one
+event loop can keep thousands of requests outstanding without threads.
+Requests are correlated with their acknowledgements through futures keyed
+by (msg_type, msg_id).
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+from .msgids import MsgIds
+from .lib.connects import Connects
+from .lib.disconnects import Disconnects
+from .lib.objects import decode
+from .lib.publishes import Publishes, Pubacks, Pubrecs, Pubrels, Pubcomps
+from .lib.registers import Registers, Regacks
+from .lib.subscribes import Subscribes
+from .lib.unsubscribes import Unsubscribes
+from .lib.names import (
+    CONNACK, DISCONNECT, PUBACK, PUBCOMP, PUBLISH, PUBREC, PUBREL, REGACK,
+    REGISTER, SUBACK, UNSUBACK, TOPIC_NORMAL, TOPIC_PREDEFINED,
+    TOPIC_SHORTNAME
+)
+
+log = logging.getLogger('mqttsn.aio')
+
+Message = namedtuple(
+    'Message', ['topic_name', 'payload', 'qos', 'retained', 'msg_id']
+)
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, address):
+        try:
+            packet = decode(data)
+        except Exception:
+            log.exception(f'Undecodable datagram from {address}')
+            return
+        self.client._process(packet)
+
+    def error_received(self, exc):
+        log.warning(f'Datagram error: {exc}')
+
+    def connection_lost(self, exc):
+        self.client._connection_lost(exc)
+
+
+class AsyncClient:
+    def __init__(self, client_id=None, host="localhost", port=1883,
+                 timeout=5.0):
+        self.client_id = client_id or uuid.uuid4().hex[:23]
+        self.host_ = host
+        self.port_ = port
+        self.timeout = timeout
+        self.transport = None
+        # the event loop must not block, so running out of ids raises
+        self.msg_ids = MsgIds(block=False)
+        self.topics = {}  # topic_id -> topic_name
+        self.topic_ids = {}  # topic_name -> topic_id
+        self._registrations = {}  # topic_name -> REGISTER in flight
+
+        self._pending = {}  # (msg_type, msg_id) -> future
+        self._in_msgs = {}  # qos 2 publishes waiting for PUBREL
+        self._messages = None
+
+        self._actions = {
+            PUBLISH: self._process_publish,
+            PUBREL: self._process_pubrel,
+            REGISTER: self._process_register,
+        }
+
+    async def connect(self, clean_session=True):
+        loop = asyncio.get_event_loop()
+        self._messages = asyncio.Queue()
+        log.info(f'Connecting to {self.host_}:{self.port_}')
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: _Protocol(self), remote_addr=(self.host_, self.port_)
+        )
+
+        connect = Connects()
+        connect.client_id = self.client_id
+        connect.flags.clean_session = clean_session
+        return await self._request(connect, CONNACK, None)
+
+    async def disconnect(self):
+        response = await self._request(Disconnects(), DISCONNECT, None)
+        self.close()
+        return response
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    async def subscribe(self, topic, qos=0, timeout=None):
+        """
+        Subscribe to topic, waiting up to timeout seconds, the timeout of
+        the client by default, for the SUBACK before raising
+        asyncio.TimeoutError
+
+        Returns:
+            (return_code, topic_id) from the SUBACK
+        """
+        subscribe = Subscribes()
+        subscribe.flags.qos = qos
+        if isinstance(topic, str):
+            subscribe.topic_name = topic
+            if len(topic) > 2:
+                subscribe.flags.topic_id_type = TOPIC_NORMAL
+            else:
+                subscribe.flags.topic_id_type = TOPIC_SHORTNAME
+        else:
+            subscribe.topic_id = topic  # should be int
+            subscribe.flags.topic_id_type = TOPIC_PREDEFINED
+
+        with self._msg_id() as subscribe.msg_id:
+            suback = await self._request(
+                subscribe, SUBACK, subscribe.msg_id, timeout
+            )
+        if subscribe.flags.topic_id_type == TOPIC_NORMAL:
+            self._learn(suback.topic_id, topic)
+        return suback.return_code, suback.topic_id
+
+    async def unsubscribe(self, topic, timeout=None):
+        """
+        Unsubscribe from topic, waiting up to timeout seconds for the
+        UNSUBACK as subscribe does
+        """
+        unsubscribe = Unsubscribes()
+        if isinstance(topic, str):
+            unsubscribe.topic_name = topic
+            if len(topic) > 2:
+                unsubscribe.flags.topic_id_type = TOPIC_NORMAL
+            else:
+                unsubscribe.flags.topic_id_type = TOPIC_SHORTNAME
+        else:
+            unsubscribe.topic_id = topic  # should be int
+            unsubscribe.flags.topic_id_type = TOPIC_PREDEFINED
+        with self._msg_id() as unsubscribe.msg_id:
+            await self._request(
+                unsubscribe, UNSUBACK, unsubscribe.msg_id, timeout
+            )
+
+    async def register(self, topic_name, timeout=None):
+        """
+        Register topic_name, waiting up to timeout seconds for the REGACK
+        as subscribe does
+
+        Returns:
+            the topic id assigned by the gateway
+        """
+        register = Registers()
+        register.topic_name = topic_name
+        with self._msg_id() as register.msg_id:
+            regack = await self._request(
+                register, REGACK, register.msg_id, timeout
+            )
+        self._learn(regack.topic_id, topic_name)
+        return regack.topic_id
+
+    async def publish(self, topic, payload, qos=0, retained=False,
+                      timeout=None):
+        """
+        Publish payload to topic, which is either a registered topic id, a
+        two character short name or a topic name registered on first use
+
+        Each ack of a qos 1 or 2 message is waited for up to timeout
+        seconds, the timeout of the client by default, before raising
+        asyncio.TimeoutError.
+
+        Returns:
+            the msg_id, once the PUBACK (qos 1) or PUBCOMP (qos 2) arrived
+        """
+        publish = Publishes()
+        publish.flags.qos = qos
+        publish.flags.retain = retained
+
+        if isinstance(topic, str) and len(topic) <= 2:
+            publish.flags.topic_id_type = TOPIC_SHORTNAME
+            publish.topic_name = topic
+        else:
+            if isinstance(topic, str):
+                topic = await self._topic_id(topic)
+            publish.flags.topic_id_type = TOPIC_NORMAL
+            publish.topic_id = topic
+
+        publish.data = payload
+        if qos in [-1, 0]:
+            publish.msg_id = 0
+            self._send(publish)
+        elif qos == 1:
+            with self._msg_id() as publish.msg_id:
+                await self._request(publish, PUBACK, publish.msg_id, timeout)
+        elif qos == 2:
+            with self._msg_id() as publish.msg_id:
+                await self._request(publish, PUBREC, publish.msg_id, timeout)
+                pubrel = Pubrels()
+                pubrel.msg_id = publish.msg_id
+                await self._request(pubrel, PUBCOMP, publish.msg_id, timeout)
+        return publish.msg_id
+
+    def __aiter__(self):
+        return self.messages()
+
+    async def messages(self):
+        """
+        Iterate over inbound messages until the connection is closed
+        """
+        while True:
+            message = await self._messages.get()
+            if message is None:
+                return
+            yield message
+
+    @contextmanager
+    def _msg_id(self):
+        """
+        Reserve a msg_id for the duration of a request/response exchange
+        """
+        msg_id = self.msg_ids.allocate()
+        try:
+            yield msg_id
+        finally:
+            self.msg_ids.release(msg_id)
+
+    def _send(self, packet):
+        if self.transport is None:
+            raise ConnectionError('Not connected')
+        self.transport.sendto(packet.pack())
+
+    async def _request(self, packet, msg_type, msg_id, timeout=None):
+        key = (msg_type, msg_id)
+        future = asyncio.get_event_loop().create_future()
+        self._pending[key] = future
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            self._send(packet)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    async def _topic_id(self, topic_name):
+        """
+        Returns:
+            the id of topic_name, registered on first use; concurrent
+            publishes to a new name wait for the same REGISTER
+        """
+        topic_id = self.topic_ids.get(topic_name)
+        if topic_id is not None:
+            return topic_id
+        registration = self._registrations.get(topic_name)
+        if registration is None:
+            registration = asyncio.ensure_future(self.register(topic_name))
+            self._registrations[topic_name] = registration
+            registration.add_done_callback(
+                lambda _: self._registrations.pop(topic_name, None)
+            )
+        # one cancelled publish must not cancel the others' registration
+        return await asyncio.shield(registration)
+
+    def _learn(self, topic_id, topic_name):
+        self.topics[topic_id] = topic_name
+        self.topic_ids[topic_name] = topic_id
+
+    def _process(self, packet):
+        msg_type = packet.mh.msg_type
+        if msg_type in self._actions:
+            self._actions[msg_type](packet)
+            return
+
+        future = self._pending.get((msg_type, getattr(packet, 'msg_id', None)))
+        if future is None:
+            future = self._pending.get((msg_type, None))
+        if future is not None and not future.done():
+            future.set_result(packet)
+        else:
+            log.debug(f'Unexpected packet {packet}')
+
+    def _message(self, packet, qos):
+        if packet.flags.topic_id_type == TOPIC_SHORTNAME:
+            topic_name = packet.topic_name.decode('utf-8')
+        else:
+            topic_name = self.topics.get(packet.topic_id, packet.topic_id)
+        return Message(
+            topic_name, packet.data, qos, packet.flags.retain, packet.msg_id
+        )
+
+    def _process_publish(self, packet):
+        qos = packet.flags.qos
+        if qos in [0, 3]:
+            self._messages.put_nowait(self._message(packet, -1 if qos else 0))
+        elif qos == 1:
+            self._messages.put_nowait(self._message(packet, 1))
+            puback = Pubacks()
+            puback.topic_id = packet.topic_id
+            puback.msg_id = packet.msg_id
+            self._send(puback)
+        elif qos == 2:
+            self._in_msgs[packet.msg_id] = packet
+            pubrec = Pubrecs()
+            pubrec.msg_id = packet.msg_id
+            self._send(pubrec)
+
+    def _process_pubrel(self, packet):
+        publish = self._in_msgs.pop(packet.msg_id, None)
+        if publish is not None:
+            self._messages.put_nowait(self._message(publish, 2))
+        pubcomp = Pubcomps()
+        pubcomp.msg_id = packet.msg_id
+        self._send(pubcomp)
+
+    def _process_register(self, packet):
+        self._learn(packet.topic_id, packet.topic_name.decode('utf-8'))
+        regack = Regacks()
+        regack.topic_id = packet.topic_id
+        regack.msg_id = packet.msg_id
+        self._send(regack)
+
+    def _connection_lost(self, exc):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(
+                    exc or ConnectionError('Connection closed')
+                )
+        self._pending.clear()
+        self._messages.put_nowait(None)
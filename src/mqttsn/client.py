@@ -18,26 +18,45 @@
 """
 
 import socket
-import _thread
 import struct
 import logging
+import time
 import uuid
+import itertools
+import ipaddress
+from collections import OrderedDict, deque
 
 from .lib.connects import Connects
 from .lib.disconnects import Disconnects
-from .lib.publishes import Publishes
+from .lib.publishes import (
+    Publishes, PublishTemplate, PreparedPublishes
+)
+from .lib.flags import Flags
+from .lib import batch
 from .lib.helpers import unpack_packet, get_packet
 from .lib.registers import Registers
 from .lib.unsubscribes import Unsubscribes
 from .lib.subscribes import Subscribes
 from .lib.names import (
     CONNACK, TOPIC_NORMAL, TOPIC_SHORTNAME, TOPIC_PREDEFINED,
-    DISCONNECT, REGACK, SUBACK, UNSUBACK
+    DISCONNECT, REGACK, SUBACK, UNSUBACK, packet_names
 )
+from .delivery import DeliveryEngine, RttEstimator
+from .msgids import MsgIds
+from .dispatch import Dispatcher
+from .inbound import InboundQueue, DROP_OLDEST
+from .transport import SocketTransport, udp, unix
+from .fanout import ReceiverPool
+from .topics import TopicRegistry, is_topic_name
+from .predefined import PredefinedTopics
+from .routes import TopicRouter
 from . import internal
 
 log = logging.getLogger("mqttsn")
 
+# qos 0 messages of publish_many encoded and sent per sendmmsg call
+QOS0_CHUNK = 1024
+
 
 class Callback:
     def __init__(self):
@@ -58,6 +77,9 @@ class Callback:
     def delivery_complete(self, msgid):
         log.debug(f'Delivery Complete')
 
+    def delivery_failed(self, msgid):
+        log.warning(f'Delivery Failed: {msgid}')
+
     def advertise(self, address, gwid, duration):
         log.debug(f'Advertise: {address}, {gwid}, {duration}')
 
@@ -65,13 +87,105 @@ class Callback:
         self.registered[topic_id] = topic_name
 
 
+class Publisher:
+    """
+    Publishes to one topic with the same qos and retain flag, see
+    Client.prepare
+    """
+    def __init__(self, client, template, qos):
+        self.client = client
+        self.template = template
+        self.qos = qos
+
+    def publish(self, payload, timeout=None):
+        """
+        Returns:
+            the msg_id, 0 for qos 0 and -1, see Client.publish for timeout
+        """
+        return self.client._publish_template(
+            self.template, self.qos, payload, timeout
+        )
+
+    def publish_many(self, payloads):
+        """
+        Returns:
+            the msg_ids of the payloads, 0 for qos 0 and -1
+        """
+        return self.client._publish_templates(
+            ((self.template, payload) for payload in payloads), self.qos
+        )
+
+
+def _is_multicast(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_multicast
+    except (OSError, ValueError):
+        return False
+
+
 class Client:
-    def __init__(self, client_id=None, host="localhost", port=1883):
+    def __init__(self, client_id=None, host="localhost", port=1883,
+                 timeout=5.0, window=64, retry_interval=5.0, max_retries=3,
+                 block_on_msg_ids=True, dispatch_workers=0,
+                 dispatch_queue=1024, inbound_queue=0,
+                 inbound_policy=DROP_OLDEST, recv_batch=0, recv_into=True,
+                 transport=None, path=None, local_path=None,
+                 payload_decoder=None, decode_workers=None, predefined=None,
+                 max_prepared=4096):
         self.client_id = client_id or self._gen_uuid()
         self.host_ = host
         self.port_ = port
-        self.msg_id = 1
+        self.timeout = timeout
+        self.window = window
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+        # with block_on_msg_ids False, requests raise NoMsgIdsLeft instead
+        # of waiting when all 65535 msg_ids are in flight
+        self.msg_ids = MsgIds(block=block_on_msg_ids)
+        # with dispatch_workers, callbacks run on that many threads and up
+        # to dispatch_queue messages wait for them
+        self.dispatch_workers = dispatch_workers
+        self.dispatch_queue = dispatch_queue
+        # with inbound_queue, up to that many received packets wait to be
+        # processed, see mqttsn.inbound for the policies
+        self.inbound_queue = inbound_queue
+        self.inbound_policy = inbound_policy
+        self.inbound = None
+        # with recv_batch, up to that many datagrams are read per recvmmsg
+        # call on Linux
+        self.recv_batch = recv_batch
+        # datagrams are otherwise received into one preallocated buffer
+        # with recv_into, instead of a new one allocated per datagram
+        self.recv_into = recv_into
+        # a mqttsn.transport.Transport to use instead of connecting a UDP
+        # socket to host and port
+        self.transport = transport
+        self._own_transport = transport is None
+        # with path, connect to a gateway on the Unix domain datagram
+        # socket at path instead of host and port, from local_path
+        self.path = path
+        self.local_path = local_path
+        # with payload_decoder, a picklable callable such as json.loads,
+        # message_arrived gets decoded payloads, decoded in decode_workers
+        # processes, see mqttsn.offload (Python 3.8 or later)
+        self.payload_decoder = payload_decoder
+        self.decode_workers = decode_workers
         self.callback = None
+        self.pool = None
+        self.rtt_estimators = {}  # gateway address -> RttEstimator
+        # ids of the topic names registered with the gateway
+        self.topics = TopicRegistry()
+        # a PredefinedTopics catalogue, or the path of one: topic names it
+        # has are sent as their predefined id
+        if isinstance(predefined, str):
+            predefined = PredefinedTopics(predefined)
+        self.predefined = predefined
+        # handlers of topic filters, see on
+        self.routes = TopicRouter()
+        # (topic, qos, retained) -> PublishTemplate, of the max_prepared
+        # combinations published to last
+        self.max_prepared = max_prepared
+        self._prepared = OrderedDict()
         self.__receiver = None
 
     def _gen_uuid(self):
@@ -82,154 +196,639 @@ class Client:
         """
         return uuid.uuid4().hex.encode('utf-8')[:23]
 
-    def start(self):
-        self.sock = socket.socket(
+    def start(self, workers=0, callback_factory=None):
+        """
+        Receive on host and port, joining its multicast group
+
+        Args:
+            workers (int): when given, receive unicast datagrams sent to
+                host and port in that many processes instead of a thread,
+                each with its own SO_REUSEPORT socket and its own callback,
+                see mqttsn.fanout. host must not be a multicast group, as
+                every worker would get every message of the group.
+            callback_factory: picklable callable returning the callback of
+                a worker, by default the class of the registered callback
+        """
+        if workers:
+            if _is_multicast(self.host_):
+                raise Exception(
+                    f'Cannot share the messages of multicast group '
+                    f'{self.host_} between workers, each would receive all'
+                )
+            if callback_factory is None:
+                if self.callback is None:
+                    raise Exception(
+                        'Receiving in workers needs a callback_factory or a '
+                        'registered callback'
+                    )
+                callback_factory = type(self.callback)
+            self.pool = ReceiverPool(
+                callback_factory, self.host_, self.port_, workers
+            )
+            self.pool.start()
+            return
+
+        sock = socket.socket(
             socket.AF_INET,
             socket.SOCK_DGRAM,
             socket.IPPROTO_UDP
         )
 
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind((self.host_, self.port_))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host_, self.port_))
         mreq = struct.pack("4sl", socket.inet_aton(self.host_),
                            socket.INADDR_ANY)
 
-        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        self.transport = SocketTransport(sock, self.recv_batch)
 
         self.start_receiver()
 
     def stop(self):
+        if self.pool is not None:
+            self.pool.stop()
+            self.pool = None
+            return
         self.stop_receiver()
 
-    def __next_msg_id(self):
-        def get_wrapped_msg_id():
-            id = self.msg_id + 1
-            if id == 65535:
-                id = 1
-            return id
-
-        if len(self.__receiver.out_msgs) >= 65535:
-            raise "Sorry, no slots left!!"
-        else:
-            self.msg_id = get_wrapped_msg_id()
-            while self.msg_id in self.__receiver.out_msgs:
-                self.msg_id = get_wrapped_msg_id()
-        return self.msg_id
-
     def register_callback(self, callback):
         self.callback = callback
 
     def connect(self, clean_session=True):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        # self.sock.settimeout(5.0)
-
-        log.info(f'Connecting to {self.host_}:{self.port_}')
-        # log.info(f'Connecting to {self.host_}:{self.port_}')
-        self.sock.connect((self.host_, self.port_))
+        if self._own_transport and self.path is not None:
+            log.info(f'Connecting to {self.path}')
+            self.transport = unix(
+                self.path, self.local_path, self.recv_batch
+            )
+        elif self._own_transport:
+            log.info(f'Connecting to {self.host_}:{self.port_}')
+            self.transport = udp(self.host_, self.port_, self.recv_batch)
+        else:
+            log.info(f'Connecting to {self.transport.peer_address}')
 
         connect = Connects()
         connect.client_id = self.client_id
-        connect.clean_session = clean_session
-        connect.keepalive_timer = 0
-        self.sock.send(connect.pack())
-
-        response, address = unpack_packet(*get_packet(self.sock))
+        connect.flags.clean_session = clean_session
+        if clean_session:
+            # the gateway forgets the registrations
+            self.topics.clear()
+            self._prepared.clear()
+        self.transport.send(connect.pack())
+
+        response, address = unpack_packet(*get_packet(self.transport))
         assert response.mh.msg_type == CONNACK
 
         self.start_receiver()
 
+    @property
+    def rtt(self):
+        """
+        Returns:
+            the RttEstimator of the gateway, with its current srtt, rttvar
+            and rto in seconds
+        """
+        if self.transport is None:
+            return None
+        return self.rtt_estimators.get(self._gateway())
+
+    def _gateway(self):
+        """
+        Returns:
+            the address of the gateway, which keys its RttEstimator: the
+            peer of the transport, or host and port when the transport is
+            not connected to one
+        """
+        return self.transport.peer_address or (self.host_, self.port_)
+
     def start_receiver(self):
-        self.__receiver = internal.Receivers(self.sock)
+        gateway = self._gateway()
+        rtt = self.rtt_estimators.get(gateway)
+        if rtt is None:
+            rtt = self.rtt_estimators[gateway] = \
+                RttEstimator(initial_rto=self.retry_interval)
+        delivery = DeliveryEngine(
+            self.transport.send, self.window, self.retry_interval,
+            self.max_retries, self._delivery_failed, rtt=rtt,
+            msg_ids=self.msg_ids, send_many=self.transport.send_many,
+            send_buffer=self.transport.send_buffer
+        )
+        delivery.start()
+        dispatcher = None
+        if self.dispatch_workers:
+            dispatcher = Dispatcher(
+                self.dispatch_workers, self.dispatch_queue
+            )
+        self.inbound = None
+        if self.inbound_queue:
+            self.inbound = InboundQueue(
+                self.inbound_queue, self.inbound_policy
+            )
+        decoder = None
+        if self.payload_decoder is not None:
+            # needs multiprocessing.shared_memory, Python 3.8 or later
+            from .offload import PayloadDecoder
+            decoder = PayloadDecoder(
+                self.payload_decoder, self.decode_workers
+            )
+        self.__receiver = internal.Receivers(
+            self.transport, self.timeout, delivery, dispatcher,
+            self.inbound, self.recv_into,
+            decoder, self.topics, self.predefined, self.routes
+        )
         if self.callback:
-            _thread.start_new_thread(self.__receiver, (self.callback,))
+            self.__receiver.start(self.callback)
 
-    def waitfor(self, msg_type, msg_id=None):
-        if self.__receiver:
-            msg = self.__receiver.waitfor(msg_type, msg_id)
-        else:
-            msg = self.__receiver.receive()
-            while (msg.mh.msg_type != msg_type and
-                    (msg_id is None or msg_id == msg.msg_id)):
-                msg = self.__receiver.receive()
-        return msg
-
-    def subscribe(self, topic, qos=0):
-        subscribe = Subscribes()
-        subscribe.msg_id = self.__next_msg_id()
-
-        if isinstance(topic, str):
-            subscribe.topic_name = topic
+    def on(self, topic_filter, handler):
+        """
+        Hand the messages of topics matching topic_filter, which may hold +
+        and # wildcards, to handler instead of message_arrived of the
+        callback. Messages matching several filters go to each of their
+        handlers.
+
+        Args:
+            handler: called like Callback.message_arrived, the message is
+                not acknowledged when it returns False
+        """
+        self.routes.add(topic_filter, handler)
+        if self.callback is None:
+            # receive with the default callback for unrouted messages
+            self.register_callback(Callback())
+            if self.__receiver is not None and not self.__receiver.running:
+                self.__receiver.start(self.callback)
+
+    def off(self, topic_filter, handler=None):
+        """
+        Stop handing topic_filter to handler, or to all its handlers
+        """
+        self.routes.remove(topic_filter, handler)
+
+    def waitfor(self, msg_type, msg_id=None, timeout=None):
+        return self.__receiver.waitfor(msg_type, msg_id, timeout)
+
+    def _predefined_id(self, topic):
+        if self.predefined is None or not isinstance(topic, str):
+            return None
+        return self.predefined.topic_id(topic)
+
+    def _set_topic(self, packet, topic):
+        topic_id = self._predefined_id(topic)
+        if topic_id is not None:
+            packet.topic_id = topic_id
+            packet.flags.topic_id_type = TOPIC_PREDEFINED
+        elif isinstance(topic, str):
+            packet.topic_name = topic
             if len(topic) > 2:
-                subscribe.flags.topic_id_type = TOPIC_NORMAL
+                packet.flags.topic_id_type = TOPIC_NORMAL
             else:
-                subscribe.flags.topic_id_type = TOPIC_SHORTNAME
+                packet.flags.topic_id_type = TOPIC_SHORTNAME
         else:
-            subscribe.topic_id = topic  # should be int
-            subscribe.flags.topic_id_type = TOPIC_PREDEFINED
+            packet.topic_id = topic  # should be int
+            packet.flags.topic_id_type = TOPIC_PREDEFINED
+        return packet
 
+    def _subscribes(self, topic, qos):
+        subscribe = self._set_topic(Subscribes(), topic)
         subscribe.flags.qos = qos
-        if self.__receiver:
-            self.__receiver.lookfor(SUBACK)
-        self.sock.send(subscribe.pack())
-        msg = self.waitfor(SUBACK, subscribe.msg_id)
+        return subscribe
 
-        try:
-            return msg.return_code, msg.topic_id
-        except AttributeError:
-            log.error('No SUBACK message received')
-
-    def unsubscribe(self, topics):
-        unsubscribe = Unsubscribes()
-        unsubscribe.msg_id = self.__next_msg_id()
-        unsubscribe.data = topics
-        if self.__receiver:
-            self.__receiver.lookfor(UNSUBACK)
-        self.sock.send(unsubscribe.pack())
-        self.waitfor(UNSUBACK, unsubscribe.msg_id)
-
-    def register(self, topic_name):
+    def _registers(self, topic_name):
         register = Registers()
         register.topic_name = topic_name
-        if self.__receiver:
-            self.__receiver.lookfor(REGACK)
-        self.sock.send(register.pack())
-        msg = self.waitfor(REGACK, register.msg_id)
+        return register
+
+    def _request(self, packet, ack_type, timeout=None):
+        """
+        Send packet with a new msg_id and wait for its ack, up to timeout
+        seconds, the timeout of the client by default. TimeoutError is
+        raised if the ack did not arrive in time.
+
+        Returns:
+            the ack
+        """
+        packet.msg_id = self.msg_ids.allocate()
+        try:
+            self.__receiver.lookfor(ack_type, packet.msg_id)
+            self.transport.send(packet.pack())
+            ack = self.waitfor(ack_type, packet.msg_id, timeout)
+            if ack is None:
+                raise TimeoutError(
+                    f'No {packet_names[ack_type]} for msg_id {packet.msg_id}'
+                )
+            return ack
+        finally:
+            self.msg_ids.release(packet.msg_id)
+
+    def _learn(self, topic, ack):
+        if ack is not None and ack.return_code == 0 and ack.topic_id and \
+           is_topic_name(topic) and self._predefined_id(topic) is None:
+            self.topics.add(ack.topic_id, topic)
+
+    def subscribe(self, topic, qos=0, timeout=None):
+        """
+        Subscribe to topic, waiting up to timeout seconds, the timeout of
+        the client by default, for the SUBACK before raising TimeoutError
+
+        Returns:
+            (return_code, topic_id) from the SUBACK
+        """
+        msg = self._request(self._subscribes(topic, qos), SUBACK, timeout)
+        self._learn(topic, msg)
+        return msg.return_code, msg.topic_id
+
+    def unsubscribe(self, topic, timeout=None):
+        """
+        Unsubscribe from topic, waiting up to timeout seconds for the
+        UNSUBACK as subscribe does
+        """
+        self._request(
+            self._set_topic(Unsubscribes(), topic), UNSUBACK, timeout
+        )
+
+    def register(self, topic_name, timeout=None):
+        """
+        Register topic_name, waiting up to timeout seconds for the REGACK
+        as subscribe does
+
+        Returns:
+            the topic id assigned by the gateway
+        """
+        msg = self._request(self._registers(topic_name), REGACK, timeout)
+        self._learn(topic_name, msg)
         return msg.topic_id
 
-    def publish(self, topic, payload, qos=0, retained=False):
+    def subscribe_many(self, topics, qos=0, window=16, retries=3,
+                       timeout=None):
+        """
+        Subscribe to many topics, keeping up to window SUBSCRIBEs in flight
+
+        Returns:
+            {topic: (return_code, topic_id)}, None for topics whose SUBACK
+            did not arrive after retries retransmissions
+        """
+        acks = self._pipeline(
+            topics, lambda topic: self._subscribes(topic, qos), SUBACK,
+            window, retries, timeout
+        )
+        for topic, ack in acks.items():
+            self._learn(topic, ack)
+        return {
+            topic: (ack.return_code, ack.topic_id) if ack else None
+            for topic, ack in acks.items()
+        }
+
+    def unsubscribe_many(self, topics, window=16, retries=3, timeout=None):
+        """
+        Returns:
+            {topic: True}, None for topics whose UNSUBACK did not arrive
+        """
+        acks = self._pipeline(
+            topics, lambda topic: self._set_topic(Unsubscribes(), topic),
+            UNSUBACK, window, retries, timeout
+        )
+        return {
+            topic: True if ack else None for topic, ack in acks.items()
+        }
+
+    def register_many(self, topic_names, window=16, retries=3,
+                      timeout=None):
+        """
+        Returns:
+            {topic_name: (return_code, topic_id)}, None for topic names
+            whose REGACK did not arrive
+        """
+        acks = self._pipeline(
+            topic_names, self._registers, REGACK, window, retries, timeout
+        )
+        for topic_name, ack in acks.items():
+            self._learn(topic_name, ack)
+        return {
+            topic_name: (ack.return_code, ack.topic_id) if ack else None
+            for topic_name, ack in acks.items()
+        }
+
+    def _pipeline(self, topics, build, ack_type, window, retries, timeout):
+        """
+        Send one request per topic with distinct msg_ids, keeping at most
+        window of them unanswered, and match the acks by msg_id
+
+        Requests that are not answered within timeout seconds, or within
+        the retransmission timeout of the gateway when timeout is None, are
+        sent again with the DUP flag when the packet has flags, up to
+        retries times.
+
+        Returns:
+            {topic: ack packet or None}, in the order of topics
+        """
+        receiver = self.__receiver
+
+        def retry_after(attempts):
+            if timeout is None:
+                return receiver.rtt.timeout(attempts)
+            return timeout
+        topics = list(topics)
+        pending = deque(topics)
+        in_flight = {}  # future -> [topic, packet, attempts, sent at]
+        results = {}
+
+        while pending or in_flight:
+            while pending and len(in_flight) < window:
+                topic = pending.popleft()
+                packet = build(topic)
+                packet.msg_id = self.msg_ids.allocate()
+                future = receiver.lookfor(ack_type, packet.msg_id)
+                in_flight[future] = [topic, packet, 0, time.monotonic()]
+                self.transport.send(packet.pack())
+
+            # deadlines are recomputed, so they follow the RTO as it adapts
+            deadline = min(
+                entry[3] + retry_after(entry[2])
+                for entry in in_flight.values()
+            )
+            done = receiver.wait(
+                in_flight, max(0, deadline - time.monotonic())
+            )
+            for future in done:
+                topic, packet = in_flight.pop(future)[:2]
+                receiver.correlations.discard(ack_type, packet.msg_id)
+                self.msg_ids.release(packet.msg_id)
+                results[topic] = future.result()
+
+            now = time.monotonic()
+            for future, entry in list(in_flight.items()):
+                topic, packet, attempts, sent = entry
+                if sent + retry_after(attempts) > now:
+                    continue
+                if attempts < retries:
+                    log.debug(f'Retransmitting {packet}')
+                    if hasattr(packet, 'flags'):
+                        packet.flags.dup = True
+                    entry[2] += 1
+                    entry[3] = now
+                    receiver.correlations.retransmitted(
+                        ack_type, packet.msg_id
+                    )
+                    self.transport.send(packet.pack())
+                else:
+                    log.error(f'No ack received for {topic}')
+                    del in_flight[future]
+                    receiver.correlations.discard(ack_type, packet.msg_id)
+                    self.msg_ids.release(packet.msg_id)
+                    results[topic] = None
+
+        return {topic: results[topic] for topic in topics}
+
+    def _topic_ids(self, topics):
+        """
+        Register the topic names among topics that are neither predefined
+        nor registered yet
+
+        Returns:
+            {topic name: (topic_id_type, topic_id)}
+        """
+        topic_ids = {}
+        names = set()
+        for topic in topics:
+            topic_id = self._predefined_id(topic)
+            if topic_id is not None:
+                topic_ids[topic] = (TOPIC_PREDEFINED, topic_id)
+            elif isinstance(topic, str) and len(topic) > 2:
+                names.add(topic)
+        unknown = [name for name in names if name not in self.topics]
+        if len(unknown) == 1:
+            self.register(unknown[0])
+        elif unknown:
+            self.register_many(unknown)
+        for name in names:
+            topic_id = self.topics.topic_id(name)
+            if topic_id is None:
+                raise Exception(f'Topic {name} could not be registered')
+            topic_ids[name] = (TOPIC_NORMAL, topic_id)
+        return topic_ids
+
+    def _publishes(self, topic, payload, qos, retained, topic_ids):
         publish = Publishes()
         publish.flags.qos = qos
         publish.flags.retain = retained
 
-        if isinstance(topic, str):
-            # [FIXME] should accept a TOPIC_NORMAL correctly
+        if topic in topic_ids:
+            publish.flags.topic_id_type, publish.topic_id = topic_ids[topic]
+        elif isinstance(topic, str):
             publish.flags.topic_id_type = TOPIC_SHORTNAME
             publish.topic_name = topic
         else:
             publish.flags.topic_id_type = TOPIC_NORMAL
             publish.topic_id = topic
 
-        if qos in [-1, 0]:
-            publish.msg_id = 0
-        else:
-            publish.msg_id = self.__next_msg_id()
-            log.debug(f'Message ID: {publish.msg_id}')
-            self.__receiver.out_msgs[publish.msg_id] = publish
         publish.data = payload
-        print(f'PUBLISH: {publish.__str__()}')
-        print(f'PAYLOAD LEN: {len(payload)}')
-        self.sock.send(publish.pack())
+        return publish
+
+    def _templates(self, topics, qos, retained):
+        """
+        Returns:
+            {topic: PublishTemplate} for each of topics, registering the
+            topic names of templates not encoded yet
+        """
+        templates = {}
+        missing = []
+        for topic in topics:
+            template = self._template((topic, qos, retained))
+            if template is None:
+                missing.append(topic)
+            else:
+                templates[topic] = template
+        if missing:
+            topic_ids = self._topic_ids(missing)
+            for topic in missing:
+                templates[topic] = PublishTemplate.of(self._publishes(
+                    topic, b'', qos, retained, topic_ids
+                ))
+                self._prepare((topic, qos, retained), templates[topic])
+        return templates
+
+    def _template(self, key):
+        template = self._prepared.get(key)
+        if template is not None:
+            try:
+                self._prepared.move_to_end(key)
+            except KeyError:
+                pass  # evicted by another thread meanwhile
+        return template
+
+    def _prepare(self, key, template):
+        self._prepared[key] = template
+        while len(self._prepared) > self.max_prepared:
+            try:
+                self._prepared.popitem(last=False)
+            except KeyError:
+                break  # emptied by another thread meanwhile
+
+    def prepare(self, topic, qos=0, retained=False):
+        """
+        Encode the PUBLISH header of topic once, for publishing to it many
+        times. The topic is resolved as publish does, and must be prepared
+        again after a clean session connect.
+
+        Returns:
+            a Publisher
+        """
+        return Publisher(
+            self, self._templates([topic], qos, retained)[topic], qos
+        )
+
+    def publish(self, topic, payload, qos=0, retained=False, timeout=None):
+        """
+        Publish payload to topic, which is either a registered topic id, a
+        name of the predefined catalogue, a two character short name or a
+        topic name registered on first use
+
+        A qos 1 or 2 message waits for room in the window, forever unless
+        timeout seconds are given, after which TimeoutError is raised and
+        the message is not sent.
+
+        Returns:
+            the msg_id, 0 for qos 0 and -1
+        """
+        template = self._template((topic, qos, retained))
+        if template is None:
+            template = self._templates([topic], qos, retained)[topic]
+        return self._publish_template(template, qos, payload, timeout)
+
+    def _publish_template(self, template, qos, payload, timeout=None):
+        if qos in [-1, 0]:
+            self.transport.send(template.pack(payload))
+            return 0
+        publish = PreparedPublishes(template, self.msg_ids.allocate(), payload)
+        log.debug(f'Message ID: {publish.msg_id}')
+        if not self.__receiver.delivery.submit(publish, timeout):
+            self.msg_ids.release(publish.msg_id)
+            raise TimeoutError(
+                f'No room in the window for msg_id {publish.msg_id}'
+            )
         return publish.msg_id
 
+    def publish_many(self, messages, qos=0, retained=False):
+        """
+        Publish (topic, payload) pairs, sending many PUBLISHes per system
+        call where sendmmsg is available. messages may be any iterable,
+        it is consumed a window at a time, and the topic names of a window
+        not registered yet are registered together first.
+
+        Returns:
+            the msg_ids of the messages, 0 for qos 0 and -1
+        """
+        messages = iter(messages)
+        msg_ids = []
+        while True:
+            chunk = list(itertools.islice(messages, self._chunk(qos)))
+            if not chunk:
+                return msg_ids
+            templates = self._templates(
+                dict.fromkeys(topic for topic, _ in chunk), qos, retained
+            )
+            msg_ids += self._publish_templates(
+                [(templates[topic], payload) for topic, payload in chunk],
+                qos
+            )
+
+    def _chunk(self, qos):
+        """
+        Returns:
+            how many messages of qos to encode and send together: a window
+            of them, or for qos 0 and -1, which do not take a place in the
+            window, as many as a sendmmsg call takes
+        """
+        return QOS0_CHUNK if qos in [-1, 0] else self.window
+
+    def _publish_templates(self, messages, qos):
+        """
+        Send (PublishTemplate, payload) pairs
+
+        Returns:
+            the msg_ids of the messages
+        """
+        msg_ids = []
+        messages = iter(messages)
+        while True:
+            # a window at a time, so ids are not held by unsent messages
+            chunk = list(itertools.islice(messages, self._chunk(qos)))
+            if not chunk:
+                return msg_ids
+            if qos in [-1, 0]:
+                self.transport.send_many([
+                    template.pack(payload) for template, payload in chunk
+                ])
+                msg_ids += [0] * len(chunk)
+                continue
+            publishes = [
+                PreparedPublishes(template, self.msg_ids.allocate(), payload)
+                for template, payload in chunk
+            ]
+            self.__receiver.delivery.submit_many(publishes)
+            msg_ids += [publish.msg_id for publish in publishes]
+
+    def publish_columns(self, topic_ids, layout, columns, qos=0,
+                        retained=False, topic_id_type=TOPIC_NORMAL):
+        """
+        Publish a message per row of column arrays, encoding all of them at
+        once with numpy into one buffer, see mqttsn.lib.batch. QoS 0 and -1
+        messages are sent with one send_buffer call, others a window at a
+        time out of the same buffer.
+
+        Args:
+            topic_ids: array of the topic id of each message, registered
+                or, with topic_id_type TOPIC_PREDEFINED, predefined
+            layout: numpy structured dtype of the payloads, such as
+                np.dtype([('value', '>f4'), ('timestamp', '>u8')])
+            columns: {field name: array} for each field of layout
+
+        Returns:
+            the msg_ids of the messages, 0 for qos 0 and -1
+        """
+        payloads = batch.pack_payloads(layout, columns)
+        flags = Flags()
+        flags.qos = qos
+        flags.retain = retained
+        flags.topic_id_type = topic_id_type
+        count = len(payloads)
+        buffer, offsets, length = batch.pack_publishes(
+            topic_ids, payloads, int(flags)
+        )
+        if qos in [-1, 0]:
+            self.transport.send_buffer(buffer, offsets, [length] * count)
+            return [0] * count
+
+        msg_ids = []
+        for start in range(0, count, self.window):
+            stop = min(count, start + self.window)
+            ids = self.msg_ids.allocate_many(stop - start)
+            batch.set_msg_ids(buffer, offsets[start:stop], length, ids)
+            self.__receiver.delivery.submit_buffer(
+                buffer, offsets[start:stop], length, ids
+            )
+            msg_ids += ids
+        return msg_ids
+
+    def _delivery_failed(self, msg_id, publish):
+        if hasattr(self.callback, "delivery_failed"):
+            self.callback.delivery_failed(msg_id)
+
     def disconnect(self):
         disconnect = Disconnects()
-        if self.__receiver:
-            self.__receiver.lookfor(DISCONNECT)
-        self.sock.send(disconnect.pack())
+        self.__receiver.lookfor(DISCONNECT)
+        self.transport.send(disconnect.pack())
         self.waitfor(DISCONNECT)
 
     def stop_receiver(self):
-        self.sock.close()  # this will stop the receiver too
+        self.__receiver.delivery.stop()
+        # the receiver stops on the closed transport, and must not submit
+        # to the decoder or the dispatcher once they are shut down
+        self.transport.close()
+        if not self.__receiver.join(self.timeout):
+            log.warning('Receiver still running after the transport closed')
+        if self.__receiver.decoder is not None:
+            self.__receiver.decoder.shutdown()
+        if self.__receiver.dispatcher is not None:
+            self.__receiver.dispatcher.shutdown()
         assert self.__receiver.in_msgs == {}
         assert self.__receiver.out_msgs == {}
         self.__receiver = None
@@ -0,0 +1,382 @@
+"""
+QoS 1 and 2 delivery: in-flight window, retransmissions and failures
+
+Every unacknowledged PUBLISH (or PUBREL, once its PUBREC arrived) has one
+retry timer in a hashed timing wheel, advanced by a single ticker thread,
+so the cost of a tick does not depend on how many messages are in flight.
+Retry timeouts follow the round trip time measured on acknowledgements.
+"""
+
+import logging
+import threading
+import time
+
+from .lib.publishes import PackedPublishes, Pubrels
+
+log = logging.getLogger('delivery')
+
+# States of an outgoing message
+AWAITING_PUBACK, AWAITING_PUBREC, AWAITING_PUBCOMP = range(3)
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel
+
+    Timers are hashed by expiry tick into a ring of slots. Scheduling and
+    cancelling are O(1), and advancing one tick only visits the timers of
+    one slot. Timers further away than the ring wait for extra rounds.
+    """
+    def __init__(self, tick=0.1, slots=512):
+        self.tick = tick
+        self.ticks = 0
+        self._slots = [{} for _ in range(slots)]
+        self._where = {}  # key -> slot holding its timer
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def schedule(self, key, delay, value=None):
+        """
+        (Re)arm the timer of key to expire in delay seconds
+        """
+        self.cancel(key)
+        expiry = self.ticks + max(1, int(-(-delay // self.tick)))
+        slot = expiry % len(self._slots)
+        self._slots[slot][key] = (expiry, value)
+        self._where[key] = slot
+
+    def cancel(self, key):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def advance(self):
+        """
+        Move one tick forward
+
+        Returns:
+            [(key, value)] of the timers that expired
+        """
+        self.ticks += 1
+        slot = self._slots[self.ticks % len(self._slots)]
+        expired = [
+            (key, value) for key, (expiry, value) in slot.items()
+            if expiry <= self.ticks
+        ]
+        for key, _ in expired:
+            del slot[key]
+            del self._where[key]
+        return expired
+
+
+class RttEstimator:
+    """
+    Smoothed round trip time and retransmission timeout of a gateway
+
+    Follows RFC 6298: SRTT and RTTVAR are updated from each sample, and
+    RTO = SRTT + 4 * RTTVAR, clamped to [min_rto, max_rto]. Exchanges that
+    were retransmitted must not be sampled, as their ack is ambiguous.
+
+    Args:
+        initial_rto (float): timeout used until the first sample
+        min_rto (float), max_rto (float): bounds of the timeout, seconds
+    """
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, initial_rto=1.0, min_rto=0.2, max_rto=60.0):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f'srtt {self.srtt}, rttvar {self.rttvar}, rto {self.rto}, ' \
+               f'samples {self.samples}'
+
+    def sample(self, rtt):
+        with self._lock:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = (1 - self.BETA) * self.rttvar + \
+                    self.BETA * abs(self.srtt - rtt)
+                self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+            self.samples += 1
+            self.rto = min(
+                self.max_rto,
+                max(self.min_rto, self.srtt + self.K * self.rttvar)
+            )
+
+    def timeout(self, retries=0):
+        """
+        Returns:
+            the timeout of an exchange already retransmitted retries times,
+            doubling the RTO for each retransmission
+        """
+        return min(self.max_rto, self.rto * 2 ** retries)
+
+
+class DeliveryEngine:
+    """
+    Tracks outgoing QoS 1 and 2 messages until they are acknowledged
+
+    Args:
+        send: function sending bytes to the gateway
+        window (int): maximum number of unacknowledged messages, submit
+            blocks while the window is full
+        retry_interval (float): seconds before an unacknowledged PUBLISH or
+            PUBREL is first sent again, until round trips were measured.
+            PUBLISHes are resent with the DUP flag set.
+        max_retries (int): retransmissions before giving up on a message
+        on_failure: called with (msg_id, packet) for messages given up on
+        tick (float): resolution of the retry timers, in seconds
+        slots (int): size of the timing wheel
+        rtt (RttEstimator): estimator of the gateway round trip time
+        msg_ids (MsgIds): allocator the msg_ids of completed and failed
+            messages are released to
+        send_many: function sending a list of packets at once, used by
+            submit_many
+        send_buffer: function sending (buffer, offsets, lengths) at once,
+            used by submit_buffer
+    """
+    def __init__(self, send, window=64, retry_interval=5.0, max_retries=3,
+                 on_failure=None, tick=0.1, slots=512, rtt=None,
+                 msg_ids=None, send_many=None, send_buffer=None):
+        self.send = send
+        self.send_many = send_many
+        self.send_buffer = send_buffer
+        self.window = window
+        self.max_retries = max_retries
+        self.on_failure = on_failure
+        self.msg_ids = msg_ids
+        if rtt is None:
+            rtt = RttEstimator(initial_rto=retry_interval)
+        self.rtt = rtt
+
+        self.out_msgs = {}  # msg_id -> Publishes or PreparedPublishes
+        self._state = {}  # msg_id -> [state, retries, sent at]
+        self._wheel = TimerWheel(tick, slots)
+        self._lock = threading.Condition()
+        self._stopped = threading.Event()
+        self._ticker = None
+
+    def __len__(self):
+        return len(self.out_msgs)
+
+    def start(self):
+        if self._ticker is None:
+            self._stopped.clear()
+            self._ticker = threading.Thread(
+                target=self._run, name='mqttsn-delivery', daemon=True
+            )
+            self._ticker.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._ticker is not None:
+            self._ticker.join()
+            self._ticker = None
+
+    def submit(self, publish, timeout=None):
+        """
+        Send a QoS 1 or 2 PUBLISH and track it until acknowledged, waiting
+        up to timeout seconds (forever if None) for room in the window
+
+        Returns:
+            True if the message was sent
+        """
+        with self._lock:
+            if not self._lock.wait_for(
+                    lambda: len(self.out_msgs) < self.window, timeout):
+                return False
+            self._track(publish)
+        self.send(publish.pack())
+        return True
+
+    def submit_many(self, publishes):
+        """
+        Send QoS 1 or 2 PUBLISHes and track them, sending as many at once
+        as the window has room for
+        """
+        publishes = list(publishes)
+        start = 0
+        while start < len(publishes):
+            stop = self._track_window(publishes, start)
+            packets = [publish.pack() for publish in publishes[start:stop]]
+            if self.send_many is None:
+                for packet in packets:
+                    self.send(packet)
+            else:
+                self.send_many(packets)
+            start = stop
+
+    def submit_buffer(self, buffer, offsets, length, msg_ids):
+        """
+        Send and track QoS 1 or 2 PUBLISHes packed back to back in buffer,
+        as batch.pack_publishes does, a window at a time. The tracked
+        PackedPublishes are views of buffer, which is not copied.
+
+        Args:
+            offsets: start of each PUBLISH in buffer
+            length (int): common length of the PUBLISHes
+            msg_ids: msg_id of each PUBLISH
+        """
+        view = memoryview(buffer).cast('B')
+        publishes = [
+            PackedPublishes(view[offset:offset + length], msg_id)
+            for offset, msg_id in zip(list(map(int, offsets)), msg_ids)
+        ]
+        start = 0
+        while start < len(publishes):
+            stop = self._track_window(publishes, start)
+            if self.send_buffer is None:
+                for publish in publishes[start:stop]:
+                    self.send(publish.packet)
+            else:
+                self.send_buffer(
+                    buffer, offsets[start:stop], [length] * (stop - start)
+                )
+            start = stop
+
+    def _track_window(self, publishes, start):
+        """
+        Track publishes from start on, as many as the window has room for
+
+        Returns:
+            the index following the last publish tracked
+        """
+        with self._lock:
+            self._lock.wait_for(lambda: len(self.out_msgs) < self.window)
+            stop = min(len(publishes),
+                       start + self.window - len(self.out_msgs))
+            now, timeout = time.monotonic(), self.rtt.timeout()
+            for publish in publishes[start:stop]:
+                self._track(publish, now, timeout)
+        return stop
+
+    def _track(self, publish, now=None, timeout=None):
+        state = AWAITING_PUBACK if publish.flags.qos == 1 \
+            else AWAITING_PUBREC
+        if now is None:
+            now, timeout = time.monotonic(), self.rtt.timeout()
+        self.out_msgs[publish.msg_id] = publish
+        self._state[publish.msg_id] = [state, 0, now]
+        self._wheel.schedule(publish.msg_id, timeout)
+
+    def puback(self, msg_id):
+        """
+        Returns:
+            the QoS 1 Publishes acknowledged, or None if msg_id was not
+            waiting for a PUBACK
+        """
+        return self._complete(msg_id, AWAITING_PUBACK)
+
+    def pubcomp(self, msg_id):
+        """
+        Returns:
+            the QoS 2 Publishes completed, or None if msg_id was not
+            waiting for a PUBCOMP
+        """
+        return self._complete(msg_id, AWAITING_PUBCOMP)
+
+    def _complete(self, msg_id, expected):
+        with self._lock:
+            state = self._state.get(msg_id)
+            if state is None or state[0] != expected:
+                return None
+            self._sample(state)
+            self._wheel.cancel(msg_id)
+            del self._state[msg_id]
+            self._lock.notify()
+            publish = self.out_msgs.pop(msg_id)
+        self._release(msg_id)
+        return publish
+
+    def pubrec(self, msg_id):
+        """
+        Answer a PUBREC with a PUBREL, retransmitted until the PUBCOMP
+
+        Returns:
+            False if msg_id is not an outgoing QoS 2 message
+        """
+        with self._lock:
+            state = self._state.get(msg_id)
+            if state is None or state[0] == AWAITING_PUBACK:
+                return False
+            if state[0] == AWAITING_PUBREC:
+                self._sample(state)
+                state = self._state[msg_id] = \
+                    [AWAITING_PUBCOMP, 0, time.monotonic()]
+            else:
+                # a retransmitted PUBREL would make its PUBCOMP ambiguous
+                state[1] += 1
+            self._wheel.schedule(msg_id, self.rtt.timeout(state[1]))
+        self.send(self._pubrel(msg_id))
+        return True
+
+    def tick(self):
+        """
+        Advance the retry timers one tick, resending or failing the
+        messages whose timer expired
+        """
+        resend, failed = [], []
+        with self._lock:
+            for msg_id, _ in self._wheel.advance():
+                state = self._state[msg_id]
+                if state[1] >= self.max_retries:
+                    del self._state[msg_id]
+                    failed.append((msg_id, self.out_msgs.pop(msg_id)))
+                    continue
+                state[1] += 1
+                self._wheel.schedule(msg_id, self.rtt.timeout(state[1]))
+                if state[0] == AWAITING_PUBCOMP:
+                    resend.append(self._pubrel(msg_id))
+                else:
+                    publish = self.out_msgs[msg_id]
+                    publish.flags.dup = True
+                    resend.append(publish.pack())
+            if failed:
+                self._lock.notify(len(failed))
+
+        for packet in resend:
+            self.send(packet)
+        for msg_id, publish in failed:
+            log.warning(f'Delivery of message {msg_id} failed')
+            self._release(msg_id)
+            if self.on_failure is not None:
+                self.on_failure(msg_id, publish)
+
+    def _release(self, msg_id):
+        if self.msg_ids is not None:
+            self.msg_ids.release(msg_id)
+
+    def _sample(self, state):
+        if state[1] == 0:
+            self.rtt.sample(time.monotonic() - state[2])
+
+    def _pubrel(self, msg_id):
+        pubrel = Pubrels()
+        pubrel.msg_id = msg_id
+        return pubrel.pack()
+
+    def _run(self):
+        tick = self._wheel.tick
+        started = time.monotonic() - self._wheel.ticks * tick
+        while not self._stopped.wait(tick):
+            # catch up with ticks missed while we were not scheduled
+            due = int((time.monotonic() - started) / tick)
+            while self._wheel.ticks < due:
+                try:
+                    self.tick()
+                except Exception:
+                    log.exception('Retransmission failed')
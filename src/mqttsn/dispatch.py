@@ -0,0 +1,90 @@
+"""
+Running message handlers off the receiver thread
+
+Handlers run on a bounded thread pool. Messages of one topic are queued
+behind each other and handled one at a time, in arrival order, while
+messages of different topics are handled in parallel.
+"""
+
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger('dispatch')
+
+
+def topic_key(packet):
+    """
+    Returns:
+        the key ordering the messages of packet's topic, whatever the type
+        of topic id
+    """
+    return (packet.flags.topic_id_type, packet.topic_id, packet.topic_name)
+
+
+class Dispatcher:
+    """
+    Args:
+        workers (int): threads running handlers
+        max_pending (int): messages queued or being handled before
+            dispatch blocks the receiver thread
+        batch (int): messages of one topic a worker handles before letting
+            the other topics run
+    """
+    def __init__(self, workers=4, max_pending=1024, batch=16):
+        self.batch = batch
+        self._executor = ThreadPoolExecutor(
+            workers, thread_name_prefix='mqttsn-dispatch'
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        # key -> jobs of the topic, present while a worker drains it
+        self._queues = {}
+        self._pending = 0
+
+    def __len__(self):
+        return self._pending
+
+    def dispatch(self, key, job, *args):
+        """
+        Queue job(*args) behind the jobs already queued under key, waiting
+        while max_pending messages are pending
+        """
+        self._slots.acquire()
+        with self._lock:
+            self._pending += 1
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.append((job, args))
+                return
+            queue = self._queues[key] = deque([(job, args)])
+        self._executor.submit(self._drain, key, queue)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait)
+
+    def _drain(self, key, queue):
+        handled = 0
+        while True:
+            if handled == self.batch:
+                # back of the executor queue, still holding the topic
+                try:
+                    self._executor.submit(self._drain, key, queue)
+                    return
+                except RuntimeError:
+                    pass  # shutting down, finish the topic here
+            handled += 1
+            with self._lock:
+                if not queue:
+                    del self._queues[key]
+                    return
+                job, args = queue.popleft()
+            try:
+                job(*args)
+            except Exception:
+                log.exception('Message handler failed')
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                self._slots.release()
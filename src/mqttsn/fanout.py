@@ -0,0 +1,155 @@
+"""
+Receiving on one port from several processes with SO_REUSEPORT
+
+Each worker process binds its own socket to the same address with
+SO_REUSEPORT and runs the usual receive loop with its own callback, so
+decoding and handling are spread over cores instead of one GIL. The
+kernel balances unicast datagrams between the sockets by source address.
+Multicast datagrams are delivered to every socket instead, so a pool
+joining a group has each worker handle every message, and Client.start
+only fans unicast out.
+"""
+
+import logging
+import multiprocessing
+import queue
+import socket
+import struct
+import time
+from collections import Counter
+
+from .internal import Receivers
+from .lib.names import packet_names
+from .transport import SocketTransport
+
+log = logging.getLogger('fanout')
+
+
+def _bind(host, port, multicast):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                         socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    if multicast:
+        mreq = struct.pack("4sl", socket.inet_aton(host), socket.INADDR_ANY)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    return sock
+
+
+def _worker(index, sock, callback_factory, stop, reports, stats_interval):
+    sock.settimeout(0.2)  # how often stop is checked
+    receiver = Receivers(SocketTransport(sock), recv_into=True)
+    callback = callback_factory()
+    stats = {'worker': index, 'pid': multiprocessing.current_process().pid,
+             'packets': 0, 'errors': 0, 'types': Counter()}
+    reported = time.monotonic()
+    try:
+        while not stop.is_set():
+            try:
+                received = receiver.read()
+            except OSError:
+                break  # socket closed
+            except Exception:
+                # empty, truncated or malformed datagram
+                stats['errors'] += 1
+                log.exception(f'Worker {index} dropped a datagram')
+                received = None
+            if received is not None:
+                packet, address = received
+                stats['packets'] += 1
+                stats['types'][packet_names[packet.mh.msg_type]] += 1
+                try:
+                    receiver.process(packet, address, callback)
+                except Exception:
+                    stats['errors'] += 1
+                    log.exception(f'Worker {index} failed on {packet}')
+            if time.monotonic() - reported >= stats_interval:
+                reports.put(dict(stats, types=dict(stats['types'])))
+                reported = time.monotonic()
+    finally:
+        reports.put(dict(stats, types=dict(stats['types']), stopped=True))
+        sock.close()
+
+
+class ReceiverPool:
+    """
+    Worker processes receiving on (host, port)
+
+    Args:
+        callback_factory: picklable callable returning the Callback of a
+            worker, such as a Callback subclass
+        workers (int): number of processes
+        multicast (bool): join the multicast group host; every worker then
+            receives every datagram of the group
+        stats_interval (float): seconds between stats reports of a worker
+    """
+    def __init__(self, callback_factory, host="localhost", port=1883,
+                 workers=None, multicast=False, stats_interval=1.0):
+        self.callback_factory = callback_factory
+        self.host = host
+        self.port = port
+        self.workers = workers or multiprocessing.cpu_count()
+        self.multicast = multicast
+        self.stats_interval = stats_interval
+        self._context = multiprocessing.get_context('spawn')
+        self._stop = self._context.Event()
+        self._reports = self._context.Queue()
+        self._processes = []
+        self._stats = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        # bound here, so an address in use fails the parent
+        sockets = [
+            _bind(self.host, self.port, self.multicast)
+            for _ in range(self.workers)
+        ]
+        for index, sock in enumerate(sockets):
+            process = self._context.Process(
+                target=_worker, name=f'mqttsn-worker-{index}', daemon=True,
+                args=(index, sock, self.callback_factory, self._stop,
+                      self._reports, self.stats_interval)
+            )
+            process.start()
+            sock.close()  # the worker holds its own copy
+            self._processes.append(process)
+
+    def stats(self):
+        """
+        Returns:
+            {worker index: latest stats}, with the packets received and
+            processed, their count per message type, and the datagrams
+            dropped undecodable or failing in their handler
+        """
+        while True:
+            try:
+                report = self._reports.get_nowait()
+            except queue.Empty:
+                return dict(self._stats)
+            self._stats[report['worker']] = report
+
+    def stop(self, timeout=5.0):
+        """
+        Ask the workers to finish the packet at hand and exit, terminating
+        those still running after timeout seconds
+        """
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                log.warning(f'Terminating {process.name}')
+                process.terminate()
+                process.join()
+        self._processes = []
+        # final reports are sent before exiting
+        stats = self.stats()
+        self._stop.clear()
+        return stats
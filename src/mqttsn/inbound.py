@@ -0,0 +1,104 @@
+"""
+Bounded queue between socket reads and packet processing
+
+When packets arrive faster than they are processed the queue fills up
+and its policy decides what happens: drop the oldest packet, drop the
+arriving one, or block the reader. QoS 0 (and -1) PUBLISHes are always
+dropped before any other packet, so acknowledgements and QoS 1/2 messages
+survive bursts of telemetry.
+"""
+
+import itertools
+import threading
+from collections import Counter, deque
+
+from .dispatch import topic_key
+from .lib.names import PUBLISH, packet_names
+
+DROP_OLDEST, DROP_NEWEST, BLOCK = 'drop-oldest', 'drop-newest', 'block'
+
+
+def _droppable(packet):
+    return packet.mh.msg_type == PUBLISH and packet.flags.qos in [0, 3]
+
+
+class InboundQueue:
+    """
+    Args:
+        size (int): packets held at most
+        policy: DROP_OLDEST, DROP_NEWEST or BLOCK
+    """
+    def __init__(self, size=1024, policy=DROP_OLDEST):
+        if policy not in [DROP_OLDEST, DROP_NEWEST, BLOCK]:
+            raise Exception(f'Unknown inbound queue policy {policy}')
+        self.size = size
+        self.policy = policy
+        self.drops = Counter()  # message type name -> packets dropped
+        self.topic_drops = Counter()  # topic_key -> PUBLISHes dropped
+        self.closed = False
+
+        # QoS 0 PUBLISHes and the other packets are queued apart, and get
+        # merges them back in arrival order through their sequence number
+        self._low = deque()
+        self._high = deque()
+        self._seq = itertools.count()
+        self._lock = threading.Condition()
+
+    def __len__(self):
+        return len(self._low) + len(self._high)
+
+    def put(self, packet, address=None):
+        """
+        Returns:
+            False if a packet, this one or an older one, was dropped
+        """
+        low = _droppable(packet)
+        with self._lock:
+            if self.policy == BLOCK:
+                self._lock.wait_for(
+                    lambda: len(self) < self.size or self.closed
+                )
+            dropped = True
+            if len(self) < self.size:
+                dropped = False
+            elif self._low and (not low or self.policy == DROP_OLDEST):
+                self._drop(self._low.popleft()[1])
+            elif not low and self.policy == DROP_OLDEST:
+                self._drop(self._high.popleft()[1])
+            else:
+                self._drop(packet)
+                return False
+            entry = (next(self._seq), packet, address)
+            (self._low if low else self._high).append(entry)
+            self._lock.notify_all()
+        return not dropped
+
+    def get(self, timeout=None):
+        """
+        Returns:
+            the oldest (packet, address), or None once closed and empty or
+            after timeout seconds
+        """
+        with self._lock:
+            if not self._lock.wait_for(
+                    lambda: len(self) or self.closed, timeout):
+                return None
+            if not len(self):
+                return None
+            if not self._high or \
+               (self._low and self._low[0][0] < self._high[0][0]):
+                _, packet, address = self._low.popleft()
+            else:
+                _, packet, address = self._high.popleft()
+            self._lock.notify_all()
+            return packet, address
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self._lock.notify_all()
+
+    def _drop(self, packet):
+        self.drops[packet_names[packet.mh.msg_type]] += 1
+        if packet.mh.msg_type == PUBLISH:
+            self.topic_drops[topic_key(packet)] += 1
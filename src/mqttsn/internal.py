@@ -16,37 +16,170 @@
  *****************************************************************************/
 """
 
+import _thread
 import time
 import sys
+import functools
 import socket
+import threading
 import traceback
 import logging
+from concurrent.futures import Future, FIRST_COMPLETED, wait
 
-from .lib.publishes import Pubacks, Pubrecs, Pubrels, Pubcomps
-from .lib.helpers import get_packet, unpack_packet
+from .delivery import DeliveryEngine
+from .dispatch import topic_key
+from .topics import TopicRegistry
+from .lib.publishes import Pubacks, Pubrecs, Pubcomps
+from .lib.registers import Regacks
+from .lib.helpers import (
+    get_packet, get_packet_into, unpack_packet, to_bytes
+)
 from .lib.names import (
-    PUBACK, REGISTER, PUBREC, PUBREL, PUBCOMP, PUBLISH, ADVERTISE, TOPIC_NORMAL
+    PUBACK, REGISTER, PUBREC, PUBREL, PUBCOMP, PUBLISH, ADVERTISE,
+    CONNACK, REGACK, SUBACK, UNSUBACK, PINGRESP, TOPIC_NORMAL,
+    TOPIC_PREDEFINED, packet_names
 )
 
 
 log = logging.getLogger('internal')
 
 
+class Correlations:
+    """
+    Futures of the acknowledgements we are waiting for
+
+    Waiters register a future under (msg_type, msg_id) before sending
+    their request, and the receiver completes it as soon as the matching
+    packet arrives. msg_id None matches any packet of msg_type. Entries
+    stay until the waiter discards them; ACKS arriving after that, late or
+    duplicated by the network or by a retransmitted request, match nothing
+    and are dropped by the receiver.
+
+    Acks of SUBSCRIBE, UNSUBSCRIBE and REGISTER requests are timed from
+    expect and sampled by rtt, unless the request was retransmitted.
+    """
+    TIMED = (SUBACK, UNSUBACK, REGACK)
+    ACKS = (CONNACK, REGACK, SUBACK, UNSUBACK, PINGRESP)
+
+    def __init__(self, rtt=None):
+        self.rtt = rtt
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._sent = {}  # key -> time the request was sent
+
+    def __len__(self):
+        return len(self._futures)
+
+    def expect(self, msg_type, msg_id=None):
+        key = (msg_type, msg_id)
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                future = self._futures[key] = Future()
+                if msg_type in self.TIMED:
+                    self._sent[key] = time.monotonic()
+        return future
+
+    def retransmitted(self, msg_type, msg_id=None):
+        """
+        The request answered by (msg_type, msg_id) was sent again, so its
+        ack can no longer be timed
+        """
+        with self._lock:
+            self._sent.pop((msg_type, msg_id), None)
+
+    def discard(self, msg_type, msg_id=None):
+        with self._lock:
+            self._futures.pop((msg_type, msg_id), None)
+            self._sent.pop((msg_type, msg_id), None)
+
+    def resolve(self, packet):
+        """
+        Returns:
+            True if packet completed a waiting future
+        """
+        msg_type = packet.mh.msg_type
+        key = (msg_type, getattr(packet, 'msg_id', None))
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                key = (msg_type, None)
+                future = self._futures.get(key)
+            if future is None:
+                return False
+            if not future.done():
+                future.set_result(packet)
+            sent = self._sent.pop(key, None)
+        if sent is not None and self.rtt is not None:
+            self.rtt.sample(time.monotonic() - sent)
+        return True
+
+
 class Receivers:
-    def __init__(self, socket):
+    """
+    Reads and processes the packets of the gateway
+
+    With a dispatcher, message_arrived runs on its worker threads instead
+    of the receiver thread, in order per topic. PUBACK and PUBCOMP are
+    still only sent once the handler returned True.
+
+    With an inbound InboundQueue, the receiver thread only reads datagrams
+    into it, and a second thread processes them.
+
+    When the transport has a batch size, the receiver thread reads many
+    datagrams at once with its recv_many. With recv_into, datagrams are
+    otherwise received into one preallocated buffer, rather than recvfrom
+    allocating a new one for each, and only the payload of a PUBLISH is
+    copied out before the next datagram overwrites it.
+
+    With a decoder, a mqttsn.offload.PayloadDecoder, payloads are decoded
+    in worker processes and message_arrived gets the decoded objects, in
+    the order the PUBLISHes arrived. Acks wait for the handler as above.
+
+    Topic ids of inbound PUBLISHes are resolved to names with topics, a
+    TopicRegistry, which learns the REGISTERs of the gateway, and
+    predefined topic ids with predefined, a PredefinedTopics catalogue.
+
+    Messages whose topic matches a filter of routes, a TopicRouter, go to
+    the handlers of the filters instead of message_arrived. Handlers take
+    the arguments of message_arrived, and the message is acknowledged
+    unless one of them returns False.
+
+    Args:
+        transport: mqttsn.transport.Transport to the gateway
+    """
+    def __init__(self, transport, timeout=5.0, delivery=None,
+                 dispatcher=None, inbound=None, recv_into=False, decoder=None,
+                 topics=None, predefined=None, routes=None):
         log.info("Initializing Receiver")
-        self.socket = socket
+        self.transport = transport
         self.connected = False
-        self.observe = None
-        self.observed = []
+        self.running = False
+        self._stopped = threading.Event()
+        self._stopped.set()
+        self._inbound_thread = None
+        self.timeout = timeout
+        if delivery is None:
+            delivery = DeliveryEngine(transport.send)
+        self.delivery = delivery
+        self.dispatcher = dispatcher
+        self.inbound = inbound
+        self._buffer = bytearray(65535) if recv_into else None
+        self._buffer_lock = threading.Lock()
+        self.decoder = decoder
+        if topics is None:
+            topics = TopicRegistry()
+        self.topics = topics
+        self.predefined = predefined
+        self.routes = routes
+        # round trip time of the gateway, sampled on every kind of ack
+        self.rtt = self.delivery.rtt
+        self.correlations = Correlations(self.rtt)
 
         self.in_msgs = {}
-        self.out_msgs = {}
+        self.out_msgs = self.delivery.out_msgs
 
-        self.puback = Pubacks()
         self.pubrec = Pubrecs()
-        self.pubrel = Pubrels()
-        self.pubcomp = Pubcomps()
 
         self._actions = {
             PUBACK: self._process_puback,
@@ -58,132 +191,333 @@ class Receivers:
             ADVERTISE: self._process_advertise,
         }
 
-    def lookfor(self, msg_type):
-        self.observe = msg_type
+    def lookfor(self, msg_type, msg_id=None):
+        """
+        Start waiting for a packet, before sending the request it answers
 
-    def waitfor(self, msg_type, msg_id=None):
-        msg = None
-        count = 0
-        while True:
-            while len(self.observed) > 0:
-                msg = self.observed.pop(0)
-                if msg.mh.msg_type == msg_type and \
-                   (msg_id is None or msg.msg_id == msg_id):
-                    break
-                else:
-                    msg = None
-            if msg is not None:
-                break
-            time.sleep(0.2)
-            count += 1
-            if count == 25:
-                msg = None
-                break
-        self.observe = None
-        return msg
+        Returns:
+            a Future completed with the packet
+        """
+        return self.correlations.expect(msg_type, msg_id)
 
-    def receive(self, callback=None):
-        packet = None
+    def waitfor(self, msg_type, msg_id=None, timeout=None):
+        """
+        Wait for a packet registered with lookfor, or for the next one of
+        msg_type and msg_id if it was not
+
+        When the receiver thread is not running, packets are read here
+        until the expected one arrives.
+
+        Returns:
+            the packet, or None after timeout seconds
+        """
+        timeout = self.timeout if timeout is None else timeout
+        future = self.correlations.expect(msg_type, msg_id)
+        try:
+            if not self.wait([future], timeout):
+                log.warning(
+                    f'Timed out waiting for {packet_names[msg_type]} {msg_id}'
+                )
+                return None
+            return future.result()
+        finally:
+            self.correlations.discard(msg_type, msg_id)
+
+    def wait(self, futures, timeout):
+        """
+        Wait until at least one of futures is completed, reading packets
+        here when the receiver thread is not running
+
+        Returns:
+            the set of completed futures, empty after timeout seconds
+        """
+        if self.running:
+            done, _ = wait(futures, timeout, FIRST_COMPLETED)
+            return done
+
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                done = {future for future in futures if future.done()}
+                remaining = deadline - time.monotonic()
+                if done or remaining <= 0:
+                    return done
+                self.transport.settimeout(remaining)
+                self.receive()
+        finally:
+            self.transport.settimeout(None)
+
+    def read(self):
+        """
+        Returns:
+            (packet, address) of the next datagram, None on socket timeout
+        """
         try:
-            val = get_packet(self.socket)
-            packet, address = unpack_packet(*val)
+            if self._buffer is None:
+                received = get_packet(self.transport)
+                # empty, as when the transport is shut down
+                return None if received is None else unpack_packet(*received)
+            # threads waiting for acks read too while the receiver thread
+            # is not running
+            with self._buffer_lock:
+                received = get_packet_into(self.transport, self._buffer)
+                if received is None:
+                    return None
+                packet, address = unpack_packet(*received)
+                packet.detach()
+                return packet, address
         except Exception:
             if sys.exc_info()[0] != socket.timeout:
                 log.error(f'Unexpected exception {sys.exc_info()}')
-                raise sys.exc_info()
-        if packet is None:
+                raise
+
+    def read_many(self):
+        """
+        Read every datagram already received by the transport, waiting
+        for the first one, when batching is enabled
+
+        Returns:
+            [(packet, address)]
+        """
+        if not self.transport.batch:
+            received = self.read()
+            return [] if received is None else [received]
+
+        packets = []
+        for datagram, address in self.transport.recv_many():
+            if not datagram:
+                continue
+            try:
+                packets.append(unpack_packet(datagram, address))
+            except Exception:
+                log.exception(f'Undecodable datagram from {address}')
+        return packets
+
+    def receive(self, callback=None):
+        received = self.read()
+        if received is None:
             time.sleep(0.1)
             return
+        return self.process(*received, callback)
 
+    def process(self, packet, address, callback=None):
         log.debug(f'Chegou Packet: {packet}')
 
-        if self.observe == packet.mh.msg_type:
+        if self.correlations.resolve(packet):
             log.debug(f'Observed packet: {packet}')
-            self.observed.append(packet)
 
         elif packet.mh.msg_type in self._actions:
             self._actions[packet.mh.msg_type](packet, callback, address)
 
+        elif packet.mh.msg_type in Correlations.ACKS:
+            # late or duplicate, after the waiter got its ack or gave up
+            log.warning(f'No request waiting for {packet}, dropped')
+
         else:
             raise Exception(f'Unexpected packet {packet}')
         return packet
 
+    def start(self, callback):
+        """
+        Run the receive loop with callback in a new thread
+        """
+        self.running = True
+        self._stopped.clear()
+        _thread.start_new_thread(self, (callback,))
+
+    def join(self, timeout=None):
+        """
+        Wait for the receive loop, and the inbound thread, to end once the
+        transport is closed
+
+        Returns:
+            False if they still run after timeout seconds
+        """
+        return self._stopped.wait(timeout)
+
     def __call__(self, callback):
+        self.running = True
+        self._stopped.clear()
+        if self.inbound is not None:
+            self._inbound_thread = threading.Thread(
+                target=self._process_inbound, args=(callback,),
+                name='mqttsn-inbound', daemon=True
+            )
+            self._inbound_thread.start()
         try:
             while True:
-                self.receive(callback)
+                for packet, address in self.read_many():
+                    if self.inbound is None:
+                        self.process(packet, address, callback)
+                    else:
+                        self.inbound.put(packet, address)
         except Exception:
             if sys.exc_info()[0] != socket.error:
                 log.error(f"Unexpected exception {sys.exc_info()}")
                 traceback.print_exc()
+        finally:
+            self.running = False
+            if self.inbound is not None:
+                self.inbound.close()
+                self._inbound_thread.join()
+            self._stopped.set()
+
+    def _process_inbound(self, callback):
+        while True:
+            received = self.inbound.get()
+            if received is None:
+                return
+            try:
+                self.process(*received, callback)
+            except Exception:
+                log.exception(f'Processing {received[0]} failed')
 
     def _process_advertise(self, packet, callback, address):
         if hasattr(callback, "advertise"):
             callback.advertise(address, packet.gw_id, packet.duration)
 
     def _process_register(self, packet, callback, *args):
+        self.topics.add(packet.topic_id, packet.topic_name)
+        regack = Regacks()
+        regack.topic_id = packet.topic_id
+        regack.msg_id = packet.msg_id
+        self.transport.send(regack.pack())
         if callback and hasattr(callback, "register"):
             callback.register(packet.topic_id, packet.topic_name)
 
     def _process_puback(self, packet, callback, *args):
         log.debug("Check if we are expecting a puback")
-        if packet.msg_id in self.out_msgs and \
-           self.out_msgs[packet.msg_id].flags.qos == 1:
-            del self.out_msgs[packet.msg_id]
+        if self.delivery.puback(packet.msg_id) is not None:
             if hasattr(callback, "published"):
                 callback.published(packet.msg_id)
         else:
-            raise Exception(
+            # late or duplicate, after a retransmission or a give up
+            log.warning(
                 f'No qos 1 message with message id {packet.msg_id} sent'
             )
 
     def _process_pubrec(self, packet, callback, *args):
-        if packet.msg_id in self.out_msgs:
-            self.pubrel.msg_id = packet.msg_id
-            self.socket.send(self.pubrel.pack())
+        if not self.delivery.pubrec(packet.msg_id):
+            log.warning(f'PUBREC received for unknown msg_id: {packet.msg_id}')
+
+    def _dispatch(self, packet, data, deliver):
+        """
+        Hand data, or what the decoder made of it, to deliver(data)
+        """
+        if self.decoder is None:
+            self._deliver(packet, deliver, data)
         else:
-            raise Exception(
-                'PUBREC received for unknown msg_id: {packet.msg_id}'
+            self.decoder.submit(
+                data, functools.partial(self._deliver, packet, deliver)
             )
 
+    def _deliver(self, packet, deliver, data):
+        if self.dispatcher is None:
+            deliver(data)
+        else:
+            self.dispatcher.dispatch(topic_key(packet), deliver, data)
+
+    def _send_puback(self, msg_id):
+        puback = Pubacks()
+        puback.msg_id = msg_id
+        self.transport.send(puback.pack())
+
+    def _send_pubcomp(self, msg_id):
+        pubcomp = Pubcomps()
+        pubcomp.msg_id = msg_id
+        self.transport.send(pubcomp.pack())
+
+    def _message_arrived(self, packet, callback, topic_name, data, qos):
+        """
+        Returns:
+            True once the message was handled, and can be acknowledged
+        """
+        retain, msg_id = packet.flags.retain, packet.msg_id
+        if self.routes:
+            # qos -1 topic names come in the payload, not the topic id
+            key = topic_key(packet) if qos != -1 else None
+            handlers = self.routes.match(topic_name, key)
+            if handlers:
+                handled = True
+                for handler in handlers:
+                    if handler(topic_name, data, qos, retain,
+                               msg_id) is False:
+                        handled = False
+                return handled
+        return callback.message_arrived(topic_name, data, qos, retain, msg_id)
+
+    def _deliver_qos0(self, packet, callback, topicname, qos, data):
+        self._message_arrived(packet, callback, topicname, data, qos)
+
+    def _deliver_qos1(self, packet, callback, data):
+        if self._message_arrived(
+           packet, callback, packet.topic_name, data, 1):
+            self._send_puback(packet.msg_id)
+
+    def _deliver_qos2(self, pub, callback, data):
+        if self._message_arrived(pub, callback, pub.topic_name, data, 2):
+            self._send_pubcomp(pub.msg_id)
+        else:
+            # handed to the callback again on the next PUBREL
+            self.in_msgs[pub.msg_id] = pub
+
     def _process_pubrel(self, packet, callback, *args):
         log.debug("Release qos 2 publication to client, & send PUBCOMP")
         msgid = packet.msg_id
         if msgid not in self.in_msgs:
             pass  # what should we do here?
         else:
-            pub = self.in_msgs[packet.msg_id]
-            if callback is None or \
-                callback.message_arrived(
-                    pub.topic_name, pub.data, 2,
-                    pub.flags.retain, pub.msg_id):
-                del self.in_msgs[packet.msg_id]
-                self.pubcomp.msg_id = packet.msg_id
-                self.socket.send(self.pubcomp.pack())
+            # while being handled it is out of in_msgs, so a retransmitted
+            # PUBREL does not deliver it twice
+            pub = self.in_msgs.pop(packet.msg_id)
             if callback is None:
+                self._send_pubcomp(packet.msg_id)
                 return (pub.topic_name, pub.data, 2,
                         pub.flags.retain, pub.msg_id)
+            self._dispatch(
+                pub, pub.data,
+                functools.partial(self._deliver_qos2, pub, callback)
+            )
 
     def _process_pubcomp(self, packet, callback, *args):
         """
         Finished with this message id
         """
-        if packet.msg_id in self.out_msgs:
-            del self.out_msgs[packet.msg_id]
+        if self.delivery.pubcomp(packet.msg_id) is not None:
             if hasattr(callback, "published"):
                 callback.published(packet.msg_id)
         else:
-            raise Exception(
+            log.warning(
                 f'PUBCOMP received for unknown msg_id: {packet.msg_id}'
             )
 
+    def _resolve_topic(self, packet):
+        """
+        Set the topic_name of packet, decoded to str, from its normal or
+        predefined topic id, or from its short name
+
+        The name is a str whatever the QoS, so that message_arrived and the
+        routes see the same name for every message of a topic.
+        """
+        topics = None
+        if packet.flags.topic_id_type == TOPIC_NORMAL:
+            topics = self.topics
+        elif packet.flags.topic_id_type == TOPIC_PREDEFINED:
+            topics = self.predefined
+        topic_name = packet.topic_name
+        if topics is not None:
+            topic_name = topics.name(packet.topic_id) or topic_name
+        packet.topic_name = to_bytes(topic_name).decode('utf-8')
+
     def _process_publish(self, packet, callback, *args):
         """
         Finished with this message id
         """
+        if packet.flags.qos != 3:
+            self._resolve_topic(packet)
         if packet.flags.qos in [0, 3]:
             qos = packet.flags.qos
-            topicname = packet.topic_name.decode('utf-8')
+            topicname = to_bytes(packet.topic_name).decode('utf-8')
             data = packet.data
             log.debug(f'DATA ON MQTTSN: {data}')
             if qos == 3:
@@ -197,23 +531,20 @@ class Receivers:
                 return (topicname, data, qos,
                         packet.flags.retain, packet.msg_id)
             else:
-                callback.message_arrived(
-                    topicname, data, qos,
-                    packet.flags.retain, packet.msg_id
-                )
+                self._dispatch(packet, data, functools.partial(
+                    self._deliver_qos0, packet, callback, topicname, qos
+                ))
         elif packet.flags.qos == 1:
             if callback is None:
                 return (packet.topic_name, packet.data, 1,
                         packet.flags.retain, packet.msg_id)
             else:
-                if callback.message_arrived(
-                   packet.topic_name, packet.data, 1,
-                   packet.flags.retain, packet.msg_id):
-
-                    self.puback.msg_id = packet.msg_id
-                    self.socket.send(self.puback.pack())
+                self._dispatch(
+                    packet, packet.data,
+                    functools.partial(self._deliver_qos1, packet, callback)
+                )
 
         elif packet.flags.qos == 2:
             self.in_msgs[packet.msg_id] = packet
             self.pubrec.msg_id = packet.msg_id
-            self.socket.send(self.pubrec.pack())
+            self.transport.send(self.pubrec.pack())
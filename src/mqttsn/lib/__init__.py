@@ -0,0 +1,5 @@
+# Importing the packet modules registers their classes for decoding
+from . import (  # noqa: F401
+    advertises, connects, disconnects, gw, ping, publishes, registers,
+    subscribes, unsubscribes, will
+)
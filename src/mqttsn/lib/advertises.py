@@ -1,10 +1,18 @@
+import struct
+
 from .packets import Packets
+from .objects import register_packet
 from .message_headers import MessageHeaders
 from .names import ADVERTISE
-from .helpers import write_int_16, read_int_16
 
 
+@register_packet(ADVERTISE)
 class Advertises(Packets):
+    __slots__ = ('gw_id', 'duration')
+
+    # GwId and Duration
+    fields = struct.Struct('!BH')
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(ADVERTISE)
         self.gw_id = 0         # 1 byte
@@ -12,16 +20,13 @@ class Advertises(Packets):
         if buffer:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = chr(self.gw_id) + write_int_16(self.duration)
-        return self.mh.pack(len(buffer)) + buffer
+    def field_values(self):
+        return (self.gw_id, self.duration)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == ADVERTISE
-        self.gw_id = buffer[pos]
-        pos += 1
-        self.duration = read_int_16(buffer[pos:])
+        self.gw_id, self.duration = self.fields.unpack_from(buffer, pos)
 
     def __str__(self):
         return f'{self.mh}, gw_id {self.gw_id}, duration {self.duration}'
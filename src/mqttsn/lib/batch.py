@@ -0,0 +1,242 @@
+"""
+Columnar encoding and decoding of PUBLISH datagrams with NumPy
+
+Bursts of small PUBLISH packets can be decoded in one go into column
+arrays instead of one Publishes object per datagram, and column arrays can
+be encoded in one go into PUBLISH datagrams laid out back to back in one
+buffer. numpy is an optional dependency, installed with the `numpy` extra.
+"""
+from collections import namedtuple
+
+from .names import PUBLISH
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+# Flags, TopicId and MsgId following the fixed header
+PUBLISH_FIELDS_SIZE = 5
+
+PublishBatch = namedtuple('PublishBatch', [
+    'buffer',          # uint8 array every offset below refers to
+    'index',           # position of each PUBLISH in the input
+    'msg_type',
+    'flags',
+    'topic_id',
+    'msg_id',
+    'payload_offset',
+    'payload_length',
+    'payload',         # (n, payload_width) uint8 matrix, or None
+])
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError(
+            'numpy is required for batch encoding and decoding, '
+            'install mqttsn[numpy]'
+        )
+
+
+def unpack_publishes(datagrams, offsets=None, payload_width=None,
+                     lengths=None):
+    """
+    Decode the PUBLISH packets of a burst of datagrams into columns
+
+    Args:
+        datagrams: either a list of datagrams, or a single bytes-like
+            buffer holding concatenated datagrams, in which case offsets
+            is required
+        offsets: start of each datagram in the concatenated buffer
+        payload_width (int): when given, payloads are also copied into a
+            fixed width matrix, truncated or zero padded
+        lengths: length of each datagram in the concatenated buffer, by
+            default each one ends where the next one in the buffer starts
+
+    Returns:
+        PublishBatch with one row per PUBLISH. Other message types and
+        truncated or malformed datagrams are skipped; `index` maps each row
+        back to its datagram.
+    """
+    _require_numpy()
+    if offsets is None:
+        lengths = np.fromiter(
+            (len(datagram) for datagram in datagrams),
+            dtype=np.int64, count=len(datagrams)
+        )
+        data = np.frombuffer(b''.join(datagrams), dtype=np.uint8)
+        ends = np.cumsum(lengths)
+        offsets = ends - lengths
+    else:
+        data = np.frombuffer(datagrams, dtype=np.uint8)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if lengths is None:
+            # a length field running past the end of its datagram must not
+            # read into the next one
+            order = np.argsort(offsets, kind='stable')
+            ends = np.empty(len(offsets), dtype=np.int64)
+            ends[order[:-1]] = offsets[order[1:]]
+            ends[order[-1:]] = len(data)
+        else:
+            ends = offsets + np.asarray(lengths, dtype=np.int64)
+        ends = np.minimum(ends, len(data))
+
+    return _unpack_columns(data, offsets, ends, payload_width)
+
+
+def _unpack_columns(data, offsets, ends, payload_width):
+    size = len(data)
+    if size == 0 or len(offsets) == 0:
+        return _empty_batch(data, payload_width)
+
+    def take(positions):
+        # reads past the end are clipped here and discarded by valid below
+        return data[np.minimum(positions, size - 1)].astype(np.int64)
+
+    available = ends - offsets
+    b0 = take(offsets)
+    is_long = b0 == 1
+    header = np.where(is_long, 4, 2)
+    length = np.where(
+        is_long, (take(offsets + 1) << 8) | take(offsets + 2), b0
+    )
+    msg_type = take(offsets + header - 1)
+
+    valid = (offsets >= 0) & (available >= header) & \
+        (msg_type == PUBLISH) & \
+        (length >= header + PUBLISH_FIELDS_SIZE) & (length <= available)
+
+    index = np.flatnonzero(valid)
+    fields = offsets[index] + header[index]
+    payload_offset = fields + PUBLISH_FIELDS_SIZE
+    payload_length = length[index] - header[index] - PUBLISH_FIELDS_SIZE
+
+    payload = None
+    if payload_width is not None:
+        columns = np.arange(payload_width)
+        positions = payload_offset[:, None] + columns
+        payload = np.where(
+            columns < payload_length[:, None],
+            data[np.minimum(positions, size - 1)], 0
+        ).astype(np.uint8)
+
+    return PublishBatch(
+        buffer=data,
+        index=index,
+        msg_type=msg_type[index].astype(np.uint8),
+        flags=data[fields],
+        topic_id=(take(fields + 1) << 8 | take(fields + 2)).astype(np.uint16),
+        msg_id=(take(fields + 3) << 8 | take(fields + 4)).astype(np.uint16),
+        payload_offset=payload_offset,
+        payload_length=payload_length,
+        payload=payload,
+    )
+
+
+def _empty_batch(data, payload_width):
+    empty = np.zeros(0, dtype=np.int64)
+    payload = None
+    if payload_width is not None:
+        payload = np.zeros((0, payload_width), dtype=np.uint8)
+    return PublishBatch(
+        buffer=data,
+        index=empty,
+        msg_type=empty.astype(np.uint8),
+        flags=empty.astype(np.uint8),
+        topic_id=empty.astype(np.uint16),
+        msg_id=empty.astype(np.uint16),
+        payload_offset=empty,
+        payload_length=empty,
+        payload=payload,
+    )
+
+
+def pack_payloads(layout, columns):
+    """
+    Lay the rows of column arrays out as fixed size binary payloads
+
+    Args:
+        layout: numpy structured dtype of a payload, such as
+            np.dtype([('value', '>f4'), ('timestamp', '>u8')])
+        columns: {field name: array} with every field of layout
+
+    Returns:
+        (n, layout.itemsize) uint8 matrix, a payload per row
+    """
+    _require_numpy()
+    layout = np.dtype(layout)
+    count = len(columns[layout.names[0]])
+    rows = np.zeros(count, dtype=layout)
+    for name in layout.names:
+        rows[name] = columns[name]
+    return rows.view(np.uint8).reshape(count, layout.itemsize)
+
+
+def pack_publishes(topic_id, payload, flags=0, msg_id=0):
+    """
+    Encode one PUBLISH per row of payload into a single buffer
+
+    Args:
+        topic_id: topic id of each PUBLISH, an array or one for all
+        payload: (n, width) uint8 matrix of the payloads, see pack_payloads
+        flags (int): flags octet of every PUBLISH
+        msg_id: msg_id of each PUBLISH, an array or one for all
+
+    Returns:
+        (buffer, offsets, length): the uint8 array holding the datagrams
+        back to back, the start of each of them, as unpack_publishes
+        takes, and their common length
+    """
+    _require_numpy()
+    payload = np.asarray(payload, dtype=np.uint8)
+    if payload.ndim != 2:
+        raise Exception('payload must be a (n, width) matrix')
+    count, width = payload.shape
+
+    header = 2
+    length = header + PUBLISH_FIELDS_SIZE + width
+    if length >= 256:
+        header = 4
+        length += 2
+    if length > 65535:
+        raise Exception(f'PUBLISH of {length} octets is too long')
+
+    rows = np.empty((count, length), dtype=np.uint8)
+    if header == 2:
+        rows[:, 0] = length
+    else:
+        rows[:, 0] = 1
+        rows[:, 1] = length >> 8
+        rows[:, 2] = length & 0xFF
+    rows[:, header - 1] = PUBLISH
+    rows[:, header] = flags
+    topic_id = np.broadcast_to(np.asarray(topic_id, dtype=np.uint16), count)
+    rows[:, header + 1] = topic_id >> 8
+    rows[:, header + 2] = topic_id & 0xFF
+    msg_id = np.broadcast_to(np.asarray(msg_id, dtype=np.uint16), count)
+    rows[:, header + 3] = msg_id >> 8
+    rows[:, header + 4] = msg_id & 0xFF
+    rows[:, header + PUBLISH_FIELDS_SIZE:] = payload
+
+    offsets = np.arange(count, dtype=np.int64) * length
+    return rows.reshape(-1), offsets, length
+
+
+def set_msg_ids(buffer, offsets, length, msg_id):
+    """
+    Overwrite in place the msg_id of PUBLISHes encoded by pack_publishes
+
+    Args:
+        buffer: the buffer pack_publishes returned
+        offsets: start of each PUBLISH to change
+        length (int): common length of the PUBLISHes
+        msg_id: msg_id of each PUBLISH, an array or one for all
+    """
+    _require_numpy()
+    header = 2 if length < 256 else 4
+    at = np.asarray(offsets, dtype=np.int64) + header + 3
+    msg_id = np.broadcast_to(np.asarray(msg_id, dtype=np.uint16), len(at))
+    buffer[at] = msg_id >> 8
+    buffer[at + 1] = msg_id & 0xFF
@@ -1,11 +1,20 @@
+import struct
+
 from .packets import Packets
+from .objects import register_packet
 from .message_headers import MessageHeaders
 from .names import CONNECT, CONNACK
 from .flags import Flags
-from .helpers import write_int_16, read_int_16, chr_
+from .helpers import to_bytes
 
 
+@register_packet(CONNECT)
 class Connects(Packets):
+    __slots__ = ('flags', 'protocol_id', 'duration', 'client_id')
+
+    # Flags, ProtocolId and Duration
+    fields = struct.Struct('!BBH')
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(CONNECT)
         self.flags = Flags()
@@ -15,23 +24,20 @@ class Connects(Packets):
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = self.flags.pack()
-        buffer += chr_(self.protocol_id)
-        buffer += write_int_16(self.duration)
-        buffer += self.client_id.encode()
-        return self.mh.pack(len(buffer)) + buffer
+    def field_values(self):
+        return (int(self.flags), self.protocol_id, self.duration)
+
+    def tail(self):
+        return to_bytes(self.client_id)
 
     def unpack(self, buffer):
-        buffer = buffer.decode('utf-8')
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == CONNECT
-        pos += self.flags.unpack(buffer[pos])
-        self.protocol_id = buffer[pos]
-        pos += 1
-        self.duration = read_int_16(buffer[pos:])
-        pos += 2
-        self.client_id = buffer[pos:]
+        self.flags.unpack(buffer, pos)
+        _, self.protocol_id, self.duration = \
+            self.fields.unpack_from(buffer, pos)
+        pos += self.fields.size
+        self.client_id = bytes(buffer[pos:self.mh.length]).decode('utf-8')
 
     def __str__(self):
         return f'{self.mh}, flags {self.flags}, protocol_id ' \
@@ -47,16 +53,21 @@ class Connects(Packets):
         return rc
 
 
+@register_packet(CONNACK)
 class Connacks(Packets):
+    __slots__ = ('return_code',)
+
+    # ReturnCode
+    fields = struct.Struct('!B')
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(CONNACK)
         self.return_code = 0  # 1 byte
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = chr(self.return_code)
-        return self.mh.pack(len(buffer)) + buffer
+    def field_values(self):
+        return (self.return_code,)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
@@ -1,31 +1,30 @@
 from .packets import Packets
+from .objects import register_packet
 from .names import DISCONNECT
-from .helpers import write_int_16, read_int_16
+from .helpers import read_int_16, INT_16
 from .message_headers import MessageHeaders
 
 
+@register_packet(DISCONNECT)
 class Disconnects(Packets):
+    __slots__ = ('duration',)
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(DISCONNECT)
         self.duration = None
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        if self.duration:
-            buf = self.mh.pack(2) + write_int_16(self.duration)
-        else:
-            buf = self.mh.pack(0)
-        return buf
+    def tail(self):
+        return INT_16.pack(self.duration) if self.duration else b''
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == DISCONNECT
-        buf = buffer[pos:self.mh.length]
-        if buf == b'':
+        if pos >= self.mh.length:
             self.duration = None
         else:
-            self.duration = read_int_16(buffer[pos:])
+            self.duration = read_int_16(buffer, pos)
 
     def __str__(self):
         buf = str(self.mh)
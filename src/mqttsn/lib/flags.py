@@ -1,22 +1,51 @@
 from .helpers import chr_
 
+# Flags octet layout: DUP | QoS | Retain | Will | CleanSession | TopicIdType
+DUP, QOS, RETAIN, WILL, CLEAN_SESSION, TOPIC_ID_TYPE = range(6)
+
+
+def _decode(b0):
+    return (
+        ((b0 >> 7) & 0x01) == 1,
+        (b0 >> 5) & 0x03,
+        ((b0 >> 4) & 0x01) == 1,
+        ((b0 >> 3) & 0x01) == 1,
+        ((b0 >> 2) & 0x01) == 1,
+        b0 & 0x03
+    )
+
+
+# Every possible flags octet decoded once, indexed by the octet value
+DECODED = tuple(_decode(b0) for b0 in range(256))
+
+
+def _field(index, shift, mask):
+    def fget(self):
+        return DECODED[self._value][index]
+
+    def fset(self, value):
+        self._value = (self._value & ~(mask << shift)) | \
+            ((int(value) & mask) << shift)
+
+    return property(fget, fset)
+
 
 class Flags:
-    def __init__(self):
-        self.dup = False          # 1 bit
-        self.qos = 0              # 2 bits
-        self.retain = False       # 1 bit
-        self.will = False         # 1 bit
-        self.clean_session = True  # 1 bit
-        self.topic_id_type = 0      # 2 bits
+    __slots__ = ('_value',)
+
+    def __init__(self, value=0x04):
+        # clean_session is set by default
+        self._value = value
+
+    dup = _field(DUP, 7, 0x01)                       # 1 bit
+    qos = _field(QOS, 5, 0x03)                       # 2 bits
+    retain = _field(RETAIN, 4, 0x01)                 # 1 bit
+    will = _field(WILL, 3, 0x01)                     # 1 bit
+    clean_session = _field(CLEAN_SESSION, 2, 0x01)   # 1 bit
+    topic_id_type = _field(TOPIC_ID_TYPE, 0, 0x03)   # 2 bits
 
     def __eq__(self, flags):
-        return self.dup == flags.dup and \
-            self.qos == flags.qos and \
-            self.retain == flags.retain and \
-            self.will == flags.will and \
-            self.clean_session == flags.clean_session and \
-            self.topic_id_type == flags.topic_id_type
+        return self._value == flags._value
 
     def __ne__(self, flags):
         return not self.__eq__(flags)
@@ -30,29 +59,23 @@ class Flags:
                f'will {self.will}, clean_session {self.clean_session}, ' \
                f'topic_id_type {self.topic_id_type} >'
 
+    def __int__(self):
+        """
+        Returns:
+            the flags octet as an int
+        """
+        return self._value
+
     def pack(self):
         """
         Pack data into string buffer ready for transmission down socket
         """
-        return chr_(
-            (self.dup << 7) |
-            (self.qos << 5) |
-            (self.retain << 4) |
-            (self.will << 3) |
-            (self.clean_session << 2) |
-            self.topic_id_type
-        )
+        return chr_(self._value)
 
-    def unpack(self, buffer):
+    def unpack(self, buffer, offset=0):
         """
         Unpack data from string buffer into separate fields
         """
-        b0 = buffer[0]
-        self.dup = ((b0 >> 7) & 0x01) == 1
-        self.qos = (b0 >> 5) & 0x03
-        self.retain = ((b0 >> 4) & 0x01) == 1
-        self.will = ((b0 >> 3) & 0x01) == 1
-        self.clean_session = ((b0 >> 2) & 0x01) == 1
-        self.topic_id_type = (b0 & 0x03)
+        self._value = buffer[offset]
 
         return 1
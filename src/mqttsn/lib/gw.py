@@ -1,31 +1,44 @@
+import struct
+
 from .packets import Packets
+from .objects import register_packet
 from .message_headers import MessageHeaders
-from .helpers import write_int_16, read_int_16, chr_
+from .helpers import read_int_16, INT_16
 from .names import SEARCHGW, GWINFO
 
 
+@register_packet(SEARCHGW)
 class SearchGWs(Packets):
+    __slots__ = ('radius',)
+
+    # Radius
+    fields = INT_16
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(SEARCHGW)
         self.radius = 0
         if buffer:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = write_int_16(self.radius)
-        buffer = self.mh.pack(len(buffer)) + buffer
-        return buffer
+    def field_values(self):
+        return (self.radius,)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == SEARCHGW
-        self.radius = read_int_16(buffer[pos:])
+        self.radius = read_int_16(buffer, pos)
 
     def __str__(self):
         return f'{self.mh}, radius {self.radius}'
 
 
+@register_packet(GWINFO)
 class GWInfos(Packets):
+    __slots__ = ('gw_id', 'gw_add')
+
+    # GwId
+    fields = struct.Struct('!B')
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(GWINFO)
         self.gw_id = 0    # 1 byte
@@ -33,12 +46,11 @@ class GWInfos(Packets):
         if buffer:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = chr_(self.gw_id)
-        if self.gw_add:
-            buffer += self.gw_add
-        buffer = self.mh.pack(len(buffer)) + buffer
-        return buffer
+    def field_values(self):
+        return (self.gw_id,)
+
+    def tail(self):
+        return self.gw_add or b''
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
@@ -48,7 +60,7 @@ class GWInfos(Packets):
         if pos >= self.mh.length:
             self.gw_add = None
         else:
-            self.gw_add = buffer[pos:]
+            self.gw_add = bytes(buffer[pos:self.mh.length])
 
     def __str__(self):
         buf = f'{self.mh} radius {self.gw_id}'
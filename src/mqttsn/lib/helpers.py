@@ -1,15 +1,19 @@
 import logging
-from .objects import get_objects
+import struct
+
+from .objects import decode
 
 log = logging.getLogger('helpers')
 
+INT_16 = struct.Struct('!H')
+
 
 def write_int_16(length):
     return chr_(length // 256) + chr_(length % 256)
 
 
-def read_int_16(buf):
-    return buf[0] * 256 + buf[1]
+def read_int_16(buf, offset=0):
+    return INT_16.unpack_from(buf, offset)[0]
 
 
 def get_packet(a_socket):
@@ -30,11 +34,24 @@ def get_packet(a_socket):
     return buf, address
 
 
-def message_type(buf):
-    if buf[0] == 1:
-        msgtype = buf[3]
+def get_packet_into(a_socket, buffer):
+    """
+    Receive the next packet into buffer, a preallocated bytearray
+
+    Returns:
+        (memoryview over the datagram in buffer, address)
+    """
+    nbytes, address = a_socket.recvfrom_into(buffer)
+    if nbytes == 0:
+        return None
+    return memoryview(buffer)[:nbytes], address
+
+
+def message_type(buf, offset=0):
+    if buf[offset] == 1:
+        msgtype = buf[offset + 3]
     else:
-        msgtype = buf[1]
+        msgtype = buf[offset + 1]
     return msgtype
 
 
@@ -49,17 +66,28 @@ def chr_(val):
     return bytes((val,))
 
 
-def readUTF(buffer):
-    length = read_int_16(buffer)
-    return buffer[2:2 + length]
+def to_bytes(value):
+    """
+    Returns:
+        value encoded as utf-8 if it is a str, otherwise value itself
+    """
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    return value
+
+
+def readUTF(buffer, offset=0):
+    length = read_int_16(buffer, offset)
+    return bytes(buffer[offset + 2:offset + 2 + length])
 
 
 def unpack_packet(*args):
+    """
+    Decode a received datagram into its packet object
+
+    The buffer is wrapped in a memoryview so the packet classes can read
+    their fields by offset without copying the datagram; see
+    `Publishes.data` for how the payload is materialized.
+    """
     buffer, address = args
-    if message_type(buffer) is not None:
-        log.debug(f'{buffer} {message_type} {address}')
-        packet = get_objects()[message_type(buffer)]()
-        packet.unpack(buffer)
-    else:
-        packet = None
-    return packet, address
+    return decode(buffer), address
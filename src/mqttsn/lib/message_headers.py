@@ -1,14 +1,22 @@
 import logging
+import struct
 
 from .names import packet_names
+from .objects import get_packet_class
 from .helpers import write_int_16, read_int_16, chr_
 
 log = logging.getLogger('message_headers')
 MAX_BUF_SIZE = 65535
 SMALL_BUF_SIZE = 256
 
+# Length and MsgType, for the 1 and 3 octet length forms
+SHORT_HEADER = struct.Struct('!BB')
+LONG_HEADER = struct.Struct('!BHB')
+
 
 class MessageHeaders:
+    __slots__ = ('length', 'msg_type')
+
     def __init__(self, msg_type):
         self.length = 0
         self.msg_type = msg_type
@@ -21,7 +29,11 @@ class MessageHeaders:
         Returns:
             printable stresentation of our data
         """
-        return f'length {self.length}, {packet_names[self.msg_type]}'
+        if self.msg_type < len(packet_names):
+            name = packet_names[self.msg_type]
+        else:
+            name = getattr(get_packet_class(self.msg_type), '__name__', None)
+        return f'length {self.length}, {name}'
 
     def pack(self, bufferlen):
         """
@@ -31,6 +43,44 @@ class MessageHeaders:
         buffer = self.encode_length(bufferlen) + chr_(self.msg_type)
         return buffer
 
+    def pack_into(self, buffer, offset, bufferlen):
+        """
+        Pack the header into a writable buffer (bytearray or memoryview)
+
+        Args:
+            buffer: destination buffer
+            offset (int): position of the length octet in buffer
+            bufferlen (int): payload length
+
+        Returns:
+            number of bytes written
+        """
+        self.length = 1  # msg_type byte
+        size = self.header_size(bufferlen)
+        if size == SHORT_HEADER.size:
+            SHORT_HEADER.pack_into(
+                buffer, offset, size + bufferlen, self.msg_type
+            )
+        else:
+            LONG_HEADER.pack_into(
+                buffer, offset, 1, size + bufferlen, self.msg_type
+            )
+        return size
+
+    def header_size(self, bufferlen):
+        """
+        Returns:
+            size of the packed header (length and msg_type octets) for a
+            payload of bufferlen bytes, either 2 or 4
+        """
+        length = 1 + bufferlen
+        if self._is_short_buffer(length + 1) or length == 1:
+            return SHORT_HEADER.size
+        elif self._is_long_buffer(length + 3):
+            return LONG_HEADER.size
+        else:
+            raise Exception(str("Invalid buffer size " + str(length)))
+
     def encode_length(self, bufferlen):
         """
         Encode buffer length according to MQTT-SN fixed length specification
@@ -62,20 +112,23 @@ class MessageHeaders:
         else:
             raise Exception(str("Invalid buffer size "+str(length)))
 
-    def unpack(self, buffer):
+    def unpack(self, buffer, offset=0):
         """
         Unpack data from string buffer into separate fields
+
+        Returns:
+            position of the first byte after the header, relative to offset
         """
-        (self.length, _bytes) = self.decode(buffer)
-        self.msg_type = buffer[_bytes]
+        (self.length, _bytes) = self.decode(buffer, offset)
+        self.msg_type = buffer[offset + _bytes]
         return _bytes + 1
 
-    def decode(self, buffer):
-        value = buffer[0]
+    def decode(self, buffer, offset=0):
+        value = buffer[offset]
         if value > 1:
             n_bytes = 1
         else:
-            value = read_int_16(buffer[1:])
+            value = read_int_16(buffer, offset + 1)
             n_bytes = 3
         return (value, n_bytes)
 
@@ -1,25 +1,70 @@
+from .names import packet_names
+
+# Packet classes indexed by message type, filled by register_packet
+PACKET_TYPES = [None] * 256
+
+
+def register_packet(msg_type, packet_class=None, replace=False):
+    """
+    Register the class used to decode packets of msg_type
+
+    Can be used directly or as a class decorator, which is how the packet
+    modules in this package register themselves when they are imported:
+
+        @register_packet(ENCAPSULATED)
+        class Encapsulations(Packets):
+            ...
+
+    Args:
+        msg_type (int): message type octet, 0-255
+        packet_class: class built with the datagram as its only argument
+        replace (bool): allow overriding an already registered class
+
+    Returns:
+        packet_class, or a decorator when packet_class is omitted
+    """
+    def decorator(packet_class):
+        current = PACKET_TYPES[msg_type]
+        if current is not None and current is not packet_class \
+           and not replace:
+            raise Exception(
+                f'Message type {msg_type} already registered to '
+                f'{current.__name__}'
+            )
+        PACKET_TYPES[msg_type] = packet_class
+        return packet_class
+
+    if packet_class is None:
+        return decorator
+    return decorator(packet_class)
+
+
+def unregister_packet(msg_type):
+    PACKET_TYPES[msg_type] = None
+
+
+def get_packet_class(msg_type):
+    return PACKET_TYPES[msg_type]
+
+
 def get_objects():
-    from .advertises import Advertises
-    from .connects import Connects, Connacks
-    from .gw import SearchGWs, GWInfos
-    from .registers import Registers, Regacks
-    from .publishes import Publishes, Pubcomps, Pubacks, Pubrecs, Pubrels
-    from .subscribes import Subacks, Subscribes
-    from .unsubscribes import Unsubacks, Unsubscribes
-    from .ping import Pingresps, Pingreqs
-    from .disconnects import Disconnects
-    from .will import (
-        WillMsgs, WillTopics, WillTopicReqs, WillMsgReqs, WillTopicUpds,
-        WillTopicResps, WillMsgUpds, WillMsgResps
-    )
-
-    return [
-        Advertises, SearchGWs, GWInfos, None,
-        Connects, Connacks,
-        WillTopicReqs, WillTopics, WillMsgReqs, WillMsgs,
-        Registers, Regacks,
-        Publishes, Pubacks, Pubcomps, Pubrecs, Pubrels, None,
-        Subscribes, Subacks, Unsubscribes, Unsubacks,
-        Pingreqs, Pingresps, Disconnects, None,
-        WillTopicUpds, WillTopicResps, WillMsgUpds, WillMsgResps
-    ]
+    """
+    Returns:
+        the packet classes of the MQTT-SN message types, indexed by type
+    """
+    return PACKET_TYPES[:len(packet_names)]
+
+
+def decode(buffer):
+    """
+    Decode a datagram into its packet object
+
+    The message type is read straight from the fixed header, in both the
+    1 and the 3 octet length forms, and looked up in PACKET_TYPES.
+    """
+    view = memoryview(buffer)
+    msg_type = view[3] if view[0] == 1 else view[1]
+    packet_class = PACKET_TYPES[msg_type]
+    if packet_class is None:
+        raise Exception(f'Unknown message type {msg_type}')
+    return packet_class(view)
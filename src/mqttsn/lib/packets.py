@@ -1,4 +1,12 @@
+import struct
+
+
 class Packets:
+    __slots__ = ('mh',)
+
+    # Fixed size fields following the msg_type octet, see field_values()
+    fields = struct.Struct('')
+
     def __str__(self):
         return str(self.mh)
 
@@ -9,7 +17,61 @@ class Packets:
         return not self.__eq__(packet)
 
     def pack(self):
-        return self.mh.pack(0)
+        buffer = bytearray(self.packed_size())
+        self.pack_into(buffer)
+        return bytes(buffer)
+
+    def pack_into(self, buffer, offset=0):
+        """
+        Pack the whole packet into a writable buffer in a single pass
+
+        Args:
+            buffer: destination bytearray or memoryview, which must have
+                at least packed_size() bytes available from offset
+            offset (int): where the packet starts in buffer
+
+        Returns:
+            number of bytes written
+        """
+        tail = self.tail()
+        size = self.fields.size
+        pos = offset + self.mh.pack_into(buffer, offset, size + len(tail))
+        self.fields.pack_into(buffer, pos, *self.field_values())
+        pos += size
+        end = pos + len(tail)
+        buffer[pos:end] = tail
+        return end - offset
+
+    def detach(self):
+        """
+        Stop referring to the buffer the packet was unpacked from, so it
+        can be reused for the next datagram
+        """
+
+    def packed_size(self):
+        bufferlen = self.body_size()
+        return self.mh.header_size(bufferlen) + bufferlen
+
+    def body_size(self):
+        """
+        Returns:
+            size of the packet without its length and msg_type octets
+        """
+        return self.fields.size + len(self.tail())
+
+    def field_values(self):
+        """
+        Returns:
+            values to be packed with the fields struct
+        """
+        return ()
+
+    def tail(self):
+        """
+        Returns:
+            variable length bytes that follow the fixed size fields
+        """
+        return b''
 
     def unpack(self):
         raise NotImplementedError
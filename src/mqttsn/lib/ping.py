@@ -1,29 +1,27 @@
 from .packets import Packets
+from .objects import register_packet
 from .names import PINGREQ, PINGRESP
 from .message_headers import MessageHeaders
-from .helpers import chr_
+from .helpers import to_bytes
 
 
+@register_packet(PINGREQ)
 class Pingreqs(Packets):
+    __slots__ = ('client_id',)
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(PINGREQ)
         self.client_id = None
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        if self.client_id:
-            buf = self.mh.pack(len(self.client_id)) + chr_(self.client_id)
-        else:
-            buf = self.mh.pack(0)
-        return buf
+    def tail(self):
+        return to_bytes(self.client_id) if self.client_id else b''
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == PINGREQ
-        self.client_id = buffer[pos:self.mh.length]
-        if self.client_id == '':
-            self.client_id = None
+        self.client_id = bytes(buffer[pos:self.mh.length]) or None
 
     def __str__(self):
         buf = str(self.mh)
@@ -36,7 +34,10 @@ class Pingreqs(Packets):
             self.client_id == packet.client_id
 
 
+@register_packet(PINGRESP)
 class Pingresps(Packets):
+    __slots__ = ()
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(PINGRESP)
         if buffer is not None:
@@ -1,9 +1,11 @@
 import logging
+import struct
 
 from .packets import Packets
+from .objects import register_packet
 from .flags import Flags
 from .message_headers import MessageHeaders
-from .helpers import write_int_16, read_int_16, chr_
+from .helpers import to_bytes, INT_16
 from .names import (
     PUBLISH, TOPIC_PREDEFINED, TOPIC_NORMAL, TOPIC_SHORTNAME, PUBREC,
     PUBREL, PUBCOMP, PUBACK
@@ -12,7 +14,13 @@ from .names import (
 log = logging.getLogger('publishes')
 
 
+@register_packet(PUBLISH)
 class Publishes(Packets):
+    __slots__ = ('flags', 'topic_id', 'topic_name', 'msg_id', '_data')
+
+    # Flags, TopicID and MsgID
+    fields = struct.Struct('!BHH')
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(PUBLISH)
         self.flags = Flags()
@@ -23,52 +31,56 @@ class Publishes(Packets):
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
+    @property
+    def data(self):
         """
-        Specification:
-               Length   MsgType   Flags   TopicID   MsgID   Data
-              (octet 0)   (1)      (2)     (3-4)    (5-6)   (7-n)
+        Returns:
+            the payload. When the packet was unpacked from a memoryview the
+            payload stays a view over the received datagram until it is
+            first read here, and is only then copied into bytes.
         """
+        self.detach()
+        return self._data
 
-        # Flags byte (1)
-        buffer = self.flags.pack()
+    def detach(self):
+        if isinstance(self._data, memoryview):
+            self._data = self._data.tobytes()
 
-        # TopicID bytes (2)
-        if self.flags.topic_id_type in [TOPIC_NORMAL, TOPIC_PREDEFINED, 3]:
-            log.debug(f'Topic id: {self.topic_id}')
-            buffer += write_int_16(self.topic_id)
-        elif self.flags.topic_id_type == TOPIC_SHORTNAME:
-            buffer += (self.topic_name + "  ")[0:2].encode('utf-8')
+    @data.setter
+    def data(self, value):
+        self._data = value
 
-        # MsgID bytes (2)
-        buffer += write_int_16(self.msg_id)
-
-        # Data bytes (n)
-        data = self.data
-        buffer += data if isinstance(data, bytes) else data.encode('utf-8')
-
-        # Length + MsgType bytes
-        buffer = self.mh.pack(len(buffer)) + buffer
-        print(f'BUFFER: {buffer}')
+    def field_values(self):
+        """
+        Specification:
+               Length   MsgType   Flags   TopicID   MsgID   Data
+              (octet 0)   (1)      (2)     (3-4)    (5-6)   (7-n)
+        """
+        if self.flags.topic_id_type == TOPIC_SHORTNAME:
+            topic_name = to_bytes(self.topic_name)
+            topic_id, = INT_16.unpack((topic_name + b'  ')[0:2])
+        else:
+            topic_id = self.topic_id
+        return (int(self.flags), topic_id, self.msg_id)
 
-        return buffer
+    def tail(self):
+        return to_bytes(self._data)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == PUBLISH
-        pos += self.flags.unpack(buffer[pos:])
+        self.flags.unpack(buffer, pos)
 
+        _, topic_id, self.msg_id = self.fields.unpack_from(buffer, pos)
         self.topic_id = 0
-        self.topic_name = str("").encode()
+        self.topic_name = b''
         if self.flags.topic_id_type in [TOPIC_NORMAL, TOPIC_PREDEFINED]:
-            self.topic_id = read_int_16(buffer[pos:])
+            self.topic_id = topic_id
         elif self.flags.topic_id_type == TOPIC_SHORTNAME:
-            self.topic_name = str(buffer[pos:pos + 2]).encode()
+            self.topic_name = bytes(buffer[pos + 1:pos + 3])
 
-        pos += 2
-        self.msg_id = read_int_16(buffer[pos:])
-        pos += 2
-        self.data = buffer[pos:self.mh.length]
+        pos += self.fields.size
+        self.data = memoryview(buffer)[pos:self.mh.length]
 
     def __str__(self):
         return f'{self.mh}, flags {self.flags}, topic_id {self.topic_id}, ' \
@@ -82,20 +94,125 @@ class Publishes(Packets):
             self.data == packet.data
 
 
+class PublishTemplate:
+    """
+    PUBLISHes to one topic with the same flags, encoded once
+
+    The msg_type, flags and topic id octets are fixed, so a message only
+    needs its length, msg_id and payload packed behind them.
+
+    Args:
+        flags (int): flags octet
+        topic_id (int): topic id, or the two octets of a short name
+    """
+    __slots__ = ('flags', 'topic_id')
+
+    # Length, MsgType, Flags, TopicId and MsgId, for both length forms
+    short = struct.Struct('!BBBHH')
+    long = struct.Struct('!BHBBHH')
+
+    def __init__(self, flags, topic_id):
+        self.flags = flags
+        self.topic_id = topic_id
+
+    @classmethod
+    def of(cls, publish):
+        """
+        Returns:
+            the template of the topic and flags of the Publishes publish
+        """
+        flags, topic_id, _ = publish.field_values()
+        return cls(flags, topic_id)
+
+    def pack(self, payload, msg_id=0, flags=None):
+        """
+        Returns:
+            the PUBLISH of payload, with the flags octet flags instead of
+            the template's when given
+        """
+        payload = to_bytes(payload)
+        if flags is None:
+            flags = self.flags
+        length = self.short.size + len(payload)
+        if length < 256:
+            return self.short.pack(
+                length, PUBLISH, flags, self.topic_id, msg_id
+            ) + payload
+        return self.long.pack(
+            1, length + 2, PUBLISH, flags, self.topic_id, msg_id
+        ) + payload
+
+
+class PreparedPublishes:
+    """
+    A QoS 1 or 2 message of a PublishTemplate, tracked by the
+    DeliveryEngine like a Publishes
+    """
+    __slots__ = ('template', 'flags', 'msg_id', 'data')
+
+    def __init__(self, template, msg_id, data):
+        self.template = template
+        self.flags = Flags(template.flags)
+        self.msg_id = msg_id
+        self.data = data
+
+    def pack(self):
+        return self.template.pack(self.data, self.msg_id, int(self.flags))
+
+    def __str__(self):
+        return f'PUBLISH, flags {self.flags}, topic_id ' \
+               f'{self.template.topic_id}, msg_id {self.msg_id}, ' \
+               f'data {self.data}'
+
+
+class PackedPublishes:
+    """
+    A QoS 1 or 2 PUBLISH already packed, as batch.pack_publishes does,
+    tracked by the DeliveryEngine like a Publishes
+    """
+    __slots__ = ('packet', 'flags', 'msg_id')
+
+    def __init__(self, packet, msg_id):
+        self.packet = packet
+        self.flags = Flags(packet[self._flags_at()])
+        self.msg_id = msg_id
+
+    def _flags_at(self):
+        return 4 if self.packet[0] == 1 else 2
+
+    def pack(self):
+        flags_at = self._flags_at()
+        if self.packet[flags_at] == int(self.flags):
+            return self.packet
+        packet = bytearray(self.packet)
+        packet[flags_at] = int(self.flags)  # DUP set for a retransmission
+        return bytes(packet)
+
+    def __str__(self):
+        return f'PUBLISH, flags {self.flags}, msg_id {self.msg_id}, ' \
+               f'packet {self.packet}'
+
+
+@register_packet(PUBREC)
 class Pubrecs(Packets):
+    __slots__ = ('msg_id',)
+
+    # MsgId
+    fields = INT_16
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(PUBREC)
         self.msg_id = 0
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        return self.mh.pack(2) + write_int_16(self.msg_id)
+    def field_values(self):
+        return (self.msg_id,)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == PUBREC
-        self.msg_id = read_int_16(buffer[pos:])
+        self.msg_id, = self.fields.unpack_from(buffer, pos)
 
     def __str__(self):
         return f'{self.mh}, msg_id {self.msg_id}'
@@ -104,20 +221,26 @@ class Pubrecs(Packets):
         return Packets.__eq__(self, packet) and self.msg_id == packet.msg_id
 
 
+@register_packet(PUBREL)
 class Pubrels(Packets):
+    __slots__ = ('msg_id',)
+
+    # MsgId
+    fields = INT_16
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(PUBREL)
         self.msg_id = 0
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        return self.mh.pack(2) + write_int_16(self.msg_id)
+    def field_values(self):
+        return (self.msg_id,)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == PUBREL
-        self.msg_id = read_int_16(buffer[pos:])
+        self.msg_id, = self.fields.unpack_from(buffer, pos)
 
     def __str__(self):
         return f'{self.mh}, msg_id {self.msg_id}'
@@ -126,20 +249,26 @@ class Pubrels(Packets):
         return Packets.__eq__(self, packet) and self.msg_id == packet.msg_id
 
 
+@register_packet(PUBCOMP)
 class Pubcomps(Packets):
+    __slots__ = ('msg_id',)
+
+    # MsgId
+    fields = INT_16
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(PUBCOMP)
         self.msg_id = 0
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        return self.mh.pack(2) + write_int_16(self.msg_id)
+    def field_values(self):
+        return (self.msg_id,)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == PUBCOMP
-        self.msg_id = read_int_16(buffer[pos:])
+        self.msg_id, = self.fields.unpack_from(buffer, pos)
 
     def __str__(self):
         return f'{self.mh}, msg_id {self.msg_id}'
@@ -148,7 +277,13 @@ class Pubcomps(Packets):
         return Packets.__eq__(self, packet) and self.msg_id == packet.msg_id
 
 
+@register_packet(PUBACK)
 class Pubacks(Packets):
+    __slots__ = ('topic_id', 'msg_id', 'return_code')
+
+    # TopicID, MsgID and ReturnCode
+    fields = struct.Struct('!HHB')
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(PUBACK)
         self.topic_id = 0
@@ -157,19 +292,14 @@ class Pubacks(Packets):
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = write_int_16(self.topic_id) + \
-            write_int_16(self.msg_id) + chr_(self.return_code)
-        return self.mh.pack(len(buffer)) + buffer
+    def field_values(self):
+        return (self.topic_id, self.msg_id, self.return_code)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == PUBACK
-        self.topic_id = read_int_16(buffer[pos:])
-        pos += 2
-        self.msg_id = read_int_16(buffer[pos:])
-        pos += 2
-        self.return_code = buffer[pos]
+        self.topic_id, self.msg_id, self.return_code = \
+            self.fields.unpack_from(buffer, pos)
 
     def __str__(self):
         return f'{self.mh}, topic_id {self.topic_id}, msg_id {self.msg_id}, ' \
@@ -1,10 +1,19 @@
+import struct
+
 from .packets import Packets
+from .objects import register_packet
 from .message_headers import MessageHeaders
-from .helpers import write_int_16, read_int_16
+from .helpers import to_bytes
 from .names import REGISTER, REGACK
 
 
+@register_packet(REGISTER)
 class Registers(Packets):
+    __slots__ = ('topic_id', 'msg_id', 'topic_name')
+
+    # TopicId and MsgId
+    fields = struct.Struct('!HH')
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(REGISTER)
         self.topic_id = 0
@@ -13,19 +22,18 @@ class Registers(Packets):
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = write_int_16(self.topic_id) + \
-            write_int_16(self.msg_id) + self.topic_name
-        return self.mh.pack(len(buffer)) + buffer
+    def field_values(self):
+        return (self.topic_id, self.msg_id)
+
+    def tail(self):
+        return to_bytes(self.topic_name)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == REGISTER
-        self.topic_id = read_int_16(buffer[pos:])
-        pos += 2
-        self.msg_id = read_int_16(buffer[pos:])
-        pos += 2
-        self.topic_name = buffer[pos:self.mh.length]
+        self.topic_id, self.msg_id = self.fields.unpack_from(buffer, pos)
+        pos += self.fields.size
+        self.topic_name = bytes(buffer[pos:self.mh.length])
 
     def __str__(self):
         return f'{self.mh}, topic_id {self.topic_id}, msg_id {self.msg_id}, ' \
@@ -38,7 +46,13 @@ class Registers(Packets):
             self.topic_name == packet.topic_name
 
 
+@register_packet(REGACK)
 class Regacks(Packets):
+    __slots__ = ('topic_id', 'msg_id', 'return_code')
+
+    # TopicId, MsgId and ReturnCode
+    fields = struct.Struct('!HHB')
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(REGACK)
         self.topic_id = 0
@@ -47,19 +61,14 @@ class Regacks(Packets):
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = write_int_16(self.topic_id) + \
-            write_int_16(self.msg_id) + chr(self.return_code)
-        return self.mh.pack(len(buffer)) + buffer
+    def field_values(self):
+        return (self.topic_id, self.msg_id, self.return_code)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == REGACK
-        self.topic_id = read_int_16(buffer[pos:])
-        pos += 2
-        self.msg_id = read_int_16(buffer[pos:])
-        pos += 2
-        self.return_code = buffer[pos]
+        self.topic_id, self.msg_id, self.return_code = \
+            self.fields.unpack_from(buffer, pos)
 
     def __str__(self):
         return f'{self.mh}, topic_id {self.topic_id}, msg_id {self.msg_id}, ' \
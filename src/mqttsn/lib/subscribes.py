@@ -1,9 +1,11 @@
 import logging
+import struct
 
 from .packets import Packets
+from .objects import register_packet
 from .message_headers import MessageHeaders
 from .flags import Flags
-from .helpers import write_int_16, read_int_16
+from .helpers import read_int_16, to_bytes, INT_16
 from .names import (
     SUBSCRIBE, TOPIC_PREDEFINED, TOPIC_NORMAL,
     TOPIC_SHORTNAME, SUBACK
@@ -13,7 +15,13 @@ from .names import (
 log = logging.getLogger('subscribes')
 
 
+@register_packet(SUBSCRIBE)
 class Subscribes(Packets):
+    __slots__ = ('flags', 'msg_id', 'topic_id', 'topic_name')
+
+    # Flags and MsgId
+    fields = struct.Struct('!BH')
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(SUBSCRIBE)
         self.flags = Flags()
@@ -23,26 +31,30 @@ class Subscribes(Packets):
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = self.flags.pack() + write_int_16(self.msg_id)
+    def field_values(self):
+        return (int(self.flags), self.msg_id)
+
+    def tail(self):
         if self.flags.topic_id_type == TOPIC_PREDEFINED:
-            buffer += write_int_16(self.topic_id)
+            return INT_16.pack(self.topic_id)
         elif self.flags.topic_id_type in [TOPIC_NORMAL, TOPIC_SHORTNAME]:
-            buffer += bytes(self.topic_name.encode('utf-8'))
-        return self.mh.pack(len(buffer)) + buffer
+            return to_bytes(self.topic_name)
+        return b''
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == SUBSCRIBE
-        pos += self.flags.unpack(buffer[pos:])
-        self.msg_id = read_int_16(buffer[pos:])
-        pos += 2
+        self.flags.unpack(buffer, pos)
+        _, self.msg_id = self.fields.unpack_from(buffer, pos)
+        pos += self.fields.size
         self.topic_id = 0
         self.topic_name = ""
         if self.flags.topic_id_type == TOPIC_PREDEFINED:
-            self.topic_id = read_int_16(buffer[pos:])
-        elif self.flags.topic_id_type in [TOPIC_NORMAL, TOPIC_SHORTNAME]:
-            self.topic_name = buffer[pos:pos + 2]
+            self.topic_id = read_int_16(buffer, pos)
+        elif self.flags.topic_id_type == TOPIC_NORMAL:
+            self.topic_name = bytes(buffer[pos:self.mh.length])
+        elif self.flags.topic_id_type == TOPIC_SHORTNAME:
+            self.topic_name = bytes(buffer[pos:pos + 2])
 
     def __str__(self):
         buffer = f'{self.mh}, flags {self.flags}, msg_id {self.msg_id}'
@@ -65,7 +77,13 @@ class Subscribes(Packets):
             self.msg_id == packet.msg_id and rc
 
 
+@register_packet(SUBACK)
 class Subacks(Packets):
+    __slots__ = ('flags', 'topic_id', 'msg_id', 'return_code')
+
+    # Flags, TopicId, MsgId and ReturnCode
+    fields = struct.Struct('!BHHB')
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(SUBACK)
         self.flags = Flags()  # 1 byte
@@ -75,20 +93,15 @@ class Subacks(Packets):
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = self.flags.pack() + write_int_16(self.topic_id) + \
-            write_int_16(self.msg_id) + chr(self.return_code)
-        return self.mh.pack(len(buffer)) + buffer
+    def field_values(self):
+        return (int(self.flags), self.topic_id, self.msg_id, self.return_code)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == SUBACK
-        pos += self.flags.unpack(buffer[pos:])
-        self.topic_id = read_int_16(buffer[pos:])
-        pos += 2
-        self.msg_id = read_int_16(buffer[pos:])
-        pos += 2
-        self.return_code = buffer[pos]
+        self.flags.unpack(buffer, pos)
+        _, self.topic_id, self.msg_id, self.return_code = \
+            self.fields.unpack_from(buffer, pos)
 
     def __str__(self):
         return f'{self.mh}, flags {self.flags}, topic_id {self.topic_id},' \
@@ -1,11 +1,20 @@
+import struct
+
 from .packets import Packets
+from .objects import register_packet
 from .message_headers import MessageHeaders
-from .helpers import write_int_16, read_int_16
+from .helpers import read_int_16, to_bytes, INT_16
 from .flags import Flags
 from .names import UNSUBACK, UNSUBSCRIBE
 
 
+@register_packet(UNSUBSCRIBE)
 class Unsubscribes(Packets):
+    __slots__ = ('flags', 'msg_id', 'topic_id', 'topic_name')
+
+    # Flags and MsgId
+    fields = struct.Struct('!BH')
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(UNSUBSCRIBE)
         self.flags = Flags()
@@ -15,30 +24,32 @@ class Unsubscribes(Packets):
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = self.flags.pack() + write_int_16(self.msg_id)
+    def field_values(self):
+        return (int(self.flags), self.msg_id)
+
+    def tail(self):
         if self.flags.topic_id_type == 0:
-            buffer += bytes(self.topic_name.encode('utf-8'))
+            return to_bytes(self.topic_name)
         elif self.flags.topic_id_type == 1:
-            buffer += write_int_16(self.topic_id)
+            return INT_16.pack(self.topic_id)
         elif self.flags.topic_id_type == 2:
-            buffer += bytes(self.topic_id.encode('utf-8'))
-        return self.mh.pack(len(buffer)) + buffer
+            return to_bytes(self.topic_name)
+        return b''
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == UNSUBSCRIBE
-        pos += self.flags.unpack(buffer[pos:])
-        self.msg_id = read_int_16(buffer[pos:])
-        pos += 2
+        self.flags.unpack(buffer, pos)
+        _, self.msg_id = self.fields.unpack_from(buffer, pos)
+        pos += self.fields.size
         self.topic_id = 0
         self.topic_name = ""
         if self.flags.topic_id_type == 0:
-            self.topic_name = buffer[pos:self.mh.length]
+            self.topic_name = bytes(buffer[pos:self.mh.length])
         elif self.flags.topic_id_type == 1:
-            self.topic_id = read_int_16(buffer[pos:])
-        elif self.flags.topic_id_type == 3:
-            self.topic_id = buffer[pos:pos+2]
+            self.topic_id = read_int_16(buffer, pos)
+        elif self.flags.topic_id_type == 2:
+            self.topic_name = bytes(buffer[pos:pos + 2])
 
     def __str__(self):
         buffer = f'{self.mh}, flags {self.flags}, msg_id {self.msg_id}'
@@ -58,20 +69,26 @@ class Unsubscribes(Packets):
                  self.topic_name == packet.topic_name
 
 
+@register_packet(UNSUBACK)
 class Unsubacks(Packets):
+    __slots__ = ('msg_id',)
+
+    # MsgId
+    fields = INT_16
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(UNSUBACK)
         self.msg_id = 0
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        return self.mh.pack(2) + write_int_16(self.msg_id)
+    def field_values(self):
+        return (self.msg_id,)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == UNSUBACK
-        self.msg_id = read_int_16(buffer[pos:])
+        self.msg_id, = self.fields.unpack_from(buffer, pos)
 
     def __str__(self):
         return f'{self.mh}, msg_id {self.msg_id}'
@@ -1,6 +1,9 @@
+import struct
+
 from .packets import Packets
+from .objects import register_packet
 from .message_headers import MessageHeaders
-from .helpers import write_int_16, read_int_16, chr_
+from .helpers import read_int_16, to_bytes, INT_16
 from .flags import Flags
 from .names import (
     WILLMSG, WILLTOPIC, WILLMSGREQ, WILLMSGUPD, WILLMSGRESP,
@@ -8,7 +11,10 @@ from .names import (
 )
 
 
+@register_packet(WILLTOPICREQ)
 class WillTopicReqs(Packets):
+    __slots__ = ()
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(WILLTOPICREQ)
         if buffer is not None:
@@ -20,7 +26,13 @@ class WillTopicReqs(Packets):
         assert self.mh.msg_type == WILLTOPICREQ
 
 
+@register_packet(WILLTOPIC)
 class WillTopics(Packets):
+    __slots__ = ('flags', 'will_topic')
+
+    # Flags
+    fields = struct.Struct('!B')
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(WILLTOPIC)
         self.flags = Flags()
@@ -28,15 +40,17 @@ class WillTopics(Packets):
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = self.flags.pack() + chr_(self.will_topic)
-        return self.mh.pack(len(buffer)) + buffer
+    def field_values(self):
+        return (int(self.flags),)
+
+    def tail(self):
+        return to_bytes(self.will_topic)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == WILLTOPIC
-        pos += self.flags.unpack(buffer[pos:])
-        self.will_topic = buffer[pos:self.mh.length]
+        pos += self.flags.unpack(buffer, pos)
+        self.will_topic = bytes(buffer[pos:self.mh.length])
 
     def __str__(self):
         return f'{self.mh}, flags {self.flags}, will_topic {self.will_topic}'
@@ -47,7 +61,10 @@ class WillTopics(Packets):
             self.will_topic == packet.will_topic
 
 
+@register_packet(WILLMSGREQ)
 class WillMsgReqs(Packets):
+    __slots__ = ()
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(WILLMSGREQ)
         if buffer is not None:
@@ -59,20 +76,23 @@ class WillMsgReqs(Packets):
         assert self.mh.msg_type == WILLMSGREQ
 
 
+@register_packet(WILLMSG)
 class WillMsgs(Packets):
+    __slots__ = ('will_msg',)
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(WILLMSG)
         self.will_msg = ""
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        return self.mh.pack(len(self.will_msg)) + chr_(self.will_msg)
+    def tail(self):
+        return to_bytes(self.will_msg)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == WILLMSG
-        self.will_msg = buffer[pos:self.mh.length]
+        self.will_msg = bytes(buffer[pos:self.mh.length])
 
     def __str__(self):
         return f'{self.mh}, will_msg {self.will_msg}'
@@ -82,7 +102,13 @@ class WillMsgs(Packets):
             self.will_msg == packet.will_msg
 
 
+@register_packet(WILLTOPICUPD)
 class WillTopicUpds(Packets):
+    __slots__ = ('flags', 'will_topic')
+
+    # Flags
+    fields = struct.Struct('!B')
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(WILLTOPICUPD)
         self.flags = Flags()
@@ -90,15 +116,17 @@ class WillTopicUpds(Packets):
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = self.flags.pack() + chr_(self.will_topic)
-        return self.mh.pack(len(buffer)) + buffer
+    def field_values(self):
+        return (int(self.flags),)
+
+    def tail(self):
+        return to_bytes(self.will_topic)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == WILLTOPICUPD
-        pos += self.flags.unpack(buffer[pos:])
-        self.will_topic = buffer[pos:self.mh.length]
+        pos += self.flags.unpack(buffer, pos)
+        self.will_topic = bytes(buffer[pos:self.mh.length])
 
     def __str__(self):
         return f'{self.mh}, flags {self.flags}, will_topic {self.will_topic}'
@@ -109,20 +137,23 @@ class WillTopicUpds(Packets):
             self.will_topic == packet.will_topic
 
 
+@register_packet(WILLMSGUPD)
 class WillMsgUpds(Packets):
+    __slots__ = ('will_msg',)
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(WILLMSGUPD)
         self.will_msg = ""
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        return self.mh.pack(len(self.will_msg)) + chr_(self.will_msg)
+    def tail(self):
+        return to_bytes(self.will_msg)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == WILLMSGUPD
-        self.will_msg = buffer[pos:self.mh.length]
+        self.will_msg = bytes(buffer[pos:self.mh.length])
 
     def __str__(self):
         return f'{self.mh}, will_msg {self.will_msg}'
@@ -132,21 +163,26 @@ class WillMsgUpds(Packets):
             self.will_msg == packet.will_msg
 
 
+@register_packet(WILLTOPICRESP)
 class WillTopicResps(Packets):
+    __slots__ = ('return_code',)
+
+    # ReturnCode
+    fields = INT_16
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(WILLTOPICRESP)
         self.return_code = 0
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = write_int_16(self.return_code)
-        return self.mh.pack(len(buffer)) + buffer
+    def field_values(self):
+        return (self.return_code,)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == WILLTOPICRESP
-        self.return_code = read_int_16(buffer[pos:])
+        self.return_code = read_int_16(buffer, pos)
 
     def __str__(self):
         return f'{self.mh}, return_code {self.return_code}'
@@ -156,21 +192,26 @@ class WillTopicResps(Packets):
             self.return_code == packet.return_code
 
 
+@register_packet(WILLMSGRESP)
 class WillMsgResps(Packets):
+    __slots__ = ('return_code',)
+
+    # ReturnCode
+    fields = INT_16
+
     def __init__(self, buffer=None):
         self.mh = MessageHeaders(WILLMSGRESP)
         self.return_code = 0
         if buffer is not None:
             self.unpack(buffer)
 
-    def pack(self):
-        buffer = write_int_16(self.return_code)
-        return self.mh.pack(len(buffer)) + buffer
+    def field_values(self):
+        return (self.return_code,)
 
     def unpack(self, buffer):
         pos = self.mh.unpack(buffer)
         assert self.mh.msg_type == WILLMSGRESP
-        self.return_code = read_int_16(buffer[pos:])
+        self.return_code = read_int_16(buffer, pos)
 
     def __str__(self):
         return f'{self.mh}, return_code {self.return_code}'
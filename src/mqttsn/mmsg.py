@@ -0,0 +1,358 @@
+"""
+Many datagrams per system call with recvmmsg and sendmmsg
+
+On Linux the two calls are reached through ctypes, so no extension has to
+be compiled. Elsewhere, or when libc does not export them, the same
+functions fall back to one recvfrom or send per datagram.
+
+Setting up the message headers one ctypes field at a time costs more than
+the system calls it saves, so the headers are allocated once per
+BatchReceiver and BatchSender, and their fields are read and written for
+all datagrams at once with strided memoryview slices over their words.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import socket
+import struct
+import sys
+import threading
+from array import array
+from itertools import accumulate
+
+log = logging.getLogger('mmsg')
+
+MSG_TRUNC = 0x20
+MSG_WAITFORONE = 0x10000
+SOCKADDR_SIZE = 128  # sizeof(struct sockaddr_storage)
+
+
+class _Iovec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+
+class _Msghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(_Iovec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+
+class _Mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_hdr', _Msghdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        recvmmsg, sendmmsg = libc.recvmmsg, libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    recvmmsg.argtypes = [
+        ctypes.c_int, ctypes.POINTER(_Mmsghdr), ctypes.c_uint, ctypes.c_int,
+        ctypes.c_void_p
+    ]
+    sendmmsg.argtypes = [
+        ctypes.c_int, ctypes.POINTER(_Mmsghdr), ctypes.c_uint, ctypes.c_int
+    ]
+    return libc
+
+
+_libc = _load_libc()
+AVAILABLE = _libc is not None
+
+# pointers and sizes are written as 64-bit words, and the msg_len,
+# msg_namelen and msg_flags fields read and written as 32-bit ones
+WORD = 8
+HALF_WORD = 4
+_MSG_IOV = _Mmsghdr.msg_hdr.offset + _Msghdr.msg_iov.offset
+_MSG_IOVLEN = _Mmsghdr.msg_hdr.offset + _Msghdr.msg_iovlen.offset
+_MSG_NAME = _Mmsghdr.msg_hdr.offset + _Msghdr.msg_name.offset
+_MSG_NAMELEN = _Mmsghdr.msg_hdr.offset + _Msghdr.msg_namelen.offset
+_MSG_FLAGS = _Mmsghdr.msg_hdr.offset + _Msghdr.msg_flags.offset
+_MSG_LEN = _Mmsghdr.msg_len.offset
+_PACKED_HEADERS = AVAILABLE and \
+    ctypes.sizeof(ctypes.c_void_p) == ctypes.sizeof(ctypes.c_size_t) == \
+    array('Q').itemsize == WORD and array('I').itemsize == HALF_WORD and \
+    ctypes.sizeof(ctypes.c_int) == ctypes.sizeof(ctypes.c_uint) == HALF_WORD
+
+
+def _check(result):
+    if result < 0:
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code))
+    return result
+
+
+def decode_address(name, namelen):
+    """
+    Returns:
+        the address of a struct sockaddr, as socket.recvfrom returns it
+    """
+    if namelen < 2:
+        return None
+    family, = struct.unpack_from('=H', name, 0)
+    if family == socket.AF_INET:
+        port, = struct.unpack_from('!H', name, 2)
+        return socket.inet_ntop(socket.AF_INET, bytes(name[4:8])), port
+    if family == socket.AF_INET6:
+        port, flowinfo = struct.unpack_from('!HI', name, 2)
+        scope_id, = struct.unpack_from('=I', name, 24)
+        host = socket.inet_ntop(socket.AF_INET6, bytes(name[8:24]))
+        return host, port, flowinfo, scope_id
+    if family == getattr(socket, 'AF_UNIX', None):
+        path = bytes(name[2:namelen])
+        if path.startswith(b'\0'):
+            return path  # abstract namespace, bytes like socket.recvfrom
+        return path.split(b'\0', 1)[0].decode() or None
+    return None
+
+
+def _words(structures, fmt):
+    """
+    Returns:
+        a memoryview over the 'Q' or 'I' words of an array of ctypes
+        structures
+    """
+    return memoryview(structures).cast('B').cast(fmt)
+
+
+def _link_iovecs(msgs, iovecs, count):
+    # one iovec per message, for good
+    words = _words(msgs, 'Q')
+    stride = ctypes.sizeof(_Mmsghdr) // WORD
+    size = ctypes.sizeof(_Iovec)
+    first = ctypes.addressof(iovecs)
+    words[_MSG_IOV // WORD::stride] = array(
+        'Q', range(first, first + count * size, size)
+    )
+    words[_MSG_IOVLEN // WORD::stride] = array('Q', [1]) * count
+
+
+class BatchReceiver:
+    """
+    Receives up to count datagrams per recvmmsg call into preallocated
+    buffers of bufsize octets each
+
+    Args:
+        count (int): datagrams read per system call at most
+        bufsize (int): largest datagram accepted, longer ones are dropped
+    """
+    def __init__(self, count=64, bufsize=65535):
+        self.count = count
+        self.bufsize = bufsize
+        if not _PACKED_HEADERS:
+            return
+        self._data = ctypes.create_string_buffer(count * bufsize)
+        self._view = memoryview(self._data).cast('B')
+        self._names = ctypes.create_string_buffer(count * SOCKADDR_SIZE)
+        self._names_view = memoryview(self._names).cast('B')
+        self._iovecs = (_Iovec * count)()
+        self._msgs = (_Mmsghdr * count)()
+        _link_iovecs(self._msgs, self._iovecs, count)
+
+        data, names = ctypes.addressof(self._data), \
+            ctypes.addressof(self._names)
+        words = _words(self._iovecs, 'Q')
+        words[0::2] = array('Q', range(data, data + count * bufsize, bufsize))
+        words[1::2] = array('Q', [bufsize]) * count
+        words = _words(self._msgs, 'Q')
+        stride = ctypes.sizeof(_Mmsghdr) // WORD
+        words[_MSG_NAME // WORD::stride] = array(
+            'Q', range(names, names + count * SOCKADDR_SIZE, SOCKADDR_SIZE)
+        )
+
+        self._fields = _words(self._msgs, 'I')
+        self._stride = ctypes.sizeof(_Mmsghdr) // HALF_WORD
+        self._namelens = array('I', [SOCKADDR_SIZE]) * count
+        self._no_flags = array('I', [0]) * count
+        self._addresses = {}  # struct sockaddr -> decoded address
+
+    def recv(self, sock):
+        """
+        Wait for at least one datagram on the blocking socket sock, and
+        take the ones already queued with it
+
+        Returns:
+            [(datagram, address)], the datagrams as bytes
+        """
+        if not _PACKED_HEADERS:
+            return [sock.recvfrom(self.bufsize)]
+
+        fields, stride = self._fields, self._stride
+        fields[_MSG_NAMELEN // HALF_WORD::stride] = self._namelens
+        fields[_MSG_FLAGS // HALF_WORD::stride] = self._no_flags
+        while True:
+            received = _libc.recvmmsg(
+                sock.fileno(), self._msgs, self.count, MSG_WAITFORONE, None
+            )
+            if received >= 0 or ctypes.get_errno() != errno.EINTR:
+                break
+        _check(received)
+
+        end = received * stride
+        lengths = fields[_MSG_LEN // HALF_WORD:end:stride].tolist()
+        namelens = fields[_MSG_NAMELEN // HALF_WORD:end:stride].tolist()
+        truncated = [
+            i for i, flags in enumerate(
+                fields[_MSG_FLAGS // HALF_WORD:end:stride].tolist()
+            ) if flags & MSG_TRUNC
+        ]
+
+        view, names, addresses = self._view, self._names_view, \
+            self._addresses
+        datagrams = []
+        start = name = 0
+        for length, namelen in zip(lengths, namelens):
+            raw = names[name:name + namelen].tobytes()
+            address = addresses.get(raw)
+            if address is None:
+                if len(addresses) >= 1024:
+                    addresses.clear()
+                address = addresses[raw] = decode_address(raw, namelen)
+            datagrams.append((view[start:start + length].tobytes(), address))
+            start += self.bufsize
+            name += SOCKADDR_SIZE
+        for i in reversed(truncated):
+            log.warning(f'Dropped a datagram over {self.bufsize} octets')
+            del datagrams[i]
+        return datagrams
+
+
+class BatchSender:
+    """
+    Sends datagrams up to count per sendmmsg call, through message headers
+    allocated once and shared by the threads sending
+
+    Args:
+        count (int): datagrams sent per system call at most
+    """
+    def __init__(self, count=1024):
+        self.count = count
+        self._lock = threading.Lock()
+        if not _PACKED_HEADERS:
+            return
+        self._iovecs = (_Iovec * count)()
+        self._msgs = (_Mmsghdr * count)()
+        _link_iovecs(self._msgs, self._iovecs, count)
+        self._words = _words(self._iovecs, 'Q')
+
+    def send_many(self, sock, datagrams):
+        """
+        Send datagrams on the connected socket sock
+
+        Returns:
+            the number of datagrams sent
+        """
+        if not _PACKED_HEADERS:
+            for datagram in datagrams:
+                sock.send(datagram)
+            return len(datagrams)
+        if not datagrams:
+            return 0
+        # one copy of all datagrams is cheaper than a pointer to each
+        buffer = b''.join(datagrams)
+        lengths = array('Q', map(len, datagrams))
+        base = ctypes.cast(ctypes.c_char_p(buffer), ctypes.c_void_p).value
+        return self._send(sock, base, lengths)
+
+    def send_buffer(self, sock, buffer, offsets, lengths):
+        """
+        Send the datagrams starting at offsets in buffer, of lengths
+        octets, on the connected socket sock, without copying them out of
+        buffer
+
+        Returns:
+            the number of datagrams sent
+        """
+        view = memoryview(buffer).cast('B')
+        if not _PACKED_HEADERS:
+            for offset, length in zip(offsets, lengths):
+                sock.send(view[offset:offset + length])
+            return len(offsets)
+        if len(offsets) == 0:
+            return 0
+        if view.readonly:
+            view = memoryview(bytearray(view))
+        base = ctypes.addressof(ctypes.c_char.from_buffer(view))
+        return self._send(
+            sock, base, array('Q', map(int, lengths)),
+            array('Q', [base + int(offset) for offset in offsets])
+        )
+
+    def _send(self, sock, base, lengths, starts=None):
+        """
+        Send the datagrams of lengths octets at starts, consecutive from
+        base when starts is None
+        """
+        if starts is None:
+            starts = array('Q', accumulate(
+                array('Q', [base]) + lengths[:-1]
+            ))
+        words, sent = self._words, 0
+        with self._lock:
+            for first in range(0, len(lengths), self.count):
+                count = min(self.count, len(lengths) - first)
+                words[0:2 * count:2] = starts[first:first + count]
+                words[1:2 * count:2] = lengths[first:first + count]
+                sent += _sendmmsg(sock, self._msgs, count)
+        return sent
+
+
+_sender = None
+
+
+def _shared_sender():
+    global _sender
+    if _sender is None:
+        _sender = BatchSender()
+    return _sender
+
+
+def send_many(sock, datagrams):
+    """
+    Send datagrams on the connected socket sock, many per sendmmsg call
+
+    Returns:
+        the number of datagrams sent
+    """
+    return _shared_sender().send_many(sock, datagrams)
+
+
+def send_buffer(sock, buffer, offsets, lengths):
+    """
+    Send the datagrams starting at offsets in buffer, of lengths octets, on
+    the connected socket sock, without copying them out of buffer
+
+    Returns:
+        the number of datagrams sent
+    """
+    return _shared_sender().send_buffer(sock, buffer, offsets, lengths)
+
+
+def _sendmmsg(sock, msgs, count):
+    sent = 0
+    while sent < count:
+        result = _libc.sendmmsg(
+            sock.fileno(), ctypes.byref(msgs[sent]), count - sent, 0
+        )
+        if result < 0 and ctypes.get_errno() == errno.EINTR:
+            continue
+        sent += _check(result)
+    return sent
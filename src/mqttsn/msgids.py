@@ -0,0 +1,110 @@
+"""
+Allocation of the 16-bit message ids of outgoing requests
+
+Ids in use are marked in a bytearray covering the whole 1-65535 range. The
+next free id is searched from just after the last one handed out, with
+bytearray.find, so allocation does not depend on how many ids are taken
+until the id space is close to exhausted.
+"""
+
+import threading
+
+MAX_MSG_ID = 65535
+
+
+class NoMsgIdsLeft(Exception):
+    pass
+
+
+class MsgIds:
+    """
+    Args:
+        block (bool): when every id is in use, allocate waits for one to
+            be released instead of raising NoMsgIdsLeft
+        timeout (float): longest wait of a blocking allocate, in seconds,
+            None to wait forever
+    """
+    def __init__(self, block=True, timeout=None):
+        self.block = block
+        self.timeout = timeout
+        self._used = bytearray(MAX_MSG_ID + 1)
+        self._used[0] = 1  # 0 is the msg_id of qos 0 messages
+        self._in_use = 0
+        self._last = 0
+        self._lock = threading.Condition()
+
+    def __len__(self):
+        return self._in_use
+
+    def __contains__(self, msg_id):
+        return bool(self._used[msg_id])
+
+    @property
+    def occupancy(self):
+        """
+        Returns:
+            the fraction of the message ids in use
+        """
+        return self._in_use / MAX_MSG_ID
+
+    def allocate(self):
+        """
+        Returns:
+            a free message id, now in use until released
+        """
+        with self._lock:
+            if self._in_use >= MAX_MSG_ID:
+                self._wait(1)
+            msg_id = self._used.find(0, self._last + 1)
+            if msg_id < 0:
+                msg_id = self._used.find(0, 1)
+            self._used[msg_id] = 1
+            self._in_use += 1
+            self._last = msg_id
+            return msg_id
+
+    def allocate_many(self, count):
+        """
+        Take count ids at once, waiting until that many are free when
+        blocking
+
+        Returns:
+            the list of the free message ids, now in use until released
+        """
+        if count > MAX_MSG_ID:
+            raise NoMsgIdsLeft(f'Only {MAX_MSG_ID} message ids exist')
+        with self._lock:
+            if self._in_use + count > MAX_MSG_ID:
+                self._wait(count)
+            used, msg_id = self._used, self._last
+            msg_ids = []
+            for _ in range(count):
+                msg_id = used.find(0, msg_id + 1)
+                if msg_id < 0:
+                    msg_id = used.find(0, 1)
+                used[msg_id] = 1
+                msg_ids.append(msg_id)
+            self._in_use += count
+            self._last = msg_id
+            return msg_ids
+
+    def _wait(self, count):
+        if not self.block:
+            raise NoMsgIdsLeft(
+                f'{self._in_use} of {MAX_MSG_ID} message ids are in use, '
+                f'{count} needed'
+            )
+        if not self._lock.wait_for(
+                lambda: self._in_use + count <= MAX_MSG_ID, self.timeout):
+            raise NoMsgIdsLeft(
+                f'No message id released after {self.timeout}s'
+            )
+
+    def release(self, msg_id):
+        with self._lock:
+            if self._used[msg_id] and msg_id:
+                self._used[msg_id] = 0
+                self._in_use -= 1
+                # waiters need different numbers of ids, one woken alone
+                # may not be able to proceed while another could
+                self._lock.notify_all()
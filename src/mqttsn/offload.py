@@ -0,0 +1,128 @@
+"""
+Decoding payloads in worker processes
+
+A user supplied decoder, such as json.loads, runs in a process pool so
+that decoding many payloads uses more than one core. The payloads are not
+pickled to the workers: each one is copied into a slot of a shared memory
+segment, and only the name of the segment, the offset and the length go
+through the pool. Decoded objects come back in futures, and are delivered
+in the order the payloads arrived, whatever order the workers finish in.
+"""
+
+import logging
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+log = logging.getLogger('offload')
+
+_segments = {}  # segment name -> SharedMemory, in the worker processes
+
+
+def _decode_shared(decoder, name, offset, length):
+    segment = _segments.get(name)
+    if segment is None:
+        # the workers share the resource tracker of the parent, which
+        # unlinks the segment
+        segment = _segments[name] = SharedMemory(name)
+    return decoder(bytes(segment.buf[offset:offset + length]))
+
+
+def _decode(decoder, payload):
+    return decoder(payload)
+
+
+class PayloadDecoder:
+    """
+    Decodes payloads with decoder in worker processes
+
+    Submitting blocks while slots payloads are being decoded or waiting to
+    be delivered. Payloads longer than slot_size are pickled to the workers
+    instead. A payload the decoder raises on is logged and not delivered,
+    so a QoS 1 or 2 message carrying it is not acknowledged either.
+
+    Args:
+        decoder: picklable callable taking the payload bytes, a function
+            defined at the top level of a module
+        workers (int): number of processes, the CPU count by default
+        slots (int): payloads in flight at most
+        slot_size (int): octets of shared memory per payload
+    """
+    def __init__(self, decoder, workers=None, slots=64, slot_size=65536):
+        self.decoder = decoder
+        self.slot_size = slot_size
+        self.failures = 0  # payloads the decoder raised on
+        workers = workers or multiprocessing.cpu_count()
+        self._executor = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn')
+        )
+        # processes are otherwise started on demand, and the receiver
+        # would wait for them while the first payloads arrive
+        for future in [self._executor.submit(int) for _ in range(workers)]:
+            future.result()
+        self._memory = SharedMemory(create=True, size=slots * slot_size)
+        self._free = queue.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+        # (future, slot, deliver) in arrival order
+        self._order = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._deliver_in_order, name='mqttsn-offload', daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, payload, deliver):
+        """
+        Decode payload, then call deliver with the decoded object on the
+        delivery thread, after the payloads submitted before it
+        """
+        length = len(payload)
+        if length > self.slot_size:
+            slot = None
+            future = self._executor.submit(
+                _decode, self.decoder, bytes(payload)
+            )
+        else:
+            slot = self._free.get()
+            offset = slot * self.slot_size
+            self._memory.buf[offset:offset + length] = payload
+            future = self._executor.submit(
+                _decode_shared, self.decoder, self._memory.name, offset,
+                length
+            )
+        self._order.put((future, slot, deliver))
+
+    def _deliver_in_order(self):
+        while True:
+            item = self._order.get()
+            if item is None:
+                return
+            future, slot, deliver = item
+            try:
+                decoded = future.result()
+            except Exception:
+                self.failures += 1
+                log.exception('Decoding a payload failed, not delivering it')
+                continue
+            finally:
+                if slot is not None:
+                    self._free.put(slot)
+            try:
+                deliver(decoded)
+            except Exception:
+                log.exception('Delivering a decoded payload failed')
+
+    def __len__(self):
+        return self._order.qsize()
+
+    def shutdown(self):
+        """
+        Deliver the payloads already submitted, then stop the workers
+        """
+        self._order.put(None)
+        self._thread.join()
+        self._executor.shutdown()
+        self._memory.close()
+        self._memory.unlink()
@@ -0,0 +1,214 @@
+"""
+Predefined topic ids from a compiled catalogue
+
+Topic ids of type TOPIC_PREDEFINED are agreed with the gateway ahead of
+time. Their catalogue is compiled from CSV or YAML with
+
+    python -m mqttsn.predefined topics.csv topics.bin
+
+into a binary file that is memory mapped when opened, so opening it costs
+the same with ten entries or fifty thousand, and a lookup only reads the
+pages of the entries it needs.
+
+File layout, integers little endian:
+    header    magic b'MQSNPDT1', count and buckets as u32
+    ids       65536 u32, the offset of the name of each topic id, 0 when
+              the id is not predefined
+    buckets   (u32 name offset, u16 topic_id, u16 unused) each, a hash
+              table on the crc32 of the names with linear probing, a power
+              of two buckets of which at most half are used
+    names     u16 length and utf-8 octets of each name
+"""
+
+import argparse
+import csv
+import mmap
+import os
+import struct
+import zlib
+
+from .lib.helpers import to_bytes
+
+MAGIC = b'MQSNPDT1'
+HEADER = struct.Struct('<8sII')
+OFFSET = struct.Struct('<I')
+BUCKET = struct.Struct('<IHH')
+LENGTH = struct.Struct('<H')
+IDS_AT = HEADER.size
+BUCKETS_AT = IDS_AT + 65536 * OFFSET.size
+
+
+def load_csv(path):
+    """
+    Read topic_id,topic_name rows, skipping a header row
+
+    Returns:
+        {topic name: topic_id}
+    """
+    topics = {}
+    with open(path, newline='') as csv_file:
+        for number, row in enumerate(csv.reader(csv_file), 1):
+            if not row or row[0].startswith('#'):
+                continue
+            try:
+                topic_id = int(row[0])
+            except ValueError:
+                if number == 1:
+                    continue  # header
+                raise Exception(f'{path}:{number}: invalid topic id {row[0]}')
+            if len(row) < 2:
+                raise Exception(f'{path}:{number}: missing topic name')
+            _add(topics, row[1].strip(), topic_id, f'{path}:{number}')
+    return topics
+
+
+def load_yaml(path):
+    """
+    Read a mapping of topic names to topic ids
+
+    Returns:
+        {topic name: topic_id}
+    """
+    import yaml  # installed with the yaml extra
+
+    with open(path) as yaml_file:
+        entries = yaml.safe_load(yaml_file) or {}
+    if not isinstance(entries, dict):
+        raise Exception(f'{path}: expected a mapping of names to topic ids')
+    topics = {}
+    for topic_name, topic_id in entries.items():
+        _add(topics, str(topic_name), topic_id, path)
+    return topics
+
+
+def _add(topics, topic_name, topic_id, where):
+    if not isinstance(topic_id, int) or not 0 < topic_id < 0xFFFF:
+        raise Exception(f'{where}: topic id {topic_id} out of 1-65534')
+    if topic_name in topics:
+        raise Exception(f'{where}: topic {topic_name} defined twice')
+    topics[topic_name] = topic_id
+
+
+def compile_catalogue(topics, path):
+    """
+    Write the catalogue of topics, {topic name: topic_id}, to path
+    """
+    buckets = 2
+    while buckets < 2 * len(topics):
+        buckets *= 2
+    names_at = BUCKETS_AT + buckets * BUCKET.size
+
+    ids = [0] * 65536
+    table = [(0, 0)] * buckets
+    names = bytearray()
+    for topic_name, topic_id in topics.items():
+        if ids[topic_id]:
+            raise Exception(f'Topic id {topic_id} defined twice')
+        name = topic_name.encode('utf-8')
+        offset = names_at + len(names)
+        names += LENGTH.pack(len(name)) + name
+        ids[topic_id] = offset
+        bucket = zlib.crc32(name) & (buckets - 1)
+        while table[bucket][0]:
+            bucket = (bucket + 1) & (buckets - 1)
+        table[bucket] = (offset, topic_id)
+
+    with open(path, 'wb') as catalogue:
+        catalogue.write(HEADER.pack(MAGIC, len(topics), buckets))
+        catalogue.write(struct.pack('<65536I', *ids))
+        for offset, topic_id in table:
+            catalogue.write(BUCKET.pack(offset, topic_id, 0))
+        catalogue.write(names)
+
+
+class PredefinedTopics:
+    """
+    A compiled catalogue, looked up like a TopicRegistry
+
+    Args:
+        path: file written by compile_catalogue
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as catalogue:
+            size = os.fstat(catalogue.fileno()).st_size
+            if size < BUCKETS_AT:
+                raise Exception(f'{path} is not a predefined topic catalogue')
+            self._map = mmap.mmap(
+                catalogue.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        magic, self._count, buckets = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise Exception(f'{path} is not a predefined topic catalogue')
+        if buckets < 2 or buckets & (buckets - 1) or \
+                self._count > buckets // 2 or \
+                size < BUCKETS_AT + buckets * BUCKET.size:
+            self._map.close()
+            raise Exception(f'{path} is truncated or corrupt')
+        self._mask = buckets - 1
+
+    def _name_at(self, offset):
+        length, = LENGTH.unpack_from(self._map, offset)
+        offset += LENGTH.size
+        return self._map[offset:offset + length]
+
+    def name(self, topic_id):
+        """
+        Returns:
+            the name of topic_id as bytes, None if it is not predefined
+        """
+        offset, = OFFSET.unpack_from(self._map, IDS_AT + topic_id * 4)
+        return self._name_at(offset) if offset else None
+
+    def topic_id(self, topic_name):
+        """
+        Returns:
+            the predefined id of topic_name, None if there is none
+        """
+        name = to_bytes(topic_name)
+        bucket = zlib.crc32(name) & self._mask
+        while True:
+            offset, topic_id, _ = BUCKET.unpack_from(
+                self._map, BUCKETS_AT + bucket * BUCKET.size
+            )
+            if not offset:
+                return None
+            if self._name_at(offset) == name:
+                return topic_id
+            bucket = (bucket + 1) & self._mask
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, topic_name):
+        return self.topic_id(topic_name) is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Compile a predefined topic catalogue from CSV rows of '
+                    'topic_id,topic_name or a YAML mapping of names to ids'
+    )
+    parser.add_argument('source', help='.csv, .yaml or .yml file')
+    parser.add_argument('catalogue', help='compiled file to write')
+    args = parser.parse_args(args)
+
+    if args.source.endswith(('.yaml', '.yml')):
+        topics = load_yaml(args.source)
+    else:
+        topics = load_csv(args.source)
+    compile_catalogue(topics, args.catalogue)
+    print(f'{len(topics)} topics written to {args.catalogue}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Routing inbound messages to handlers by topic filter
+
+Filters are kept in a trie with a level of the topic per node, so matching
+a topic walks its levels once, following the exact, '+' and '#' branches,
+however many filters there are. The handlers matched are cached per topic,
+by the key of dispatch.topic_key, so the next message of a topic is
+routed with one dict lookup. Changing the filters clears the cache.
+"""
+
+import itertools
+import threading
+
+
+class _Node:
+    __slots__ = ('children', 'handlers')
+
+    def __init__(self):
+        self.children = {}  # level -> _Node
+        self.handlers = []  # (sequence, handler)
+
+
+def _levels(topic_filter):
+    levels = topic_filter.split('/')
+    for i, level in enumerate(levels):
+        if '#' in level and (level != '#' or i != len(levels) - 1):
+            raise Exception(f'Invalid topic filter {topic_filter}: # must '
+                            f'be a whole level, and the last one')
+        if '+' in level and level != '+':
+            raise Exception(f'Invalid topic filter {topic_filter}: + must '
+                            f'be a whole level')
+    return levels
+
+
+class TopicRouter:
+    def __init__(self):
+        self._root = _Node()
+        self._cache = {}  # topic key -> handlers
+        self._sequence = itertools.count()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add(self, topic_filter, handler):
+        """
+        Route the messages of topics matching topic_filter, which may hold
+        + and # wildcards, to handler
+        """
+        node = self._root
+        with self._lock:
+            for level in _levels(topic_filter):
+                node = node.children.setdefault(level, _Node())
+            node.handlers.append((next(self._sequence), handler))
+            self._count += 1
+            self._cache = {}
+
+    def remove(self, topic_filter, handler=None):
+        """
+        Stop routing topic_filter to handler, or to any handler when it is
+        None
+        """
+        with self._lock:
+            node = self._root
+            for level in _levels(topic_filter):
+                node = node.children.get(level)
+                if node is None:
+                    return
+            kept = [
+                entry for entry in node.handlers
+                if handler is not None and entry[1] != handler
+            ]
+            self._count -= len(node.handlers) - len(kept)
+            node.handlers = kept
+            self._cache = {}
+
+    def match(self, topic_name, key=None):
+        """
+        Args:
+            topic_name: topic of a message as str or bytes, without
+                wildcards
+            key: cache key of the topic, such as dispatch.topic_key of the
+                PUBLISH, None to match without caching
+
+        Returns:
+            the handlers of the filters matching topic_name, in the order
+            they were added
+        """
+        cache = self._cache
+        if key is not None:
+            handlers = cache.get(key)
+            if handlers is not None:
+                return handlers
+        if isinstance(topic_name, bytes):
+            topic_name = topic_name.decode('utf-8')
+        levels = topic_name.split('/')
+        matched = []
+        self._match(self._root, levels, 0, matched)
+        handlers = tuple(handler for _, handler in sorted(matched))
+        if key is not None:
+            cache[key] = handlers
+        return handlers
+
+    def _match(self, node, levels, depth, matched):
+        # wildcards do not match the first level of topics starting with $
+        wildcards = depth > 0 or not levels[0].startswith('$')
+        if wildcards and '#' in node.children:
+            matched.extend(node.children['#'].handlers)
+        if depth == len(levels):
+            matched.extend(node.handlers)
+            return
+        child = node.children.get(levels[depth])
+        if child is not None:
+            self._match(child, levels, depth + 1, matched)
+        if wildcards:
+            child = node.children.get('+')
+            if child is not None:
+                self._match(child, levels, depth + 1, matched)
+
+    def __len__(self):
+        return self._count
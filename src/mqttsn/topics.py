@@ -0,0 +1,69 @@
+"""
+Topic names and the topic ids the gateway assigned to them
+
+Ids are learnt from SUBACK and REGACK, and from the REGISTER packets of
+the gateway. Names are looked up in a dict, and ids index a list with a
+slot per possible id, so resolving the topic of an inbound PUBLISH is a
+single list access.
+"""
+
+import threading
+
+from .lib.helpers import to_bytes
+
+MAX_TOPIC_ID = 65535
+
+
+def is_topic_name(topic):
+    """
+    Returns:
+        True if topic is a name the gateway assigns an id to: neither a two
+        character short name nor a filter with wildcards
+    """
+    return isinstance(topic, str) and len(topic) > 2 and \
+        '+' not in topic and '#' not in topic
+
+
+class TopicRegistry:
+    def __init__(self):
+        self._names = [None] * (MAX_TOPIC_ID + 1)  # topic_id -> bytes
+        self._ids = {}  # topic name -> topic_id
+        self._lock = threading.Lock()
+
+    def add(self, topic_id, topic_name):
+        """
+        Remember that topic_id stands for topic_name, str or bytes
+        """
+        name = to_bytes(topic_name)
+        with self._lock:
+            previous = self._names[topic_id]
+            if previous is not None and previous != name:
+                self._ids.pop(previous.decode('utf-8'), None)
+            self._names[topic_id] = name
+            self._ids[name.decode('utf-8')] = topic_id
+
+    def topic_id(self, topic_name):
+        """
+        Returns:
+            the id of topic_name, None if it was not registered
+        """
+        return self._ids.get(topic_name)
+
+    def name(self, topic_id):
+        """
+        Returns:
+            the name of topic_id as bytes, None if it is unknown
+        """
+        return self._names[topic_id]
+
+    def clear(self):
+        with self._lock:
+            for topic_id in self._ids.values():
+                self._names[topic_id] = None
+            self._ids.clear()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, topic_name):
+        return topic_name in self._ids
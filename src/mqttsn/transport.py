@@ -0,0 +1,494 @@
+"""
+Datagram transports between a client and its gateway
+
+A transport moves whole datagrams. Its methods are named after the socket
+methods they stand for, so a transport can be used wherever the client
+used to hold a socket:
+
+    send(data), send_many(datagrams)
+    recvfrom(bufsize), recvfrom_into(buffer), recv_many()
+    settimeout(timeout), gettimeout()
+    close()
+    local_address, peer_address
+
+SocketTransport wraps a connected datagram socket and is what Client uses
+by default, through udp(), or unix() for a gateway listening on a Unix
+domain socket of the same host. LoopbackTransport.pair() connects two
+endpoints in memory, to run the client against an in-process gateway at
+memory speed and without the kernel network stack. ImpairedTransport
+wraps any of them to emulate a lossy, slow or jittery link.
+"""
+
+import errno
+import heapq
+import itertools
+import os
+import random
+import socket
+import threading
+import time
+from collections import deque
+
+from . import mmsg
+
+
+class Transport:
+    # datagrams read per recv_many call at most
+    batch = 0
+
+    def send(self, data):
+        raise NotImplementedError
+
+    def send_many(self, datagrams):
+        for datagram in datagrams:
+            self.send(datagram)
+        return len(datagrams)
+
+    def send_buffer(self, buffer, offsets, lengths):
+        """
+        Send the datagrams starting at offsets in buffer, of lengths octets
+
+        Returns:
+            the number of datagrams sent
+        """
+        view = memoryview(buffer).cast('B')
+        return self.send_many([
+            view[offset:offset + length]
+            for offset, length in zip(offsets, lengths)
+        ])
+
+    def recvfrom(self, bufsize):
+        """
+        Returns:
+            (datagram, address), raising socket.timeout after the timeout
+            set with settimeout
+        """
+        raise NotImplementedError
+
+    def recvfrom_into(self, buffer):
+        """
+        Returns:
+            (nbytes, address) of the datagram received into buffer
+        """
+        data, address = self.recvfrom(len(buffer))
+        buffer[:len(data)] = data
+        return len(data), address
+
+    def recv_many(self):
+        """
+        Wait for a datagram and take those already received with it
+
+        Returns:
+            [(datagram, address)]
+        """
+        return [self.recvfrom(65535)]
+
+    def settimeout(self, timeout):
+        raise NotImplementedError
+
+    def gettimeout(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    @property
+    def local_address(self):
+        raise NotImplementedError
+
+    @property
+    def peer_address(self):
+        raise NotImplementedError
+
+
+class SocketTransport(Transport):
+    """
+    Args:
+        sock: a datagram socket, connected to the gateway to send
+        batch (int): datagrams received per recvmmsg call on Linux
+    """
+    def __init__(self, sock, batch=0):
+        self.sock = sock
+        self.batch = batch
+        self._receiver = mmsg.BatchReceiver(batch) if batch else None
+        self._sender = mmsg.BatchSender()
+
+    def send(self, data):
+        return self.sock.send(data)
+
+    def send_many(self, datagrams):
+        return self._sender.send_many(self.sock, datagrams)
+
+    def send_buffer(self, buffer, offsets, lengths):
+        return self._sender.send_buffer(self.sock, buffer, offsets, lengths)
+
+    def recvfrom(self, bufsize):
+        return self.sock.recvfrom(bufsize)
+
+    def recvfrom_into(self, buffer):
+        return self.sock.recvfrom_into(buffer)
+
+    def recv_many(self):
+        # recvmmsg needs a blocking socket
+        if self._receiver is None or self.sock.gettimeout() is not None:
+            return [self.sock.recvfrom(65535)]
+        return self._receiver.recv(self.sock)
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def gettimeout(self):
+        return self.sock.gettimeout()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        try:
+            # wakes a thread blocked receiving, which close alone does not
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # not connected, shut down all the same on Linux
+        self.sock.close()
+
+    @property
+    def local_address(self):
+        return self.sock.getsockname()
+
+    @property
+    def peer_address(self):
+        """
+        Returns:
+            the address the socket is connected to, None when it is only
+            bound, as by Client.start
+        """
+        try:
+            return self.sock.getpeername()
+        except OSError as error:
+            if error.errno != errno.ENOTCONN:
+                raise
+            return None
+
+
+def udp(host, port, batch=0):
+    """
+    Returns:
+        a SocketTransport over a UDP socket connected to (host, port)
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect((host, port))
+    return SocketTransport(sock, batch)
+
+
+class UnixTransport(SocketTransport):
+    """
+    SocketTransport over an AF_UNIX datagram socket, which removes the
+    socket file it is bound to when closed
+    """
+    def close(self):
+        path = self.local_address
+        super().close()
+        if isinstance(path, str) and path:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def unix(path, local_path=None, batch=0):
+    """
+    Returns:
+        a UnixTransport connected to the gateway socket at path, bound to
+        local_path so the gateway can answer, or to an automatically
+        chosen abstract address when local_path is None
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.bind(local_path or '')
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return UnixTransport(sock, batch)
+
+
+class LoopbackTransport(Transport):
+    """
+    One end of an in-memory datagram link, see pair()
+
+    Like UDP, datagrams sent while the peer's queue holds capacity
+    datagrams are dropped.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.peer = None
+        self.closed = False
+        self.dropped = 0
+        self._address = ('loopback', next(self._ids))
+        self._timeout = None
+        self._queue = deque()
+        self._lock = threading.Condition()
+
+    @classmethod
+    def pair(cls, capacity=4096):
+        """
+        Returns:
+            two transports, each receiving what the other sends
+        """
+        a, b = cls(capacity), cls(capacity)
+        a.peer, b.peer = b, a
+        return a, b
+
+    def send(self, data):
+        if self.closed:
+            raise OSError('Transport closed')
+        self.peer._deliver(bytes(data), self._address)
+        return len(data)
+
+    def _deliver(self, data, address):
+        with self._lock:
+            if self.closed or len(self._queue) >= self.capacity:
+                self.dropped += 1
+                return
+            self._queue.append((data, address))
+            self._lock.notify()
+
+    def _take(self, count):
+        with self._lock:
+            if not self._lock.wait_for(
+                    lambda: self._queue or self.closed, self._timeout):
+                raise socket.timeout('timed out')
+            if not self._queue:
+                raise OSError('Transport closed')
+            count = min(count or len(self._queue), len(self._queue))
+            return [self._queue.popleft() for _ in range(count)]
+
+    def recvfrom(self, bufsize):
+        (data, address), = self._take(1)
+        return data[:bufsize], address
+
+    def recv_many(self):
+        return self._take(self.batch)
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def gettimeout(self):
+        return self._timeout
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self._lock.notify_all()
+
+    @property
+    def local_address(self):
+        return self._address
+
+    @property
+    def peer_address(self):
+        return self.peer._address if self.peer else None
+
+
+class Impairment:
+    """
+    Seeded model of a bad link, in one direction
+
+    Args:
+        loss (float): probability of dropping a datagram
+        duplicate (float): probability of delivering a datagram twice
+        reorder (float): probability of holding a datagram back for
+            reorder_delay seconds, letting the next ones overtake it
+        latency (float): one way delay, in seconds
+        jitter (float): spread of the delay around latency, in seconds
+        distribution: 'uniform' over latency +- jitter, 'normal' with
+            jitter as standard deviation, or 'exponential' with jitter as
+            mean of the extra delay
+        bandwidth (float): link capacity in octets per second, None for
+            unlimited; datagrams queue behind each other at that rate
+        seed: seed of the random generator, for reproducible runs
+    """
+    DISTRIBUTIONS = ('uniform', 'normal', 'exponential')
+
+    def __init__(self, loss=0.0, duplicate=0.0, reorder=0.0,
+                 reorder_delay=0.05, latency=0.0, jitter=0.0,
+                 distribution='uniform', bandwidth=None, seed=None):
+        if distribution not in self.DISTRIBUTIONS:
+            raise Exception(f'Unknown jitter distribution {distribution}')
+        self.loss = loss
+        self.duplicate = duplicate
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.latency = latency
+        self.jitter = jitter
+        self.distribution = distribution
+        self.bandwidth = bandwidth
+        self.random = random.Random(seed)
+        self.stats = {'sent': 0, 'lost': 0, 'duplicated': 0, 'reordered': 0}
+        self._link_free = 0.0  # when the last datagram leaves the link
+
+    def delay(self):
+        if not self.jitter:
+            return self.latency
+        if self.distribution == 'uniform':
+            delay = self.random.uniform(
+                self.latency - self.jitter, self.latency + self.jitter
+            )
+        elif self.distribution == 'normal':
+            delay = self.random.gauss(self.latency, self.jitter)
+        else:
+            delay = self.latency + self.random.expovariate(1 / self.jitter)
+        return max(0.0, delay)
+
+    def schedule(self, now, size):
+        """
+        Returns:
+            the times a datagram of size octets sent at now arrives at,
+            none when it is lost
+        """
+        self.stats['sent'] += 1
+        if self.random.random() < self.loss:
+            self.stats['lost'] += 1
+            return []
+        copies = 1
+        if self.random.random() < self.duplicate:
+            self.stats['duplicated'] += 1
+            copies = 2
+
+        arrivals = []
+        for _ in range(copies):
+            leaves = now
+            if self.bandwidth:
+                leaves = self._link_free = \
+                    max(now, self._link_free) + size / self.bandwidth
+            arrival = leaves + self.delay()
+            if self.random.random() < self.reorder:
+                self.stats['reordered'] += 1
+                arrival += self.reorder_delay
+            arrivals.append(arrival)
+        return arrivals
+
+
+class ImpairedTransport(Transport):
+    """
+    Wraps a transport, impairing what it sends with outbound and what it
+    receives with inbound, two Impairment or None
+
+    A scheduler thread releases datagrams when they are due. With inbound,
+    a reader thread receives from the wrapped transport.
+    """
+    def __init__(self, transport, outbound=None, inbound=None):
+        self.transport = transport
+        self.outbound = outbound
+        self.inbound = inbound
+        self.closed = False
+        self._timeout = None
+        self._seq = itertools.count()
+        self._due = []  # heap of (time, seq, data, address or None to send)
+        self._received = deque()
+        self._lock = threading.Condition()
+        threading.Thread(
+            target=self._schedule, name='mqttsn-impaired', daemon=True
+        ).start()
+        if inbound is not None:
+            threading.Thread(
+                target=self._read, name='mqttsn-impaired-read', daemon=True
+            ).start()
+
+    def _push(self, arrivals, data, address):
+        with self._lock:
+            for arrival in arrivals:
+                heapq.heappush(
+                    self._due, (arrival, next(self._seq), data, address)
+                )
+            self._lock.notify_all()
+
+    def send(self, data):
+        if self.closed:
+            raise OSError('Transport closed')
+        if self.outbound is None:
+            return self.transport.send(data)
+        data = bytes(data)
+        now = time.monotonic()
+        with self._lock:
+            arrivals = self.outbound.schedule(now, len(data))
+        self._push(arrivals, data, None)
+        return len(data)
+
+    def _read(self):
+        try:
+            while True:
+                for data, address in self.transport.recv_many():
+                    with self._lock:
+                        arrivals = self.inbound.schedule(
+                            time.monotonic(), len(data)
+                        )
+                    self._push(arrivals, data, address)
+        except OSError:
+            self.close()
+
+    def _schedule(self):
+        while True:
+            with self._lock:
+                while not self.closed and (
+                        not self._due or self._due[0][0] > time.monotonic()):
+                    timeout = None
+                    if self._due:
+                        timeout = self._due[0][0] - time.monotonic()
+                    self._lock.wait(timeout)
+                if self.closed:
+                    return
+                _, _, data, address = heapq.heappop(self._due)
+                if address is not None:
+                    self._received.append((data, address))
+                    self._lock.notify_all()
+                    continue
+            try:
+                self.transport.send(data)
+            except OSError:
+                pass  # dropped, as the network would
+
+    def recvfrom(self, bufsize):
+        if self.inbound is None:
+            return self.transport.recvfrom(bufsize)
+        with self._lock:
+            if not self._lock.wait_for(
+                    lambda: self._received or self.closed, self._timeout):
+                raise socket.timeout('timed out')
+            if not self._received:
+                raise OSError('Transport closed')
+            data, address = self._received.popleft()
+        return data[:bufsize], address
+
+    def recv_many(self):
+        if self.inbound is None:
+            return self.transport.recv_many()
+        return [self.recvfrom(65535)]
+
+    def settimeout(self, timeout):
+        if self.inbound is None:
+            self.transport.settimeout(timeout)
+        self._timeout = timeout
+
+    def gettimeout(self):
+        return self._timeout
+
+    @property
+    def batch(self):
+        return self.transport.batch if self.inbound is None else 0
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self._lock.notify_all()
+        self.transport.close()
+
+    @property
+    def local_address(self):
+        return self.transport.local_address
+
+    @property
+    def peer_address(self):
+        return self.transport.peer_address
@@ -0,0 +1,87 @@
+import socket
+import threading
+from collections import Counter
+
+import pytest
+
+from mqttsn.lib.connects import Connacks
+from mqttsn.lib.disconnects import Disconnects
+from mqttsn.lib.names import (
+    CONNECT, DISCONNECT, PUBLISH, PUBREL, REGISTER, SUBSCRIBE, UNSUBSCRIBE
+)
+from mqttsn.lib.objects import decode
+from mqttsn.lib.publishes import Pubacks, Pubrecs, Pubcomps
+from mqttsn.lib.registers import Regacks
+from mqttsn.lib.subscribes import Subacks
+from mqttsn.lib.unsubscribes import Unsubacks
+
+
+class Gateway:
+    """
+    Acknowledges what clients send to a UDP socket on an ephemeral port,
+    counting the packets received by msg_type
+
+    Every ack is sent repeat times, to emulate a link duplicating them.
+    """
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.05)
+        self.host, self.port = self.sock.getsockname()
+        self.received = Counter()
+        self.topics = {}
+        self.repeat = 1
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            try:
+                data, address = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            packet = decode(data)
+            self.received[packet.mh.msg_type] += 1
+            for response in self.respond(packet):
+                for _ in range(self.repeat):
+                    self.sock.sendto(response.pack(), address)
+
+    def respond(self, packet):
+        msg_type = packet.mh.msg_type
+        if msg_type == CONNECT:
+            return [Connacks()]
+        if msg_type == DISCONNECT:
+            return [Disconnects()]
+        if msg_type in [SUBSCRIBE, REGISTER]:
+            ack = Subacks() if msg_type == SUBSCRIBE else Regacks()
+            ack.msg_id = packet.msg_id
+            ack.topic_id = self.topics.setdefault(
+                bytes(packet.topic_name), len(self.topics) + 1
+            )
+            return [ack]
+        if msg_type == UNSUBSCRIBE:
+            ack = Unsubacks()
+        elif msg_type == PUBLISH and packet.flags.qos == 1:
+            ack = Pubacks()
+            ack.topic_id = packet.topic_id
+        elif msg_type == PUBLISH and packet.flags.qos == 2:
+            ack = Pubrecs()
+        elif msg_type == PUBREL:
+            ack = Pubcomps()
+        else:
+            return []
+        ack.msg_id = packet.msg_id
+        return [ack]
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+
+@pytest.fixture
+def gateway():
+    gateway = Gateway()
+    yield gateway
+    gateway.close()
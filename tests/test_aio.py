@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+import pytest
+
+from mqttsn.aio import AsyncClient
+from mqttsn.lib.names import REGISTER
+
+
+def test_concurrent_publishes_register_a_name_once(gateway):
+    names = [f'sensors/{i}/temp' for i in range(5)]
+
+    async def publish():
+        client = AsyncClient(host=gateway.host, port=gateway.port)
+        await client.connect()
+        await asyncio.gather(*[
+            client.publish(name, b'21.5') for name in names * 10
+        ])
+        client.close()
+        return client
+
+    client = asyncio.run(publish())
+    assert gateway.received[REGISTER] == len(names)
+    assert sorted(client.topic_ids) == names
+    assert not client._registrations
+
+
+def test_requests_time_out_per_call(gateway):
+    async def subscribe():
+        client = AsyncClient(host=gateway.host, port=gateway.port, timeout=5)
+        await client.connect()
+        gateway.repeat = 0  # acks lost
+        try:
+            await client.subscribe('sensors/1/temp', timeout=0.1)
+        finally:
+            client.close()
+
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(subscribe())
+    assert time.monotonic() - started < 2
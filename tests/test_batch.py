@@ -0,0 +1,130 @@
+import pytest
+
+from mqttsn.lib.connects import Connacks
+from mqttsn.lib.publishes import Publishes
+
+np = pytest.importorskip('numpy')
+batch = pytest.importorskip('mqttsn.lib.batch')
+
+
+def publish(topic_id, msg_id, data, qos=1):
+    packet = Publishes()
+    packet.flags.clean_session = False  # set by default
+    packet.flags.qos = qos
+    packet.topic_id = topic_id
+    packet.msg_id = msg_id
+    packet.data = data
+    return packet.pack()
+
+
+def payloads(decoded):
+    return [
+        bytes(decoded.buffer[offset:offset + length])
+        for offset, length in zip(decoded.payload_offset,
+                                  decoded.payload_length)
+    ]
+
+
+def test_list_of_datagrams():
+    datagrams = [publish(1, 10, b'21.5'), Connacks().pack(),
+                 publish(2, 11, b'')]
+    decoded = batch.unpack_publishes(datagrams)
+    assert list(decoded.index) == [0, 2]
+    assert list(decoded.topic_id) == [1, 2]
+    assert list(decoded.msg_id) == [10, 11]
+    assert list(decoded.flags) == [0x20, 0x20]
+    assert payloads(decoded) == [b'21.5', b'']
+
+
+def test_concatenated_datagrams_with_offsets():
+    datagrams = [publish(1, 10, b'a'), publish(2, 11, b'bcd')]
+    buffer = b''.join(datagrams)
+    decoded = batch.unpack_publishes(buffer, offsets=[0, len(datagrams[0])])
+    assert list(decoded.topic_id) == [1, 2]
+    assert payloads(decoded) == [b'a', b'bcd']
+    # offsets in any order
+    decoded = batch.unpack_publishes(buffer, offsets=[len(datagrams[0]), 0])
+    assert list(decoded.topic_id) == [2, 1]
+
+
+def test_length_past_its_datagram_does_not_read_the_next_one():
+    oversized = bytearray(publish(1, 10, b'ab'))
+    oversized[0] += 4
+    following = publish(2, 11, b'cdef')
+    buffer = bytes(oversized) + following
+    decoded = batch.unpack_publishes(buffer, offsets=[0, len(oversized)])
+    assert list(decoded.index) == [1]
+    assert payloads(decoded) == [b'cdef']
+
+    # or with the lengths given
+    decoded = batch.unpack_publishes(
+        buffer + b'padding', offsets=[0, len(oversized)],
+        lengths=[len(oversized), len(following)]
+    )
+    assert list(decoded.index) == [1]
+
+
+def test_non_publish_and_truncated_datagrams_are_skipped():
+    datagrams = [
+        Connacks().pack(),
+        publish(1, 10, b'21.5')[:-1],  # shorter than its length field
+        publish(1, 10, b'')[:5],  # shorter than the PUBLISH fields
+        b'\x01',  # long header cut short
+        b'',
+        publish(3, 12, b'ok'),
+    ]
+    decoded = batch.unpack_publishes(datagrams)
+    assert list(decoded.index) == [5]
+    assert payloads(decoded) == [b'ok']
+
+
+def test_long_headers():
+    data = bytes(range(256)) * 2
+    datagrams = [publish(1, 10, data), publish(2, 11, b'short')]
+    assert datagrams[0][0] == 1
+    decoded = batch.unpack_publishes(datagrams)
+    assert list(decoded.topic_id) == [1, 2]
+    assert payloads(decoded) == [data, b'short']
+
+
+def test_payload_width_pads_and_truncates():
+    datagrams = [publish(1, 10, b'ab'), publish(2, 11, b'abcdef')]
+    decoded = batch.unpack_publishes(datagrams, payload_width=4)
+    assert decoded.payload.tolist() == [
+        [ord('a'), ord('b'), 0, 0], list(b'abcd')
+    ]
+
+
+def test_empty_burst():
+    decoded = batch.unpack_publishes([], payload_width=3)
+    assert len(decoded.index) == 0 and decoded.payload.shape == (0, 3)
+    decoded = batch.unpack_publishes(b'', offsets=[])
+    assert len(decoded.index) == 0
+
+
+@pytest.mark.parametrize('width', [4, 300])
+def test_pack_then_unpack(width):
+    layout = np.dtype([('value', '>f4'), ('rest', 'u1', (width - 4,))])
+    count = 5
+    rows = batch.pack_payloads(layout, {
+        'value': np.arange(count, dtype=np.float32),
+        'rest': np.full((count, width - 4), 7, dtype=np.uint8),
+    })
+    buffer, offsets, length = batch.pack_publishes(
+        np.arange(count) + 1, rows, flags=0x20,
+        msg_id=np.arange(count) + 100
+    )
+    assert (length >= 256) == (width == 300)
+
+    decoded = batch.unpack_publishes(buffer.tobytes(), offsets)
+    assert list(decoded.index) == list(range(count))
+    assert list(decoded.topic_id) == list(range(1, count + 1))
+    assert list(decoded.msg_id) == list(range(100, 100 + count))
+    assert payloads(decoded) == [row.tobytes() for row in rows]
+    # the same bytes as Publishes.pack
+    assert buffer[:length].tobytes() == \
+        publish(1, 100, rows[0].tobytes())
+
+    batch.set_msg_ids(buffer, offsets[1:3], length, [7, 8])
+    decoded = batch.unpack_publishes(buffer.tobytes(), offsets)
+    assert list(decoded.msg_id) == [100, 7, 8, 103, 104]
@@ -0,0 +1,112 @@
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from mqttsn.client import Client, Callback
+from mqttsn.lib.objects import decode
+from mqttsn.lib.publishes import Publishes
+from mqttsn.transport import LoopbackTransport
+
+GROUP = '224.1.1.1'
+
+
+class Arrived(Callback):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.arrived = threading.Event()
+
+    def message_arrived(self, topic_name, payload, qos, retained, msg_id):
+        self.messages.append((topic_name, payload, qos))
+        self.arrived.set()
+        return True
+
+
+def multicast():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(
+            socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+            struct.pack('4sl', socket.inet_aton(GROUP), socket.INADDR_ANY)
+        )
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+@pytest.mark.skipif(not multicast(), reason='no multicast route')
+def test_start_receives_from_the_multicast_group():
+    callback = Arrived()
+    client = Client('listener', host=GROUP, port=0)
+    client.register_callback(callback)
+    client.start()
+    try:
+        port = client.transport.local_address[1]
+        assert client.transport.peer_address is None
+        assert client.rtt is client.rtt_estimators[GROUP, 0]
+
+        publish = Publishes()
+        publish.flags.qos = 0
+        publish.topic_id = 1
+        publish.data = b'21.5'
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender.sendto(publish.pack(), (GROUP, port))
+        sender.close()
+        assert callback.arrived.wait(5)
+        assert callback.messages[0][1:] == (b'21.5', 0)
+    finally:
+        client.stop()
+
+
+def test_prepared_templates_are_bounded():
+    transport, gateway = LoopbackTransport.pair()
+    client = Client('lru', transport=transport, max_prepared=3)
+    for topic_id in [1, 2, 3, 1, 4]:
+        client.publish(topic_id, b'21.5')
+    assert list(client._prepared) == [(3, 0, False), (1, 0, False),
+                                      (4, 0, False)]
+    gateway.settimeout(1)
+    assert [
+        decode(gateway.recvfrom(65535)[0]).topic_id for _ in range(5)
+    ] == [1, 2, 3, 1, 4]
+
+
+class Published(Callback):
+    def __init__(self):
+        super().__init__()
+        self.acked = threading.Event()
+
+    def published(self, msg_id):
+        self.acked.set()
+
+
+def test_requests_time_out_per_call(gateway):
+    callback = Published()
+    client = Client('timeouts', host=gateway.host, port=gateway.port,
+                    timeout=5, window=1, retry_interval=0.2)
+    client.register_callback(callback)
+    client.connect()
+    try:
+        gateway.repeat = 0  # acks lost
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            client.subscribe('sensors/1/temp', timeout=0.1)
+        with pytest.raises(TimeoutError):
+            client.register('sensors/1/temp', timeout=0.1)
+        with pytest.raises(TimeoutError):
+            client.unsubscribe('sensors/1/temp', timeout=0.1)
+        client.publish(1, b'21.5', qos=1)
+        with pytest.raises(TimeoutError):
+            client.publish(1, b'21.6', qos=1, timeout=0.1)
+        assert time.monotonic() - started < 2
+        assert len(client.msg_ids) == 1
+
+        gateway.repeat = 1  # the retransmission is acknowledged
+        assert callback.acked.wait(5)
+    finally:
+        client.stop()
@@ -0,0 +1,174 @@
+import pytest
+
+from mqttsn.delivery import DeliveryEngine, RttEstimator, TimerWheel
+from mqttsn.lib import batch
+from mqttsn.lib.names import PUBLISH, PUBREL
+from mqttsn.lib.objects import decode
+from mqttsn.lib.publishes import Publishes
+from mqttsn.msgids import MsgIds
+
+
+def publish(msg_id, qos=1):
+    packet = Publishes()
+    packet.flags.qos = qos
+    packet.topic_id = 1
+    packet.msg_id = msg_id
+    packet.data = b'21.5'
+    return packet
+
+
+def engine(sent, **kwargs):
+    # ticks are driven by the tests, the ticker thread is not started
+    rtt = RttEstimator(initial_rto=0.2, min_rto=0.1, max_rto=0.4)
+    return DeliveryEngine(sent.append, tick=0.1, slots=8, rtt=rtt, **kwargs)
+
+
+def test_timer_expires_after_its_delay():
+    wheel = TimerWheel(tick=0.1, slots=8)
+    wheel.schedule('a', 0.25, 'value')
+    assert wheel.advance() == []
+    assert wheel.advance() == []
+    assert wheel.advance() == [('a', 'value')]
+    assert 'a' not in wheel and len(wheel) == 0
+
+
+def test_timer_beyond_the_ring_waits_for_its_round():
+    wheel = TimerWheel(tick=0.1, slots=4)
+    wheel.schedule('far', 1.0)
+    expired = [wheel.advance() for _ in range(10)]
+    assert expired[:9] == [[]] * 9
+    assert expired[9] == [('far', None)]
+
+
+def test_cancelled_and_rescheduled_timers():
+    wheel = TimerWheel(tick=0.1, slots=8)
+    wheel.schedule('cancelled', 0.1)
+    wheel.schedule('moved', 0.1)
+    wheel.cancel('cancelled')
+    wheel.schedule('moved', 0.3)
+    assert wheel.advance() == []
+    assert wheel.advance() == []
+    assert wheel.advance() == [('moved', None)]
+
+
+def test_unacknowledged_publish_is_resent_with_dup():
+    sent = []
+    delivery = engine(sent)
+    delivery.submit(publish(1))
+    assert not decode(sent[0]).flags.dup
+
+    delivery.tick()
+    assert len(sent) == 1
+    delivery.tick()
+    assert len(sent) == 2
+    resent = decode(sent[1])
+    assert resent.mh.msg_type == PUBLISH
+    assert resent.flags.dup and resent.msg_id == 1
+
+    assert delivery.puback(1) is not None
+    assert len(delivery) == 0
+
+
+def test_buffer_is_sent_and_tracked_in_place():
+    np = pytest.importorskip('numpy')
+    sent, windows = [], []
+    delivery = engine(
+        sent, window=2,
+        send_buffer=lambda *window: windows.append(window)
+    )
+    buffer, offsets, length = batch.pack_publishes(
+        [1, 2], np.zeros((2, 4), dtype=np.uint8), flags=0x20
+    )
+    batch.set_msg_ids(buffer, offsets, length, [7, 8])
+    delivery.submit_buffer(buffer, offsets, length, [7, 8])
+    assert len(windows) == 1 and windows[0][0] is buffer
+    assert list(windows[0][1]) == [0, length]
+    assert [
+        decode(bytes(buffer[offset:offset + length])).msg_id
+        for offset in offsets
+    ] == [7, 8]
+
+    delivery.tick()
+    delivery.tick()
+    assert sorted(decode(packet).msg_id for packet in sent) == [7, 8]
+    assert all(decode(packet).flags.dup for packet in sent)
+    assert not decode(bytes(buffer[:length])).flags.dup
+    assert delivery.puback(7) is not None
+    assert delivery.puback(8) is not None
+
+
+def test_unacknowledged_pubrel_is_resent():
+    sent = []
+    delivery = engine(sent)
+    delivery.submit(publish(1, qos=2))
+    assert delivery.pubrec(1)
+    assert decode(sent[-1]).mh.msg_type == PUBREL
+
+    delivery.tick()
+    delivery.tick()
+    assert [decode(packet).mh.msg_type for packet in sent[1:]] == \
+        [PUBREL, PUBREL]
+    assert delivery.pubcomp(1) is not None
+
+
+def test_retransmissions_back_off_then_fail():
+    sent, failed = [], []
+    msg_ids = MsgIds()
+    delivery = engine(
+        sent, max_retries=2, msg_ids=msg_ids,
+        on_failure=lambda msg_id, packet: failed.append(msg_id)
+    )
+    msg_id = msg_ids.allocate()
+    delivery.submit(publish(msg_id))
+
+    sent_at = []
+    for tick in range(1, 20):
+        count = len(sent)
+        delivery.tick()
+        if len(sent) > count:
+            sent_at.append(tick)
+    # 0.2 s, then doubled to 0.4 s, the max_rto
+    assert sent_at == [2, 6]
+    assert failed == [msg_id]
+    assert msg_id not in msg_ids and len(delivery) == 0
+
+
+def test_retransmitted_exchanges_are_not_sampled():
+    sent = []
+    delivery = engine(sent)
+    delivery.submit(publish(1))
+    delivery.tick()
+    delivery.tick()
+    delivery.puback(1)
+    assert delivery.rtt.samples == 0
+
+    delivery.submit(publish(2))
+    delivery.puback(2)
+    assert delivery.rtt.samples == 1
+
+
+def test_rto_follows_the_samples():
+    rtt = RttEstimator(initial_rto=1.0, min_rto=0.0, max_rto=60.0)
+    assert rtt.rto == 1.0
+    rtt.sample(0.1)
+    assert rtt.srtt == 0.1 and rtt.rttvar == 0.05
+    assert rtt.rto == pytest.approx(0.3)
+    rtt.sample(0.1)
+    assert rtt.srtt == pytest.approx(0.1)
+    assert rtt.rttvar == pytest.approx(0.0375)
+    assert rtt.rto == pytest.approx(0.25)
+
+
+def test_rto_is_clamped():
+    rtt = RttEstimator(min_rto=0.2, max_rto=2.0)
+    rtt.sample(0.001)
+    assert rtt.rto == 0.2
+    rtt = RttEstimator(min_rto=0.2, max_rto=2.0)
+    rtt.sample(5.0)
+    assert rtt.rto == 2.0
+
+
+def test_timeout_doubles_per_retransmission_up_to_max_rto():
+    rtt = RttEstimator(initial_rto=0.5, max_rto=3.0)
+    assert [rtt.timeout(retries) for retries in range(4)] == \
+        [0.5, 1.0, 2.0, 3.0]
@@ -0,0 +1,52 @@
+import random
+import threading
+import time
+from collections import defaultdict
+
+from mqttsn.dispatch import Dispatcher
+
+
+def test_messages_of_a_topic_are_handled_in_order_one_at_a_time():
+    dispatcher = Dispatcher(workers=4, max_pending=64, batch=4)
+    handled = defaultdict(list)
+    threads = set()
+    active = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def handler(topic, sequence):
+        with lock:
+            if topic in active:
+                overlaps.append((topic, sequence))
+            active.add(topic)
+            threads.add(threading.get_ident())
+        time.sleep(random.random() / 5000)
+        with lock:
+            active.discard(topic)
+            handled[topic].append(sequence)
+
+    topics = [f'sensors/{i}/temp' for i in range(8)]
+    for sequence in range(200):
+        for topic in topics:
+            dispatcher.dispatch(topic, handler, topic, sequence)
+    dispatcher.shutdown()
+
+    assert not overlaps
+    assert dict(handled) == {topic: list(range(200)) for topic in topics}
+    assert len(threads) > 1
+    assert len(dispatcher) == 0
+
+
+def test_a_failing_handler_does_not_stop_its_topic():
+    dispatcher = Dispatcher(workers=2)
+    handled = []
+
+    def handler(sequence):
+        if sequence == 1:
+            raise ValueError('bad payload')
+        handled.append(sequence)
+
+    for sequence in range(4):
+        dispatcher.dispatch('topic', handler, sequence)
+    dispatcher.shutdown()
+    assert handled == [0, 2, 3]
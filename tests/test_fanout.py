@@ -0,0 +1,87 @@
+import socket
+import time
+
+import pytest
+
+from mqttsn.client import Client, Callback
+from mqttsn.lib.publishes import Publishes
+
+
+def free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def received(stats):
+    return sum(report['packets'] for report in stats.values())
+
+
+def test_workers_share_unicast_datagrams():
+    port = free_port()
+    client = Client('workers', host='127.0.0.1', port=port)
+    client.start(workers=2, callback_factory=Callback)
+
+    publish = Publishes()
+    publish.flags.qos = 0
+    publish.topic_id = 1
+    publish.data = b'21.5'
+    senders = [
+        socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(8)
+    ]
+    for sender in senders:
+        for _ in range(25):
+            sender.sendto(publish.pack(), ('127.0.0.1', port))
+        sender.close()
+
+    deadline = time.monotonic() + 30
+    while received(client.pool.stats()) < 200 and \
+            time.monotonic() < deadline:
+        time.sleep(0.1)
+    pool = client.pool
+    client.stop()
+    stats = pool.stats()
+    assert received(stats) == 200
+    assert sum(report['errors'] for report in stats.values()) == 0
+
+
+def test_workers_survive_undecodable_datagrams():
+    port = free_port()
+    client = Client('workers', host='127.0.0.1', port=port)
+    client.start(workers=1, callback_factory=Callback)
+
+    publish = Publishes()
+    publish.flags.qos = 0
+    publish.topic_id = 1
+    publish.data = b'21.5'
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for datagram in [b'\x02\xff', b'\x05\x0c\x00', b'\x01']:
+        sender.sendto(datagram, ('127.0.0.1', port))
+    for _ in range(10):
+        sender.sendto(publish.pack(), ('127.0.0.1', port))
+    sender.close()
+
+    deadline = time.monotonic() + 30
+    while received(client.pool.stats()) < 10 and \
+            time.monotonic() < deadline:
+        time.sleep(0.1)
+    pool = client.pool
+    client.stop()
+    stats = pool.stats()
+    assert received(stats) == 10
+    assert sum(report['errors'] for report in stats.values()) == 3
+
+
+def test_workers_need_a_callback():
+    client = Client('workers', host='127.0.0.1', port=free_port())
+    with pytest.raises(Exception, match='callback'):
+        client.start(workers=2)
+
+
+def test_workers_do_not_join_multicast_groups():
+    client = Client('workers', host='224.1.1.1', port=free_port())
+    client.register_callback(Callback())
+    with pytest.raises(Exception, match='multicast'):
+        client.start(workers=2)
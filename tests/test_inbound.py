@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+from mqttsn.dispatch import topic_key
+from mqttsn.inbound import BLOCK, DROP_NEWEST, DROP_OLDEST, InboundQueue
+from mqttsn.lib.publishes import Pubacks, Publishes
+
+
+def telemetry(topic_id, qos=0):
+    publish = Publishes()
+    publish.flags.qos = qos
+    publish.topic_id = topic_id
+    publish.data = b'21.5'
+    return publish
+
+
+def puback(msg_id):
+    ack = Pubacks()
+    ack.msg_id = msg_id
+    return ack
+
+
+def drain(queue):
+    packets = []
+    while len(queue):
+        packets.append(queue.get(0)[0])
+    return packets
+
+
+def test_drop_oldest_drops_the_oldest_telemetry():
+    queue = InboundQueue(3, DROP_OLDEST)
+    packets = [telemetry(1), puback(1), telemetry(2)]
+    for packet in packets:
+        assert queue.put(packet)
+    assert not queue.put(telemetry(3))
+    assert drain(queue)[:2] == packets[1:]
+    assert queue.drops == {'PUBLISH': 1}
+
+
+def test_drop_oldest_drops_the_oldest_packet_without_telemetry():
+    queue = InboundQueue(2, DROP_OLDEST)
+    acks = [puback(1), puback(2), puback(3)]
+    for ack in acks:
+        queue.put(ack)
+    assert drain(queue) == acks[1:]
+    assert queue.drops == {'PUBACK': 1}
+
+
+def test_drop_newest_drops_arriving_telemetry():
+    queue = InboundQueue(2, DROP_NEWEST)
+    packets = [telemetry(1), telemetry(2)]
+    for packet in packets:
+        queue.put(packet)
+    assert not queue.put(telemetry(3))
+    assert drain(queue) == packets
+    assert queue.topic_drops == {topic_key(telemetry(3)): 1}
+
+
+def test_acks_and_qos_1_messages_push_telemetry_out():
+    queue = InboundQueue(2, DROP_NEWEST)
+    queue.put(telemetry(1))
+    queue.put(telemetry(2))
+    ack, message = puback(1), telemetry(3, qos=1)
+    assert not queue.put(ack)
+    assert not queue.put(message)
+    assert drain(queue) == [ack, message]
+    assert queue.drops == {'PUBLISH': 2}
+
+
+def test_block_waits_for_room():
+    queue = InboundQueue(1, BLOCK)
+    queue.put(telemetry(1))
+    added = threading.Event()
+    thread = threading.Thread(
+        target=lambda: queue.put(telemetry(2)) and added.set()
+    )
+    thread.start()
+    assert not added.wait(0.1)
+    assert queue.get(0)[0].topic_id == 1
+    assert added.wait(5)
+    assert queue.get(0)[0].topic_id == 2
+    assert not queue.drops
+
+
+def test_close_wakes_readers():
+    queue = InboundQueue(1, BLOCK)
+    thread = threading.Thread(target=queue.get)
+    thread.start()
+    queue.close()
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_unknown_policy():
+    with pytest.raises(Exception):
+        InboundQueue(1, 'drop-random')
@@ -0,0 +1,199 @@
+import pytest
+
+from mqttsn.lib import (  # noqa: F401, registers every packet class
+    advertises, connects, disconnects, gw, ping, publishes, registers,
+    subscribes, unsubscribes, will
+)
+from mqttsn.lib.flags import Flags
+from mqttsn.lib.message_headers import MessageHeaders
+from mqttsn.lib.names import TOPIC_NORMAL, TOPIC_PREDEFINED, packet_names
+from mqttsn.lib.objects import decode, get_objects
+
+SHORT = b'sensors/1/temp'
+# names are utf-8, and this one needs the 3 octet length
+LONG = 'sensors/température/'.encode('utf-8') * 20
+
+
+def flags(**fields):
+    value = Flags()
+    for name, field in fields.items():
+        setattr(value, name, field)
+    return value
+
+
+def with_fields(packet_class, **fields):
+    packet = packet_class()
+    for name, value in fields.items():
+        setattr(packet, name, value)
+    return packet
+
+
+# msg_type -> packet with every field set, given the variable length tail
+SAMPLES = {
+    'ADVERTISE': lambda tail: with_fields(
+        advertises.Advertises, gw_id=7, duration=900),
+    'SEARCHGW': lambda tail: with_fields(gw.SearchGWs, radius=3),
+    'GWINFO': lambda tail: with_fields(gw.GWInfos, gw_id=7, gw_add=tail),
+    'CONNECT': lambda tail: with_fields(
+        connects.Connects, flags=flags(will=True, clean_session=False),
+        duration=60, client_id=tail),
+    'CONNACK': lambda tail: with_fields(connects.Connacks, return_code=3),
+    'WILLTOPICREQ': lambda tail: will.WillTopicReqs(),
+    'WILLTOPIC': lambda tail: with_fields(
+        will.WillTopics, flags=flags(qos=1, retain=True), will_topic=tail),
+    'WILLMSGREQ': lambda tail: will.WillMsgReqs(),
+    'WILLMSG': lambda tail: with_fields(will.WillMsgs, will_msg=tail),
+    'REGISTER': lambda tail: with_fields(
+        registers.Registers, topic_id=513, msg_id=65535, topic_name=tail),
+    'REGACK': lambda tail: with_fields(
+        registers.Regacks, topic_id=513, msg_id=2, return_code=2),
+    'PUBLISH': lambda tail: with_fields(
+        publishes.Publishes, flags=flags(dup=True, qos=2, retain=True),
+        topic_id=258, msg_id=4097, data=tail),
+    'PUBACK': lambda tail: with_fields(
+        publishes.Pubacks, topic_id=258, msg_id=4097, return_code=1),
+    'PUBCOMP': lambda tail: with_fields(publishes.Pubcomps, msg_id=4097),
+    'PUBREC': lambda tail: with_fields(publishes.Pubrecs, msg_id=4097),
+    'PUBREL': lambda tail: with_fields(publishes.Pubrels, msg_id=4097),
+    'SUBSCRIBE': lambda tail: with_fields(
+        subscribes.Subscribes,
+        flags=flags(qos=1, topic_id_type=TOPIC_NORMAL), msg_id=9,
+        topic_name=tail),
+    'SUBACK': lambda tail: with_fields(
+        subscribes.Subacks, flags=flags(qos=1), topic_id=258, msg_id=9,
+        return_code=0),
+    'UNSUBSCRIBE': lambda tail: with_fields(
+        unsubscribes.Unsubscribes,
+        flags=flags(topic_id_type=TOPIC_PREDEFINED), msg_id=9,
+        topic_id=258),
+    'UNSUBACK': lambda tail: with_fields(unsubscribes.Unsubacks, msg_id=9),
+    'PINGREQ': lambda tail: with_fields(ping.Pingreqs, client_id=tail),
+    'PINGRESP': lambda tail: ping.Pingresps(),
+    'DISCONNECT': lambda tail: with_fields(
+        disconnects.Disconnects, duration=120),
+    'WILLTOPICUPD': lambda tail: with_fields(
+        will.WillTopicUpds, flags=flags(qos=2), will_topic=tail),
+    'WILLTOPICRESP': lambda tail: with_fields(
+        will.WillTopicResps, return_code=1),
+    'WILLMSGUPD': lambda tail: with_fields(will.WillMsgUpds, will_msg=tail),
+    'WILLMSGRESP': lambda tail: with_fields(
+        will.WillMsgResps, return_code=1),
+}
+
+
+def fields(packet):
+    """
+    Returns:
+        {slot: value} of packet, with names and payloads as bytes
+    """
+    values = {}
+    for cls in type(packet).__mro__:
+        for slot in getattr(cls, '__slots__', ()):
+            value = getattr(packet, slot.lstrip('_'))
+            if isinstance(value, str):
+                value = value.encode('utf-8')
+            elif isinstance(value, memoryview):
+                value = bytes(value)
+            elif isinstance(value, Flags):
+                value = int(value)
+            elif isinstance(value, MessageHeaders):
+                value = value.msg_type  # length is only set by unpack
+            values[slot] = value
+    return values
+
+
+def test_every_registered_type_has_a_sample():
+    registered = {
+        packet_names[msg_type] for msg_type, packet_class
+        in enumerate(get_objects()) if packet_class is not None
+    }
+    assert registered == set(SAMPLES)
+
+
+@pytest.mark.parametrize('name', sorted(SAMPLES))
+@pytest.mark.parametrize('tail', [SHORT, LONG], ids=['short', 'long'])
+def test_round_trip(name, tail):
+    packet = SAMPLES[name](tail)
+    datagram = packet.pack()
+    if datagram[0] == 1:
+        assert int.from_bytes(datagram[1:3], 'big') == len(datagram)
+        assert packet_names[datagram[3]] == name
+    else:
+        assert datagram[0] == len(datagram)
+        assert packet_names[datagram[1]] == name
+    # only the packets carrying tail need the long header for it
+    assert (datagram[0] == 1) == (tail is LONG and tail in datagram)
+
+    decoded = decode(datagram)
+    assert type(decoded) is type(packet)
+    assert fields(decoded) == fields(packet)
+    assert decoded.pack() == datagram
+    assert decode(bytearray(datagram)).pack() == datagram
+
+    buffer = bytearray(len(datagram) + 3)
+    assert packet.pack_into(buffer, 3) == len(datagram)
+    assert bytes(buffer[3:]) == datagram
+
+
+@pytest.mark.parametrize('data_length, header', [
+    (0, 2), (248, 2), (249, 4), (65535 - 4 - 5 - 1, 4)
+])
+def test_publish_header_boundary(data_length, header):
+    publish = SAMPLES['PUBLISH'](b'x' * data_length)
+    datagram = publish.pack()
+    assert len(datagram) == header + 5 + data_length
+    assert (datagram[0] == 1) == (header == 4)
+    assert bytes(decode(datagram).data) == b'x' * data_length
+
+
+def test_header_size_matches_encode_length():
+    header = MessageHeaders(0)
+    for bufferlen in range(65530):
+        header.length = 1
+        assert header.header_size(bufferlen) == \
+            len(header.encode_length(bufferlen)) + 1
+
+
+def test_too_long_a_packet():
+    with pytest.raises(Exception):
+        SAMPLES['PUBLISH'](b'x' * 65535).pack()
+
+
+def bit_fields(b0):
+    # how the flags octet was decoded before the lookup table
+    return {
+        'dup': ((b0 >> 7) & 0x01) == 1,
+        'qos': (b0 >> 5) & 0x03,
+        'retain': ((b0 >> 4) & 0x01) == 1,
+        'will': ((b0 >> 3) & 0x01) == 1,
+        'clean_session': ((b0 >> 2) & 0x01) == 1,
+        'topic_id_type': b0 & 0x03,
+    }
+
+
+@pytest.mark.parametrize('b0', range(256))
+def test_every_flags_octet(b0):
+    expected = bit_fields(b0)
+    unpacked = Flags(0)
+    assert unpacked.unpack(bytes([0xff, b0]), 1) == 1
+    assert {name: getattr(unpacked, name) for name in expected} == expected
+    assert int(unpacked) == b0 and unpacked.pack() == bytes([b0])
+
+    built = flags(**expected)
+    assert built == unpacked
+    shifts = {'dup': 7, 'qos': 5, 'retain': 4, 'will': 3,
+              'clean_session': 2, 'topic_id_type': 0}
+    assert built.pack() == bytes([sum(
+        int(expected[name]) << shift for name, shift in shifts.items()
+    )])
+
+
+def test_flags_setters_touch_only_their_bits():
+    value = Flags(0xff)
+    value.qos = 0
+    assert int(value) == 0x9f
+    value.topic_id_type = 2
+    assert int(value) == 0x9e
+    value.dup = False
+    assert int(value) == 0x1e
+    assert Flags().clean_session and int(Flags()) == 0x04
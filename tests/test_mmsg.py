@@ -0,0 +1,66 @@
+import socket
+
+from mqttsn import mmsg
+from mqttsn.transport import SocketTransport
+
+
+def pair(family, address):
+    receiver = socket.socket(family, socket.SOCK_DGRAM)
+    receiver.bind(address)
+    sender = socket.socket(family, socket.SOCK_DGRAM)
+    sender.bind(address)
+    sender.connect(receiver.getsockname())
+    return sender, receiver
+
+
+def received(receive, count):
+    datagrams = []
+    while len(datagrams) < count:
+        datagrams += receive()
+    return datagrams
+
+
+def test_udp_round_trip():
+    sender, sock = pair(socket.AF_INET, ('127.0.0.1', 0))
+    receiver = mmsg.BatchReceiver(8, 1024)
+    datagrams = [bytes([i]) * (i + 1) for i in range(20)]
+
+    assert mmsg.BatchSender(8).send_many(sender, datagrams) == 20
+    got = received(lambda: receiver.recv(sock), 20)
+    assert [datagram for datagram, _ in got] == datagrams
+    assert {address for _, address in got} == {sender.getsockname()}
+    sender.close()
+    sock.close()
+
+
+def test_send_buffer_sends_slices():
+    sender, sock = pair(socket.AF_INET, ('127.0.0.1', 0))
+    buffer = bytearray(b'aaabbcccc')
+    assert mmsg.send_buffer(sender, buffer, [0, 3, 5], [3, 2, 4]) == 3
+    assert [sock.recv(16) for _ in range(3)] == [b'aaa', b'bb', b'cccc']
+    assert mmsg.send_buffer(sender, bytes(buffer), [5], [4]) == 1
+    assert sock.recv(16) == b'cccc'
+    sender.close()
+    sock.close()
+
+
+def test_unix_addresses_and_truncation():
+    sender, sock = pair(socket.AF_UNIX, '')
+    receiver = mmsg.BatchReceiver(4, 8)
+    mmsg.send_many(sender, [b'short', b'too long for 8', b'fits'])
+    got = received(lambda: receiver.recv(sock), 2)
+    assert [datagram for datagram, _ in got] == [b'short', b'fits']
+    assert got[0][1] == sender.getsockname()
+    sender.close()
+    sock.close()
+
+
+def test_transport_recv_many():
+    sender, sock = pair(socket.AF_INET, ('127.0.0.1', 0))
+    transport = SocketTransport(sock, batch=16)
+    SocketTransport(sender).send_many([b'%d' % i for i in range(40)])
+    got = received(transport.recv_many, 40)
+    assert [datagram for datagram, _ in got] == \
+        [b'%d' % i for i in range(40)]
+    sender.close()
+    sock.close()
@@ -0,0 +1,125 @@
+import threading
+
+import pytest
+
+from mqttsn.msgids import MAX_MSG_ID, MsgIds, NoMsgIdsLeft
+
+
+def exhausted(**kwargs):
+    msg_ids = MsgIds(**kwargs)
+    msg_ids.allocate_many(MAX_MSG_ID)
+    return msg_ids
+
+
+def test_ids_are_allocated_in_sequence():
+    msg_ids = MsgIds()
+    assert [msg_ids.allocate() for _ in range(3)] == [1, 2, 3]
+    assert len(msg_ids) == 3 and 2 in msg_ids
+
+
+def test_allocation_wraps_around_past_65535():
+    msg_ids = MsgIds()
+    for _ in range(MAX_MSG_ID - 1):
+        msg_ids.release(msg_ids.allocate())
+    assert msg_ids.allocate() == MAX_MSG_ID
+    # 0 is never handed out, and released ids are reused
+    assert msg_ids.allocate() == 1
+
+
+def test_wraparound_skips_ids_in_use():
+    msg_ids = MsgIds()
+    held = msg_ids.allocate_many(3)
+    for _ in range(MAX_MSG_ID - 3):
+        msg_ids.release(msg_ids.allocate())
+    assert held == [1, 2, 3]
+    assert msg_ids.allocate() == 4
+
+
+def test_release_is_idempotent():
+    msg_ids = MsgIds()
+    msg_id = msg_ids.allocate()
+    msg_ids.release(msg_id)
+    msg_ids.release(msg_id)
+    msg_ids.release(0)
+    assert len(msg_ids) == 0
+
+
+def test_exhaustion_raises_without_blocking():
+    msg_ids = exhausted(block=False)
+    assert msg_ids.occupancy == 1
+    with pytest.raises(NoMsgIdsLeft):
+        msg_ids.allocate()
+    with pytest.raises(NoMsgIdsLeft):
+        msg_ids.allocate_many(1)
+
+
+def test_exhaustion_times_out_when_blocking():
+    msg_ids = exhausted(timeout=0.05)
+    with pytest.raises(NoMsgIdsLeft):
+        msg_ids.allocate()
+
+
+def test_blocked_allocate_gets_the_released_id():
+    msg_ids = exhausted(timeout=5)
+    allocated = []
+    thread = threading.Thread(
+        target=lambda: allocated.append(msg_ids.allocate())
+    )
+    thread.start()
+    msg_ids.release(1234)
+    thread.join(5)
+    assert allocated == [1234]
+
+
+def test_allocate_many_takes_distinct_free_ids():
+    msg_ids = MsgIds()
+    first = msg_ids.allocate_many(100)
+    msg_ids.release(first[10])
+    second = msg_ids.allocate_many(100)
+    assert len(set(first) | set(second)) == 200
+    assert len(msg_ids) == 199
+    assert first[10] not in second
+
+
+def test_allocate_many_waits_for_all_its_ids():
+    msg_ids = MsgIds(timeout=5)
+    msg_ids.allocate_many(MAX_MSG_ID - 1)
+    allocated = []
+    thread = threading.Thread(
+        target=lambda: allocated.extend(msg_ids.allocate_many(3))
+    )
+    thread.start()
+    msg_ids.release(10)
+    thread.join(0.1)
+    assert thread.is_alive()
+    msg_ids.release(20)
+    thread.join(5)
+    assert sorted(allocated) == [10, 20, MAX_MSG_ID]
+
+
+def test_release_wakes_the_waiter_that_can_proceed():
+    msg_ids = exhausted(timeout=5)
+    many, one = [], []
+    waiting_many = threading.Thread(
+        target=lambda: many.extend(msg_ids.allocate_many(3))
+    )
+    waiting_many.start()
+    waiting_many.join(0.1)
+    waiting_one = threading.Thread(
+        target=lambda: one.append(msg_ids.allocate())
+    )
+    waiting_one.start()
+    waiting_one.join(0.1)
+
+    msg_ids.release(10)
+    waiting_one.join(5)
+    assert one == [10]
+    for msg_id in [20, 30, 40]:
+        msg_ids.release(msg_id)
+    waiting_many.join(5)
+    assert sorted(many) == [20, 30, 40]
+
+
+def test_allocate_many_beyond_the_id_space():
+    with pytest.raises(NoMsgIdsLeft):
+        MsgIds().allocate_many(MAX_MSG_ID + 1)
@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+
+import pytest
+
+from mqttsn.client import Client, Callback
+from mqttsn.lib.names import PUBACK, PUBCOMP
+from mqttsn.lib.objects import decode
+from mqttsn.lib.publishes import Publishes, Pubrels
+from mqttsn.transport import LoopbackTransport
+
+pytest.importorskip('multiprocessing.shared_memory')
+
+
+def slow_loads(payload):
+    # top level, so that the worker processes can unpickle it
+    reading = json.loads(payload)
+    time.sleep(reading['delay'])
+    return reading
+
+
+class Decoded(Callback):
+    def __init__(self, events, expected):
+        super().__init__()
+        self.events = events
+        self.expected = expected
+        self.done = threading.Event()
+
+    def message_arrived(self, topic_name, payload, qos, retained, msg_id):
+        self.events.append(('arrived', msg_id, payload))
+        if sum(event[0] == 'arrived' for event in self.events) == \
+                self.expected:
+            self.done.set()
+        return True
+
+
+def publish(topic_id, sequence, delay, qos, msg_id):
+    packet = Publishes()
+    packet.flags.qos = qos
+    packet.topic_id = topic_id
+    packet.msg_id = msg_id
+    packet.data = json.dumps({
+        'topic': topic_id, 'sequence': sequence, 'delay': delay
+    }).encode('utf-8')
+    return packet.pack()
+
+
+def test_decoded_in_order_and_acknowledged_after_decoding():
+    events = []
+    client_end, gateway_end = LoopbackTransport.pair()
+    send = client_end.send
+
+    def recording_send(data):
+        packet = decode(data)
+        if packet.mh.msg_type in [PUBACK, PUBCOMP]:
+            events.append(('ack', packet.msg_id))
+        return send(data)
+
+    client_end.send = recording_send
+    callback = Decoded(events, expected=12)
+    client = Client('offload', transport=client_end,
+                    payload_decoder=slow_loads, decode_workers=3)
+    client.register_callback(callback)
+    client.start_receiver()
+    try:
+        # earlier payloads take longer to decode
+        for sequence in range(12):
+            topic_id, msg_id = sequence % 2 + 1, sequence + 1
+            qos = 2 if sequence % 3 == 0 else 1
+            gateway_end.send(publish(
+                topic_id, sequence, (12 - sequence) / 200, qos, msg_id
+            ))
+            if qos == 2:
+                pubrel = Pubrels()
+                pubrel.msg_id = msg_id
+                gateway_end.send(pubrel.pack())
+        # not decodable, so neither delivered nor acknowledged
+        undecodable = Publishes()
+        undecodable.flags.qos = 1
+        undecodable.topic_id = 1
+        undecodable.msg_id = 99
+        undecodable.data = b'not json'
+        gateway_end.send(undecodable.pack())
+        assert callback.done.wait(30)
+        time.sleep(0.2)
+    finally:
+        client.stop()
+
+    arrived = [event[2] for event in events if event[0] == 'arrived']
+    assert [reading['sequence'] for reading in arrived] == list(range(12))
+    for topic_id in [1, 2]:
+        sequences = [reading['sequence'] for reading in arrived
+                     if reading['topic'] == topic_id]
+        assert sequences == sorted(sequences)
+
+    acks = [event[1] for event in events if event[0] == 'ack']
+    assert sorted(acks) == list(range(1, 13))
+    for msg_id in acks:
+        assert events.index(('ack', msg_id)) > next(
+            index for index, event in enumerate(events)
+            if event[0] == 'arrived' and event[1] == msg_id
+        )
@@ -0,0 +1,110 @@
+import pytest
+
+from mqttsn.predefined import (
+    HEADER, MAGIC, PredefinedTopics, compile_catalogue, load_csv, load_yaml,
+    main
+)
+
+TOPICS = {
+    'fleet/sensor/1/temp': 1,
+    'fleet/sensor/2/temp': 2,
+    'fleet/capteur/é/température': 300,
+    'x': 65534,
+}
+
+
+@pytest.fixture
+def catalogue(tmp_path):
+    path = str(tmp_path / 'topics.bin')
+    compile_catalogue(TOPICS, path)
+    return path
+
+
+def test_round_trip(catalogue):
+    with PredefinedTopics(catalogue) as topics:
+        assert len(topics) == len(TOPICS)
+        for topic_name, topic_id in TOPICS.items():
+            assert topics.topic_id(topic_name) == topic_id
+            assert topics.topic_id(topic_name.encode('utf-8')) == topic_id
+            assert topics.name(topic_id) == topic_name.encode('utf-8')
+            assert topic_name in topics
+        assert topics.topic_id('fleet/sensor/3/temp') is None
+        assert topics.name(3) is None
+
+
+def test_round_trip_of_many_topics(tmp_path):
+    path = str(tmp_path / 'topics.bin')
+    topics = {f'site/{i}/reading': i + 1 for i in range(5000)}
+    compile_catalogue(topics, path)
+    with PredefinedTopics(path) as catalogue:
+        assert all(
+            catalogue.topic_id(topic_name) == topic_id and
+            catalogue.name(topic_id) == topic_name.encode('utf-8')
+            for topic_name, topic_id in topics.items()
+        )
+
+
+def test_empty_catalogue(tmp_path):
+    path = str(tmp_path / 'topics.bin')
+    compile_catalogue({}, path)
+    with PredefinedTopics(path) as topics:
+        assert len(topics) == 0
+        assert topics.topic_id('anything') is None
+
+
+def test_load_csv_and_yaml(tmp_path):
+    csv = tmp_path / 'topics.csv'
+    csv.write_text('topic_id,topic_name\n# comment\n1, a/b\n\n2,c/d\n')
+    assert load_csv(str(csv)) == {'a/b': 1, 'c/d': 2}
+    yaml = tmp_path / 'topics.yaml'
+    yaml.write_text('a/b: 1\nc/d: 2\n')
+    assert load_yaml(str(yaml)) == {'a/b': 1, 'c/d': 2}
+
+
+@pytest.mark.parametrize('rows', [
+    '1,a/b\n1,c/d\n',  # id twice
+    '1,a/b\n2,a/b\n',  # name twice
+    '65535,a/b\n',  # out of range
+    '1,a/b\nx,c/d\n',  # not an id
+    '1\n',  # no name
+])
+def test_invalid_csv(tmp_path, rows):
+    csv = tmp_path / 'topics.csv'
+    csv.write_text(rows)
+    with pytest.raises(Exception):
+        compile_catalogue(load_csv(str(csv)), str(tmp_path / 'topics.bin'))
+
+
+def test_main(tmp_path, capsys):
+    csv = tmp_path / 'topics.csv'
+    csv.write_text('7,a/b\n')
+    path = str(tmp_path / 'topics.bin')
+    main([str(csv), path])
+    assert '1 topics' in capsys.readouterr().out
+    with PredefinedTopics(path) as topics:
+        assert topics.topic_id('a/b') == 7
+
+
+def corrupt(catalogue, edit):
+    with open(catalogue, 'rb') as source:
+        data = bytearray(source.read())
+    with open(catalogue, 'wb') as target:
+        target.write(edit(data))
+
+
+@pytest.mark.parametrize('edit', [
+    lambda data: b'',
+    lambda data: data[:HEADER.size],
+    lambda data: b'NOTACATL' + data[8:],
+    lambda data: data[:-len(data) // 2],
+    lambda data: HEADER.pack(MAGIC, 4, 3) + data[HEADER.size:],
+    lambda data: HEADER.pack(MAGIC, 5, 8) + data[HEADER.size:],
+    lambda data: HEADER.pack(MAGIC, 4, 1 << 20) + data[HEADER.size:],
+], ids=[
+    'empty', 'header only', 'magic', 'truncated', 'buckets not a power of '
+    'two', 'more topics than buckets', 'buckets past the end'
+])
+def test_corrupt_catalogue(catalogue, edit):
+    corrupt(catalogue, edit)
+    with pytest.raises(Exception, match='catalogue|corrupt'):
+        PredefinedTopics(catalogue)
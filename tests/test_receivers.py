@@ -0,0 +1,52 @@
+import threading
+
+from mqttsn.client import Client, Callback
+from mqttsn.internal import Receivers
+from mqttsn.lib.names import SUBACK
+from mqttsn.lib.objects import decode
+from mqttsn.lib.subscribes import Subacks
+from mqttsn.transport import LoopbackTransport
+
+
+class Published(Callback):
+    def __init__(self):
+        super().__init__()
+        self.acked = threading.Event()
+
+    def published(self, msg_id):
+        self.acked.set()
+
+
+def test_stray_suback_is_dropped():
+    transport, _ = LoopbackTransport.pair()
+    receiver = Receivers(transport)
+    suback = Subacks()
+    suback.msg_id = 7
+
+    receiver.process(decode(suback.pack()), None)
+    future = receiver.lookfor(SUBACK, 7)
+    receiver.process(decode(suback.pack()), None)
+    assert future.result(0).msg_id == 7
+    receiver.correlations.discard(SUBACK, 7)
+    receiver.process(decode(suback.pack()), None)
+    assert len(receiver.correlations) == 0
+
+
+def test_duplicated_acks_keep_the_receiver_running(gateway):
+    gateway.repeat = 2
+    callback = Published()
+    client = Client('dup', host=gateway.host, port=gateway.port)
+    client.register_callback(callback)
+    client.connect()
+    try:
+        topics = [f'sensors/{i}/temp' for i in range(20)]
+        acks = client.subscribe_many(topics, qos=1)
+        assert all(ack is not None for ack in acks.values())
+        acks = client.register_many(topics)
+        assert all(ack is not None for ack in acks.values())
+
+        # the receiver thread still handles what arrives afterwards
+        client.publish(topics[0], b'21.5', qos=1)
+        assert callback.acked.wait(5)
+    finally:
+        client.stop()
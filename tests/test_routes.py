@@ -0,0 +1,82 @@
+import pytest
+
+from mqttsn.routes import TopicRouter
+
+
+def names(router, topic_name, key=None):
+    return [handler.__name__ for handler in router.match(topic_name, key)]
+
+
+def handler(name):
+    def handle(*args):
+        return True
+    handle.__name__ = name
+    return handle
+
+
+@pytest.fixture
+def router():
+    router = TopicRouter()
+    for topic_filter in [
+        'sensors/1/temp', 'sensors/+/temp', 'sensors/#', '+/+/+', '#',
+        'sensors/+', '+/1/#', '$SYS/#', '$SYS/+/load'
+    ]:
+        router.add(topic_filter, handler(topic_filter))
+    return router
+
+
+@pytest.mark.parametrize('topic_name, matched', [
+    ('sensors/1/temp', ['sensors/1/temp', 'sensors/+/temp', 'sensors/#',
+                        '+/+/+', '#', '+/1/#']),
+    ('sensors/2/temp', ['sensors/+/temp', 'sensors/#', '+/+/+', '#']),
+    ('sensors/2', ['sensors/#', '#', 'sensors/+']),
+    # # matches its parent level too
+    ('sensors', ['sensors/#', '#']),
+    ('lights/1', ['#', '+/1/#']),
+    ('lights/1/on/off', ['#', '+/1/#']),
+    # + matches an empty level
+    ('sensors//temp', ['sensors/+/temp', 'sensors/#', '+/+/+', '#']),
+    # wildcards do not match the first level of $ topics
+    ('$SYS/broker/load', ['$SYS/#', '$SYS/+/load']),
+    ('$SYS', ['$SYS/#']),
+])
+def test_match(router, topic_name, matched):
+    assert names(router, topic_name) == matched
+    assert names(router, topic_name.encode('utf-8')) == matched
+
+
+def test_handlers_of_a_filter_run_in_the_order_added():
+    router = TopicRouter()
+    router.add('a/#', handler('first'))
+    router.add('a/b', handler('second'))
+    router.add('a/#', handler('third'))
+    assert names(router, 'a/b') == ['first', 'second', 'third']
+
+
+def test_cached_matches_follow_changes():
+    router = TopicRouter()
+    temperature = handler('temperature')
+    router.add('sensors/+/temp', temperature)
+    assert names(router, 'sensors/1/temp', key=1) == ['temperature']
+
+    router.add('sensors/#', handler('all'))
+    assert names(router, 'sensors/1/temp', key=1) == ['temperature', 'all']
+    router.remove('sensors/+/temp', temperature)
+    assert names(router, 'sensors/1/temp', key=1) == ['all']
+    router.remove('sensors/#')
+    assert names(router, 'sensors/1/temp', key=1) == []
+    assert len(router) == 0
+
+
+def test_remove_unknown_filter():
+    router = TopicRouter()
+    router.add('a/b', handler('kept'))
+    router.remove('a/c')
+    router.remove('a/b', handler('other'))
+    assert names(router, 'a/b') == ['kept'] and len(router) == 1
+
+
+@pytest.mark.parametrize('topic_filter', ['a/#/b', 'a/b#', 'a+/b', '#/'])
+def test_invalid_filters(topic_filter):
+    with pytest.raises(Exception):
+        TopicRouter().add(topic_filter, handler('invalid'))
@@ -0,0 +1,93 @@
+import time
+
+from mqttsn.client import Client, Callback
+from mqttsn.lib.names import PUBLISH, REGISTER
+from mqttsn.lib.publishes import Publishes, Pubrels
+from mqttsn.lib.registers import Registers
+from mqttsn.topics import TopicRegistry
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_registry_maps_both_ways():
+    topics = TopicRegistry()
+    topics.add(1, 'sensors/1/temp')
+    topics.add(2, b'sensors/2/temp')
+    assert topics.topic_id('sensors/2/temp') == 2
+    assert topics.name(1) == b'sensors/1/temp'
+    # the gateway reassigning an id forgets the old name
+    topics.add(1, 'sensors/3/temp')
+    assert 'sensors/1/temp' not in topics and len(topics) == 2
+    topics.clear()
+    assert topics.name(2) is None and len(topics) == 0
+
+
+def test_publish_by_name_registers_once(gateway):
+    client = Client('names', host=gateway.host, port=gateway.port)
+    client.register_callback(Callback())
+    client.connect()
+    try:
+        for qos in [0, 1, 0, 1]:
+            client.publish('sensors/1/temp', b'21.5', qos=qos)
+        assert wait_until(lambda: gateway.received[PUBLISH] == 4)
+        assert gateway.received[REGISTER] == 1
+        assert client.topics.topic_id('sensors/1/temp') == \
+            gateway.topics[b'sensors/1/temp']
+    finally:
+        client.stop()
+
+
+class Arrived(Callback):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def message_arrived(self, topic_name, payload, qos, retained, msg_id):
+        self.messages.append((topic_name, qos))
+        return True
+
+
+def test_inbound_topic_ids_resolve_to_str_at_every_qos(gateway):
+    routed = []
+
+    def handler(topic_name, payload, qos, retained, msg_id):
+        routed.append((topic_name, qos))
+        return True
+
+    callback = Arrived()
+    client = Client('names', host=gateway.host, port=gateway.port)
+    client.register_callback(callback)
+    client.on('gw/+', handler)
+    client.connect()
+    try:
+        address = client.transport.local_address
+        for topic_id, topic_name in [(5, 'gw/topic'), (6, 'other/topic')]:
+            register = Registers()
+            register.topic_id = topic_id
+            register.msg_id = topic_id
+            register.topic_name = topic_name
+            gateway.sock.sendto(register.pack(), address)
+        msg_ids = iter(range(10, 100))
+        for qos in [0, 1, 2]:
+            for topic_id in [5, 6]:
+                publish = Publishes()
+                publish.flags.qos = qos
+                publish.topic_id = topic_id
+                publish.msg_id = next(msg_ids) if qos else 0
+                publish.data = b'21.5'
+                gateway.sock.sendto(publish.pack(), address)
+                if qos == 2:
+                    pubrel = Pubrels()
+                    pubrel.msg_id = publish.msg_id
+                    gateway.sock.sendto(pubrel.pack(), address)
+
+        assert wait_until(lambda: len(routed) + len(callback.messages) == 6)
+        assert routed == [('gw/topic', qos) for qos in [0, 1, 2]]
+        assert callback.messages == [('other/topic', qos) for qos in [0, 1, 2]]
+    finally:
+        client.stop()